@@ -90,9 +90,23 @@ CLICKHOUSE_LOCAL_CONFIG = {
     # No default database, or default to default
 }
 
+# ClickHouse connection (Legacy claude/maicro host, read by the backfills)
+CLICKHOUSE_LEGACY_CONFIG = {
+    "host": os.getenv("CLICKHOUSE_LEGACY_HOST", "localhost"),
+    "user": os.getenv("CLICKHOUSE_LEGACY_USER", "claude"),
+    "password": get_secret("CLICKHOUSE_LEGACY_PASSWORD", ""),
+}
+
 # Default to Local for monitors
 CLICKHOUSE_CONFIG = CLICKHOUSE_LOCAL_CONFIG
 
+# Named ClickHouse targets served by modules.clickhouse_client's connection pools
+CLICKHOUSE_TARGETS = {
+    "local": CLICKHOUSE_LOCAL_CONFIG,
+    "remote": CLICKHOUSE_REMOTE_CONFIG,
+    "legacy": CLICKHOUSE_LEGACY_CONFIG,
+}
+
 # Default table candidates used by the dashboards (first existing table wins)
 TABLE_CANDIDATES = {
     "prices": ["maicro_monitors.candles", "market_data.candles_1m", "market_data.candles_1h"],
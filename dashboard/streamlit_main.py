@@ -21,7 +21,9 @@ if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
 from config.settings import HYPERLIQUID_ADDRESS, TABLE_CANDIDATES
-from modules.clickhouse_client import first_existing, query_df, table_exists
+from modules.clickhouse_client import connection, first_existing, query_df, table_exists
+from modules.query_cache import cached_query_df
+from modules.schema_registry import get_registry
 
 # Set page config with mobile-friendly settings
 st.set_page_config(
@@ -196,12 +198,8 @@ def parse_margin_summary(raw):
 
 @st.cache_data(ttl=60)
 def _get_ts_column(full_table: str) -> Optional[str]:
-    db, table = full_table.split(".", 1)
-    sql = (
-        "SELECT name FROM system.columns "
-        "WHERE database = %(db)s AND table = %(table)s"
-    )
-    df = query_df(sql, {"db": db, "table": table})
+    with connection() as client:
+        names = [name for name, _ in get_registry().columns(client, "local", full_table)]
     preferred = [
         "trade_time",
         "order_time",
@@ -211,11 +209,11 @@ def _get_ts_column(full_table: str) -> Optional[str]:
         "snapshot_time",
         "date",
     ]
-    cols = [c.lower() for c in df["name"].tolist()]
+    cols = [c.lower() for c in names]
     for p in preferred:
         if p.lower() in cols:
-            return df.loc[cols.index(p.lower()), "name"]
-    return df["name"].iloc[0] if not df.empty else None
+            return names[cols.index(p.lower())]
+    return names[0] if names else None
 
 
 def _pick_table(kind: str) -> Optional[str]:
@@ -350,7 +348,7 @@ def load_model_backtest_data(lookback_days: int = 180):
     end_str = end_date.isoformat()
 
     # Load earliest target per (date, symbol) with finite, non-zero weight
-    targets = query_df(
+    targets = cached_query_df(
         """
         SELECT date, symbol, weight, pred_ret, inserted_at
         FROM (
@@ -364,6 +362,7 @@ def load_model_backtest_data(lookback_days: int = 180):
         ORDER BY date, symbol
         """,
         params={"start": start_str, "end": end_str},
+        columnar=True,
     )
     if targets.empty:
         return {
@@ -402,7 +401,7 @@ def load_model_backtest_data(lookback_days: int = 180):
     # Load daily closes from candles (interval='1d')
     # Start a few days earlier to be safe for return calculation.
     start_ts = (first_date - pd.Timedelta(days=3)).strftime("%Y-%m-%d 00:00:00")
-    prices_raw = query_df(
+    prices_raw = cached_query_df(
         """
         SELECT toDate(ts) AS date, coin, close
         FROM maicro_monitors.candles
@@ -411,6 +410,7 @@ def load_model_backtest_data(lookback_days: int = 180):
         ORDER BY date, coin
         """,
         params={"start_ts": start_ts},
+        columnar=True,
     )
     if prices_raw.empty:
         return {
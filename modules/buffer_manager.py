@@ -1,77 +1,356 @@
 import os
 import glob
+import hashlib
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
 import pandas as pd
-from datetime import datetime
-from modules.clickhouse_client import insert_df
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from datetime import datetime, timedelta
+from modules.buffer_manifest import BufferManifest
+from modules.buffer_schemas import conform
+from modules.clickhouse_client import insert_columns
+
+# Row group size for compacted files: a few large groups per partition
+# instead of one tiny file per save.
+BUFFER_ROW_GROUP_ROWS = int(os.getenv("HL_BUFFER_ROW_GROUP_ROWS", "131072"))
+# Hour partitions are left alone until this long after the hour ends, so an
+# hour the ping is still appending to gets compacted once, not every run.
+COMPACT_SETTLE_S = float(os.getenv("HL_BUFFER_COMPACT_SETTLE_S", "300"))
+# Rows per flush insert; memory stays bounded by one chunk however large the backlog.
+FLUSH_CHUNK_ROWS = int(os.getenv("HL_FLUSH_CHUNK_ROWS", "100000"))
+# Leftover temp files (writer crashed before the rename) older than this are removed.
+STALE_TMP_S = 3600.0
+
+# Event-time columns used for the manifest's min/max timestamps, first match wins.
+TIME_COLUMNS = ("time", "timestamp", "ts", "updated_at")
+
+MANIFEST_NAME = "manifest.sqlite"
+
+
+def time_column(schema: pa.Schema) -> Optional[str]:
+    """The first timestamp column in TIME_COLUMNS, if any."""
+    for col in TIME_COLUMNS:
+        if col in schema.names and pa.types.is_timestamp(schema.field(col).type):
+            return col
+    return None
+
+
+def time_bounds(table: pa.Table) -> Tuple[Optional[int], Optional[int]]:
+    """Min/max of the table's time column (see `time_column`), as epoch ms."""
+    col = time_column(table.schema)
+    if col is None:
+        return None, None
+    bounds = pc.min_max(pc.cast(table.column(col), pa.timestamp("ms"), safe=False).cast(pa.int64()))
+    return bounds["min"].as_py(), bounds["max"].as_py()
+
 
 class BufferManager:
-    def __init__(self, buffer_dir_name='buffer'):
-        # Buffer dir is relative to the script execution or absolute? 
+    """Append-only parquet buffer partitioned as `<prefix>/date=YYYY-MM-DD/hour=HH/`.
+
+    Every save writes a temp file, renames it into the current hour's
+    partition and registers it in the manifest (`manifest.sqlite`, see
+    BufferManifest). Flush and compaction claim exact file sets from the
+    manifest instead of globbing the directory, so they can run while the
+    ping keeps saving. `compact` merges settled partitions into one file
+    with large row groups. Rows are cast to the prefix's schema
+    (`buffer_schemas.BUFFER_SCHEMAS`) on save, so every file of a prefix has
+    the same column types.
+    """
+
+    def __init__(self, buffer_dir_name='buffer', buffer_dir=None):
+        # Buffer dir is relative to the script execution or absolute?
         # Let's make it relative to the project root/data/buffer to be centralized
         # Or keep it decentralized. Centralized is better for an orchestrator.
+        # An explicit buffer_dir (e.g. a cassette replay) overrides it.
         self.project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.buffer_dir = os.path.join(self.project_root, 'data', 'buffer')
-        
-    def save(self, df: pd.DataFrame, prefix: str):
-        if df.empty:
+        self.buffer_dir = buffer_dir or os.path.join(self.project_root, 'data', 'buffer')
+        manifest_path = os.path.join(self.buffer_dir, MANIFEST_NAME)
+        is_new = not os.path.exists(manifest_path)
+        self.manifest = BufferManifest(manifest_path)
+        if is_new and os.path.isdir(self.buffer_dir):
+            # First run with a manifest: adopt whatever is already buffered.
+            self.reconcile()
+
+    def partition_dir(self, prefix: str, ts: datetime) -> str:
+        return os.path.join(self.buffer_dir, prefix, f"date={ts:%Y-%m-%d}", f"hour={ts:%H}")
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(path, self.buffer_dir)
+
+    def _abs(self, rel: str) -> str:
+        return os.path.join(self.buffer_dir, rel)
+
+    def save(self, data: Union[pd.DataFrame, pa.Table], prefix: str):
+        if len(data) == 0:
             return
-        
-        if not os.path.exists(self.buffer_dir):
-            os.makedirs(self.buffer_dir)
-        
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        filename = f"{prefix}_{timestamp_str}.parquet"
-        filepath = os.path.join(self.buffer_dir, filename)
-        
-        # Ensure consistent types if needed, but parquet is usually good
-        df.to_parquet(filepath)
-        print(f"[{prefix}] Buffered {len(df)} rows to {filename}")
 
-    def flush(self, prefix: str, table_name: str):
+        now = datetime.now()
+        partition = self.partition_dir(prefix, now)
+        os.makedirs(partition, exist_ok=True)
+
+        # Short random suffix: concurrent pings can save the same prefix
+        # within the same microsecond.
+        timestamp_str = now.strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"{prefix}_{timestamp_str}_{uuid.uuid4().hex[:8]}.parquet"
+        filepath = os.path.join(partition, filename)
+
+        # Write under a dot-name and rename, so readers never see a partial file.
+        tmp = os.path.join(partition, f".{filename}.tmp")
+        table = conform(data, prefix)
+        pq.write_table(table, tmp)
+        os.replace(tmp, filepath)
+        min_ts, max_ts = time_bounds(table)
+        self.manifest.register(self._rel(filepath), prefix, table.num_rows, os.path.getsize(filepath), min_ts, max_ts)
+        print(f"[{prefix}] Buffered {table.num_rows} rows to {filename}")
+
+    def reconcile(self) -> int:
+        """Register files on disk missing from the manifest; drop stale temp files.
+
+        Covers legacy flat files and saves that crashed between rename and
+        register. Returns the number of files adopted.
         """
-        Reads all parquet files matching the prefix, concatenates them, 
-        and inserts into ClickHouse. Deletes files on success.
+        known = self.manifest.paths()
+        adopted = 0
+        for root, _, names in os.walk(self.buffer_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.endswith(".tmp"):
+                    try:
+                        if time.time() - os.path.getmtime(path) > STALE_TMP_S:
+                            os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                if not name.endswith(".parquet") or self._rel(path) in known:
+                    continue
+                rel = self._rel(path)
+                prefix = rel.split(os.sep, 1)[0] if os.sep in rel else name.split("_", 1)[0]
+                try:
+                    rows = pq.ParquetFile(path).metadata.num_rows
+                except Exception as e:
+                    print(f"[{prefix}] Not adopting unreadable {path}: {e}")
+                    continue
+                self.manifest.register(rel, prefix, rows, os.path.getsize(path))
+                adopted += 1
+        if adopted:
+            print(f"[buffer] Adopted {adopted} unindexed files into the manifest.")
+        return adopted
+
+    def claim(self, prefix: str, owner: str, path_prefix: Optional[str] = None) -> List[str]:
+        """Claim the prefix's unclaimed files; returns absolute paths that still exist."""
+        entries = self.manifest.claim(prefix, owner, path_prefix)
+        files, missing = [], []
+        for e in entries:
+            path = self._abs(e["path"])
+            (files if os.path.exists(path) else missing).append(path)
+        if missing:
+            self.manifest.forget(self._rel(p) for p in missing)
+        return files
+
+    def release(self, owner: str) -> None:
+        self.manifest.release(owner)
+
+    def compact(self, prefix: str, settle_s: float = COMPACT_SETTLE_S) -> int:
+        """Merge each settled hour partition of `prefix` into a single file.
+
+        Files claimed by a running flush are left alone. Returns the number of
+        small files merged away.
         """
-        pattern = os.path.join(self.buffer_dir, f"{prefix}_*.parquet")
-        files = sorted(glob.glob(pattern))
-        
-        if not files:
-            return
+        merged = 0
+        cutoff = datetime.now() - timedelta(seconds=settle_s)
+        owner = f"compact-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        for hour_dir in sorted(glob.glob(os.path.join(self.buffer_dir, prefix, "date=*", "hour=*"))):
+            date_part = os.path.basename(os.path.dirname(hour_dir))[len("date="):]
+            hour_part = os.path.basename(hour_dir)[len("hour="):]
+            try:
+                hour_end = datetime.strptime(f"{date_part} {hour_part}", "%Y-%m-%d %H") + timedelta(hours=1)
+            except ValueError:
+                continue
+            if hour_end > cutoff:
+                continue
+
+            files = self.claim(prefix, owner, path_prefix=self._rel(hour_dir) + os.sep)
+            try:
+                # Partly flushed files (to any target) keep their checkpoint; leave them as they are.
+                touched = self.manifest.touched(self._rel(f) for f in files)
+                files = [f for f in files if self._rel(f) not in touched]
+                if len(files) < 2:
+                    continue
+                table, readable = self.read(prefix, files)
+                if len(readable) < 2:
+                    continue
+
+                out = os.path.join(
+                    hour_dir, f"{prefix}_{date_part.replace('-', '')}_{hour_part}_compacted_{uuid.uuid4().hex[:8]}.parquet"
+                )
+                tmp = os.path.join(hour_dir, f".{os.path.basename(out)}.tmp")
+                pq.write_table(table, tmp, row_group_size=BUFFER_ROW_GROUP_ROWS)
+                os.replace(tmp, out)
+                # Inputs go before the manifest swap: a crash in between leaves
+                # only the (complete) output on disk for reconcile to adopt.
+                for f in readable:
+                    try:
+                        os.remove(f)
+                    except OSError as e:
+                        print(f"[{prefix}] Error deleting {f}: {e}")
+                min_ts, max_ts = time_bounds(table)
+                self.manifest.replace(
+                    [self._rel(f) for f in readable], self._rel(out), prefix,
+                    table.num_rows, os.path.getsize(out), min_ts, max_ts,
+                )
+                merged += len(readable)
+                print(f"[{prefix}] Compacted {len(readable)} files ({table.num_rows} rows) in {hour_dir}")
+            finally:
+                self.release(owner)
+        return merged
+
+    def read(self, prefix: str, files: List[str]) -> Tuple[pa.Table, List[str]]:
+        """Read files into one Arrow table; unreadable files are skipped.
+
+        Files written before the typed schemas are cast on the way in.
 
-        print(f"[{prefix}] Found {len(files)} buffered files. Attempting to flush...")
-        
-        dfs = []
-        valid_files = []
+        Returns the table (None if nothing was readable) and the files it came from.
+        """
+        tables, valid_files = [], []
         for f in files:
             try:
-                dfs.append(pd.read_parquet(f))
+                tables.append(conform(pq.read_table(f), prefix))
                 valid_files.append(f)
             except Exception as e:
                 print(f"[{prefix}] Error reading {f}: {e}")
-                continue
-                
-        if not dfs:
+        if not tables:
+            return None, []
+        return pa.concat_tables(tables, promote_options="permissive"), valid_files
+
+    def iter_chunks(self, prefix: str, files: List[str], chunk_rows: int = FLUSH_CHUNK_ROWS,
+                    target: Optional[str] = None) -> Iterator[Tuple[pa.Table, Dict[str, Tuple[int, int]]]]:
+        """Stream claimed files as tables of at most `chunk_rows` rows.
+
+        Rows already delivered (per the manifest checkpoint, of `target` if
+        given, else of all targets) are skipped. Each
+        chunk comes with its spans, {path: (rows consumed up to, file rows)},
+        to pass to `checkpoint` once the chunk has been inserted. Batches are
+        already in the prefix's schema except in files written before it, which
+        are cast here.
+        """
+        progress = self.manifest.progress((self._rel(f) for f in files), target)
+        pending: List[pa.Table] = []
+        pending_rows = 0
+        spans: Dict[str, Tuple[int, int]] = {}
+        for f in files:
+            total, delivered = progress.get(self._rel(f), (None, 0))
+            try:
+                pf = pq.ParquetFile(f)
+                total = pf.metadata.num_rows if total is None else total
+                offset = 0
+                for batch in pf.iter_batches(batch_size=chunk_rows):
+                    start, offset = offset, offset + batch.num_rows
+                    if offset <= delivered:
+                        continue
+                    if start < delivered:
+                        batch = batch.slice(delivered - start)
+                    while batch.num_rows:
+                        take = min(batch.num_rows, chunk_rows - pending_rows)
+                        pending.append(conform(batch.slice(0, take), prefix))
+                        pending_rows += take
+                        batch = batch.slice(take)
+                        spans[f] = (offset - batch.num_rows, total)
+                        if pending_rows >= chunk_rows:
+                            yield pa.concat_tables(pending, promote_options="permissive"), spans
+                            pending, pending_rows, spans = [], 0, {}
+            except Exception as e:
+                print(f"[{prefix}] Error reading {f}: {e}")
+        if pending:
+            yield pa.concat_tables(pending, promote_options="permissive"), spans
+
+    def checkpoint(self, prefix: str, spans: Dict[str, Tuple[int, int]], target: Optional[str] = None,
+                   targets: Tuple[str, ...] = ()) -> None:
+        """Record an inserted chunk: finished files are removed, partial ones advance.
+
+        With `target`, only that target's progress advances; a file is removed
+        once every one of `targets` has all of it.
+        """
+        if target is None:
+            done = [f for f, (end, total) in spans.items() if end >= total]
+            for f, (end, total) in spans.items():
+                if end < total:
+                    self.manifest.set_delivered(self._rel(f), end)
+        else:
+            done = [f for f, (end, total) in spans.items()
+                    if self.manifest.set_delivered(self._rel(f), end, target, targets) >= total]
+        if done:
+            self.remove_files(prefix, done)
+
+    def insert_token(self, prefix: str, spans: Dict[str, Tuple[int, int]], table: pa.Table) -> str:
+        """Deterministic insert-deduplication token for a chunk.
+
+        Built from the files and offsets the chunk covers plus a hash of the
+        rows themselves, so re-sending the same chunk after a failed or
+        interrupted insert carries the same token and the server drops it.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for path, (end, total) in sorted(spans.items()):
+            h.update(f"{self._rel(path)}:{end}/{total};".encode())
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        h.update(sink.getvalue())
+        return f"{prefix}-{h.hexdigest()}"
+
+    def drop_delivered(self, prefix: str, files: List[str]) -> List[str]:
+        """Remove files every target already has (e.g. a flush died before deleting them)."""
+        progress = self.manifest.progress(self._rel(f) for f in files)
+        done = [f for f in files if self._rel(f) in progress and progress[self._rel(f)][1] >= progress[self._rel(f)][0]]
+        if done:
+            self.remove_files(prefix, done)
+        return [f for f in files if f not in done]
+
+    def remove_files(self, prefix: str, files: List[str]) -> None:
+        """Delete flushed files, drop them from the manifest and prune empty partitions."""
+        for f in files:
+            try:
+                os.remove(f)
+            except OSError as e:
+                print(f"[{prefix}] Error deleting {f}: {e}")
+        self.manifest.forget(self._rel(f) for f in files)
+        for d in {os.path.dirname(f) for f in files}:
+            while d.startswith(os.path.join(self.buffer_dir, prefix)):
+                try:
+                    os.rmdir(d)
+                except OSError:
+                    break
+                d = os.path.dirname(d)
+
+    def flush(self, prefix: str, table_name: str):
+        """
+        Reads all parquet files matching the prefix, concatenates them,
+        and inserts into ClickHouse. Deletes files on success.
+        """
+        owner = f"flush-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        files = self.claim(prefix, owner)
+
+        if not files:
             return
 
-        combined_df = pd.concat(dfs, ignore_index=True)
-        
-        # Deduplicate if needed? 
-        # Usually better to let ClickHouse handle it if using ReplacingMergeTree,
-        # but we can do a simple drop_duplicates here to save bandwidth.
-        # combined_df.drop_duplicates(inplace=True) 
-        
         try:
-            insert_df(table_name, combined_df)
-            print(f"[{prefix}] Successfully inserted {len(combined_df)} rows into {table_name}")
-            
-            # Delete files only after successful insert
-            for f in valid_files:
+            print(f"[{prefix}] Found {len(files)} buffered files. Attempting to flush...")
+
+            inserted = 0
+            for chunk, spans in self.iter_chunks(prefix, files):
                 try:
-                    os.remove(f)
-                except OSError as e:
-                    print(f"[{prefix}] Error deleting {f}: {e}")
+                    insert_columns(table_name, chunk, dedup_token=self.insert_token(prefix, spans, chunk))
+                except Exception as e:
+                    print(f"[{prefix}] ClickHouse unavailable or insert failed: {e}")
+                    print(f"[{prefix}] Data remains in buffer ({inserted} rows inserted before the failure).")
+                    return
+                # Delete/advance files only after successful insert
+                self.checkpoint(prefix, spans)
+                inserted += chunk.num_rows
+            print(f"[{prefix}] Successfully inserted {inserted} rows into {table_name}")
             print(f"[{prefix}] Buffer cleared.")
-            
-        except Exception as e:
-            print(f"[{prefix}] ClickHouse unavailable or insert failed: {e}")
-            print(f"[{prefix}] Data remains in buffer.")
+        finally:
+            self.release(owner)
@@ -0,0 +1,248 @@
+"""SQLite index of the parquet files in the buffer.
+
+One row per buffered file: prefix, row count, min/max event time (epoch ms),
+size, and an optional claim. Writers register a file only after it has been
+atomically renamed into place, so every indexed file is complete. Readers
+(flush, compaction) *claim* the exact set of files they will process; later
+saves land unclaimed and are picked up by the next run, so the ping never
+waits on a flush and a flush never sees a half-written file.
+
+Claims carry an owner id and a timestamp; claims older than
+`HL_BUFFER_CLAIM_TTL_S` are treated as abandoned (crashed flush) and freed.
+Every checkpoint of a claimed file refreshes the timestamp of the owner's
+whole claim, so a flush that streams for longer than the TTL keeps its
+files as long as it makes progress.
+
+`delivered_rows` is the flush checkpoint: rows of the file (in file order)
+already inserted into ClickHouse, so a flush that dies mid-file resumes
+after the last delivered chunk instead of re-sending the whole file. With
+several targets (local + cloud) each one's progress is kept separately in
+`deliveries`, and `delivered_rows` is the part every target has; a target
+without a `deliveries` row is at `delivered_rows`.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+CLAIM_TTL_S = float(os.getenv("HL_BUFFER_CLAIM_TTL_S", "3600"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    prefix TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    min_ts INTEGER,
+    max_ts INTEGER,
+    bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    claim TEXT,
+    claimed_at REAL,
+    delivered_rows INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_prefix_claim ON files (prefix, claim);
+CREATE TABLE IF NOT EXISTS deliveries (
+    path TEXT NOT NULL,
+    target TEXT NOT NULL,
+    delivered_rows INTEGER NOT NULL,
+    PRIMARY KEY (path, target)
+) WITHOUT ROWID;
+"""
+
+
+# Paths per `IN (...)` lookup, well under SQLite's bound-parameter limit
+_IN_BATCH = 500
+
+
+def _batches(paths: Iterable[str]) -> Iterable[List[str]]:
+    paths = list(paths)
+    for i in range(0, len(paths), _IN_BATCH):
+        yield paths[i:i + _IN_BATCH]
+
+
+class BufferManifest:
+    """Connections are opened once per thread (and process) and kept; the schema is set up once."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _open(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.executescript(_SCHEMA)
+                columns = {r[1] for r in conn.execute("PRAGMA table_info(files)")}
+                if "delivered_rows" not in columns:
+                    conn.execute("ALTER TABLE files ADD COLUMN delivered_rows INTEGER NOT NULL DEFAULT 0")
+                self._schema_ready = True
+        return conn
+
+    @contextmanager
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._open()
+            self._local.pid = os.getpid()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                # A statement failed mid-transaction; don't leave it open on the kept connection.
+                conn.execute("ROLLBACK")
+
+    def close(self) -> None:
+        """Close this thread's connection (others close when their thread's objects are collected)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def register(
+        self,
+        path: str,
+        prefix: str,
+        rows: int,
+        nbytes: int,
+        min_ts: Optional[int] = None,
+        max_ts: Optional[int] = None,
+    ) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO files (path, prefix, rows, min_ts, max_ts, bytes, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, prefix, int(rows), min_ts, max_ts, int(nbytes), time.time()),
+            )
+
+    def claim(self, prefix: str, owner: str, path_prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Atomically claim every unclaimed file of `prefix` (optionally under `path_prefix`)."""
+        now = time.time()
+        like = f"{path_prefix}%" if path_prefix else "%"
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE files SET claim = NULL, claimed_at = NULL WHERE claim IS NOT NULL AND claimed_at < ?",
+                (now - CLAIM_TTL_S,),
+            )
+            conn.execute(
+                "UPDATE files SET claim = ?, claimed_at = ? WHERE prefix = ? AND claim IS NULL AND path LIKE ?",
+                (owner, now, prefix, like),
+            )
+            conn.execute("COMMIT")
+            cur = conn.execute(
+                "SELECT path, prefix, rows, min_ts, max_ts, bytes FROM files WHERE claim = ? ORDER BY path",
+                (owner,),
+            )
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    def release(self, owner: str) -> None:
+        """Give back a claim (e.g. after a failed insert) so the next run retries."""
+        with self._connect() as conn:
+            conn.execute("UPDATE files SET claim = NULL, claimed_at = NULL WHERE claim = ?", (owner,))
+
+    def forget(self, paths: Iterable[str]) -> None:
+        rows = [(p,) for p in paths]
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM files WHERE path = ?", rows)
+            conn.executemany("DELETE FROM deliveries WHERE path = ?", rows)
+
+    def replace(self, old_paths: Iterable[str], path: str, prefix: str, rows: int, nbytes: int,
+                min_ts: Optional[int], max_ts: Optional[int]) -> None:
+        """Swap compacted inputs for their output in one transaction."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            old = [(p,) for p in old_paths]
+            conn.executemany("DELETE FROM files WHERE path = ?", old)
+            conn.executemany("DELETE FROM deliveries WHERE path = ?", old)
+            conn.execute(
+                "INSERT OR REPLACE INTO files (path, prefix, rows, min_ts, max_ts, bytes, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, prefix, int(rows), min_ts, max_ts, int(nbytes), time.time()),
+            )
+            conn.execute("COMMIT")
+
+    def progress(self, paths: Iterable[str], target: Optional[str] = None) -> Dict[str, Tuple[int, int]]:
+        """path -> (rows, delivered_rows) for the given files, for all targets or just `target`."""
+        out: Dict[str, Tuple[int, int]] = {}
+        with self._connect() as conn:
+            for batch in _batches(paths):
+                rows = conn.execute(
+                    "SELECT f.path, f.rows, COALESCE(d.delivered_rows, f.delivered_rows) FROM files f "
+                    "LEFT JOIN deliveries d ON d.path = f.path AND d.target = ? "
+                    f"WHERE f.path IN ({', '.join('?' * len(batch))})",
+                    (target, *batch),
+                )
+                out.update((r[0], (int(r[1]), int(r[2]))) for r in rows)
+        return out
+
+    def touched(self, paths: Iterable[str]) -> Set[str]:
+        """The given files that any target has started delivering."""
+        out: Set[str] = set()
+        with self._connect() as conn:
+            for batch in _batches(paths):
+                marks = ", ".join("?" * len(batch))
+                out.update(r[0] for r in conn.execute(
+                    f"SELECT path FROM files WHERE delivered_rows > 0 AND path IN ({marks}) "
+                    f"UNION SELECT path FROM deliveries WHERE delivered_rows > 0 AND path IN ({marks})",
+                    (*batch, *batch),
+                ))
+        return out
+
+    def set_delivered(self, path: str, delivered_rows: int, target: Optional[str] = None,
+                      targets: Iterable[str] = ()) -> int:
+        """Record progress; returns the rows delivered to every target.
+
+        Without `target` this is the all-target checkpoint. With it, only that
+        target advances, and the all-target figure becomes the minimum over
+        `targets`. Either way the claim holding the file is refreshed.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE files SET claimed_at = ? WHERE claim = (SELECT claim FROM files WHERE path = ?)",
+                (time.time(), path),
+            )
+            if target is None:
+                conn.execute("UPDATE files SET delivered_rows = ? WHERE path = ?", (int(delivered_rows), path))
+                return int(delivered_rows)
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO deliveries (path, target, delivered_rows) VALUES (?, ?, ?)",
+                (path, target, int(delivered_rows)),
+            )
+            row = conn.execute("SELECT delivered_rows FROM files WHERE path = ?", (path,)).fetchone()
+            base = int(row[0]) if row else 0
+            per_target = [
+                r[0] if r else base
+                for r in (
+                    conn.execute("SELECT delivered_rows FROM deliveries WHERE path = ? AND target = ?", (path, t))
+                    .fetchone()
+                    for t in set(targets) | {target}
+                )
+            ]
+            delivered = max(base, min(per_target))
+            conn.execute("UPDATE files SET delivered_rows = ? WHERE path = ?", (delivered, path))
+            conn.execute("COMMIT")
+            return delivered
+
+    def paths(self) -> Set[str]:
+        with self._connect() as conn:
+            return {r[0] for r in conn.execute("SELECT path FROM files")}
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per prefix: files, undelivered rows, bytes, min/max event time, claimed files."""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "SELECT prefix, COUNT(*), SUM(rows - delivered_rows), SUM(bytes), MIN(min_ts), MAX(max_ts), "
+                "SUM(claim IS NOT NULL) FROM files GROUP BY prefix ORDER BY prefix"
+            )
+            return {
+                r[0]: {"files": r[1], "rows": r[2], "bytes": r[3], "min_ts": r[4], "max_ts": r[5], "claimed": r[6]}
+                for r in cur.fetchall()
+            }
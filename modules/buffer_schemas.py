@@ -0,0 +1,196 @@
+"""Explicit Arrow schemas for the parquet buffer, one per prefix.
+
+Without them every file carries whatever pandas inferred for that save
+(`cloid` object vs null, `reduceOnly` bool vs object, funding `usdc` float
+vs string), and concatenating files upcasts to object. `conform` casts a
+DataFrame or Arrow table to the prefix's schema at save time, so every file
+of a prefix has the same column types and the flush can concatenate
+batches without reconciling them.
+
+Types follow the ClickHouse tables in `scripts/sql/init_db.sql`; timestamps
+are naive UTC milliseconds. `coin` and `address` repeat a handful of values
+per file and are dictionary-encoded (categoricals in pandas).
+
+Only the columns present in the input are written: producers that leave
+out a column (e.g. the legacy orchestrator has no `address`) still get
+ClickHouse's default for it instead of a NULL. Columns not in the schema are
+passed through unchanged.
+"""
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from modules.hl_decoders import TS_MS, to_arrow
+
+DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+
+BUFFER_SCHEMAS: Dict[str, pa.Schema] = {
+    "account": pa.schema([
+        ("timestamp", TS_MS),
+        ("accountValue", pa.float64()),
+        ("totalMarginUsed", pa.float64()),
+        ("totalNtlPos", pa.float64()),
+        ("totalRawUsd", pa.float64()),
+        ("marginUsed", pa.float64()),
+        ("withdrawable", pa.float64()),
+        ("address", DICT_STRING),
+    ]),
+    "positions": pa.schema([
+        ("timestamp", TS_MS),
+        ("coin", DICT_STRING),
+        ("szi", pa.float64()),
+        ("entryPx", pa.float64()),
+        ("positionValue", pa.float64()),
+        ("unrealizedPnl", pa.float64()),
+        ("returnOnEquity", pa.float64()),
+        ("liquidationPx", pa.float64()),
+        ("leverage", pa.float64()),
+        ("maxLeverage", pa.int32()),
+        ("marginUsed", pa.float64()),
+        ("address", DICT_STRING),
+    ]),
+    "trades": pa.schema([
+        ("coin", DICT_STRING),
+        ("side", pa.string()),
+        ("px", pa.float64()),
+        ("sz", pa.float64()),
+        ("time", TS_MS),
+        ("hash", pa.string()),
+        ("startPosition", pa.float64()),
+        ("dir", pa.string()),
+        ("closedPnl", pa.float64()),
+        ("oid", pa.int64()),
+        ("cloid", pa.string()),
+        ("fee", pa.float64()),
+        ("tid", pa.int64()),
+        ("address", DICT_STRING),
+    ]),
+    "orders": pa.schema([
+        ("coin", DICT_STRING),
+        ("side", pa.string()),
+        ("limitPx", pa.float64()),
+        ("sz", pa.float64()),
+        ("oid", pa.int64()),
+        ("timestamp", TS_MS),
+        ("status", pa.string()),
+        ("orderType", pa.string()),
+        ("reduceOnly", pa.bool_()),
+        ("address", DICT_STRING),
+    ]),
+    "funding": pa.schema([
+        ("time", TS_MS),
+        ("coin", DICT_STRING),
+        ("usdc", pa.float64()),
+        ("szi", pa.float64()),
+        ("fundingRate", pa.float64()),
+        ("tid", pa.int64()),
+        ("address", DICT_STRING),
+    ]),
+    "ledger": pa.schema([
+        ("time", TS_MS),
+        ("hash", pa.string()),
+        ("type", pa.string()),
+        ("usdc", pa.float64()),
+        ("coin", DICT_STRING),
+        ("raw_json", pa.string()),
+        ("address", DICT_STRING),
+    ]),
+    "market": pa.schema([
+        ("timestamp", TS_MS),
+        ("coin", DICT_STRING),
+        ("markPx", pa.float64()),
+        ("midPx", pa.float64()),
+        ("oraclePx", pa.float64()),
+        ("funding", pa.float64()),
+        ("openInterest", pa.float64()),
+        ("premium", pa.float64()),
+        ("dayNtlVlm", pa.float64()),
+        ("prevDayPx", pa.float64()),
+    ]),
+    "candles": pa.schema([
+        ("coin", DICT_STRING),
+        ("interval", pa.string()),
+        ("ts", TS_MS),
+        ("open", pa.float64()),
+        ("high", pa.float64()),
+        ("low", pa.float64()),
+        ("close", pa.float64()),
+        ("volume", pa.float64()),
+    ]),
+    "meta": pa.schema([
+        ("symbol", pa.string()),
+        ("sz_decimals", pa.int32()),
+        ("px_decimals", pa.int32()),
+        ("size_step", pa.float64()),
+        ("tick_size", pa.float64()),
+        ("min_units", pa.float64()),
+        ("min_usd", pa.float64()),
+        ("updated_at", TS_MS),
+    ]),
+}
+
+
+def _cast(arr: Union[pa.Array, pa.ChunkedArray], arrow_type: pa.DataType) -> pa.Array:
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if arr.type == arrow_type:
+        return arr
+    if pa.types.is_dictionary(arr.type):
+        arr = arr.dictionary_decode()
+    target = arrow_type.value_type if pa.types.is_dictionary(arrow_type) else arrow_type
+    try:
+        out = pc.cast(arr, target, safe=False) if pa.types.is_timestamp(arr.type) else arr.cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        # Mixed or unparsable values: normalize in Python.
+        out = to_arrow(arr.to_pylist(), target)
+    return out.dictionary_encode() if pa.types.is_dictionary(arrow_type) else out
+
+
+def _from_pandas(df: pd.DataFrame) -> pa.Table:
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # An object column mixing e.g. str and float: let `_cast` sort it out.
+        arrays: List[pa.Array] = []
+        for name in df.columns:
+            try:
+                arrays.append(pa.array(df[name], from_pandas=True))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                arrays.append(pa.array([None if pd.isna(v) else str(v) for v in df[name]], type=pa.string()))
+        return pa.Table.from_arrays(arrays, names=[str(c) for c in df.columns])
+
+
+def schema_for(prefix: str, columns: List[str]) -> Optional[pa.Schema]:
+    """The prefix's schema restricted to the fields present in `columns`."""
+    schema = BUFFER_SCHEMAS.get(prefix)
+    if schema is None:
+        return None
+    return pa.schema([f for f in schema if f.name in columns])
+
+
+def conform(data: Union[pd.DataFrame, pa.Table, pa.RecordBatch], prefix: str) -> pa.Table:
+    """Cast `data` to the buffer schema of `prefix`.
+
+    Schema columns come first in schema order, then any other columns as
+    they were. Tables that already match are returned as is; prefixes
+    without a schema only go through the DataFrame → Arrow conversion.
+    """
+    if isinstance(data, pd.DataFrame):
+        table = _from_pandas(data)
+    elif isinstance(data, pa.RecordBatch):
+        table = pa.Table.from_batches([data])
+    else:
+        table = data
+
+    target = schema_for(prefix, table.column_names)
+    if target is None:
+        return table
+    names = target.names + [c for c in table.column_names if c not in target.names]
+    if table.column_names == names and all(table.schema.field(f.name).type == f.type for f in target):
+        return table.replace_schema_metadata(None)
+
+    arrays = [_cast(table.column(f.name), f.type) for f in target]
+    arrays += [table.column(c).combine_chunks() for c in names[len(target):]]
+    return pa.Table.from_arrays(arrays, names=names)
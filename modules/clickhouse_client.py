@@ -1,29 +1,165 @@
 """Robust ClickHouse helper using clickhouse-driver (TCP).
 Provides unified interface for query, insert, and DDL operations.
+
+Connections come from one pool per named target (`local`, `remote`,
+`legacy`; see CLICKHOUSE_TARGETS in config/settings.py). A clickhouse-driver
+`Client` is not safe to share between threads, so each caller checks one out
+with `connection(target)` for as long as it needs it; the pool caps how many
+are open per target, pings connections that sat idle before handing them
+out, and drops ones that broke with a network error.
 """
 import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
-from typing import Iterable, Optional, List, Dict, Any, Union
-from clickhouse_driver import Client
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Iterable, Iterator, Optional, List, Dict, Any, Sequence, Tuple, Union
+from clickhouse_driver import Client, errors
 
-from config.settings import CLICKHOUSE_CONFIG
+from config.settings import CLICKHOUSE_CONFIG, CLICKHOUSE_TARGETS
+from modules.query_log import track_query
 
 logger = logging.getLogger(__name__)
 
-_client_cache = None
+DEFAULT_TARGET = next((name for name, cfg in CLICKHOUSE_TARGETS.items() if cfg is CLICKHOUSE_CONFIG), "local")
+POOL_MAX_SIZE = int(os.getenv("CLICKHOUSE_POOL_MAX_SIZE", "4"))
+POOL_TIMEOUT_S = float(os.getenv("CLICKHOUSE_POOL_TIMEOUT_S", "300"))
+# Idle connections older than this are pinged before reuse
+POOL_HEALTH_CHECK_S = float(os.getenv("CLICKHOUSE_POOL_HEALTH_CHECK_S", "30"))
+
+QUERY_ITER_CHUNK_ROWS = int(os.getenv("CLICKHOUSE_QUERY_ITER_CHUNK_ROWS", "100000"))
+
+# Errors after which a connection is discarded instead of returned to the pool
+_BROKEN_CONNECTION_ERRORS = (errors.NetworkError, errors.SocketTimeoutError,
+                             errors.UnexpectedPacketFromServerError, EOFError, OSError)
+
+
+class ClientPool:
+    """Bounded pool of `Client`s for one target."""
+
+    def __init__(self, target: str, config: Dict[str, Any], max_size: int = POOL_MAX_SIZE):
+        self.target = target
+        self.config = config
+        self.max_size = max_size
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle: List[Tuple[Client, float]] = []
+
+    def _healthy(self, client: Client, idle_since: float) -> bool:
+        conn = client.connection
+        if not conn.connected or time.time() - idle_since < POOL_HEALTH_CHECK_S:
+            # Unconnected clients connect lazily on their next query.
+            return True
+        try:
+            return bool(conn.ping())
+        except Exception:
+            return False
+
+    def _checkout(self) -> Client:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                client, idle_since = self._idle.pop()
+            if self._healthy(client, idle_since):
+                return client
+            logger.info(f"[{self.target}] Dropping a stale ClickHouse connection")
+            client.disconnect()
+        return Client(**self.config)
+
+    @contextmanager
+    def connection(self, timeout: float = POOL_TIMEOUT_S) -> Iterator[Client]:
+        """Check a client out for the duration of the block."""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No free ClickHouse connection for {self.target} "
+                               f"after {timeout:g}s (pool size {self.max_size})")
+        client = None
+        try:
+            client = self._checkout()
+            yield client
+        except _BROKEN_CONNECTION_ERRORS:
+            if client is not None:
+                client.disconnect()
+                client = None
+            raise
+        finally:
+            if client is not None:
+                with self._lock:
+                    self._idle.append((client, time.time()))
+            self._slots.release()
+
+    def close(self) -> None:
+        """Disconnect the idle connections (checked-out ones are unaffected)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for client, _ in idle:
+            client.disconnect()
+
+
+_pools: Dict[str, ClientPool] = {}
+_pools_lock = threading.Lock()
+_thread_clients = threading.local()
 
-def get_client() -> Client:
-    """Get a cached ClickHouse client instance."""
-    global _client_cache
-    if _client_cache is None:
-        _client_cache = Client(**CLICKHOUSE_CONFIG)
-    return _client_cache
 
-def query_df(sql: str, params: Optional[dict] = None) -> pd.DataFrame:
-    """Execute a SELECT query and return a pandas DataFrame."""
-    client = get_client()
+def get_pool(target: str = DEFAULT_TARGET) -> ClientPool:
+    """The process-wide pool for a named target."""
+    with _pools_lock:
+        if target not in _pools:
+            if target not in CLICKHOUSE_TARGETS:
+                raise KeyError(f"Unknown ClickHouse target {target!r}; expected one of {sorted(CLICKHOUSE_TARGETS)}")
+            _pools[target] = ClientPool(target, CLICKHOUSE_TARGETS[target])
+        return _pools[target]
+
+
+def connection(target: str = DEFAULT_TARGET, timeout: float = POOL_TIMEOUT_S):
+    """`with connection("remote") as client: ...` -- a pooled client for one target."""
+    return get_pool(target).connection(timeout)
+
+
+def get_client(target: str = DEFAULT_TARGET) -> Client:
+    """A client for `target` owned by the calling thread.
+
+    For code that keeps one client around; it is never shared with another
+    thread. Prefer `connection()`, which returns the client to the pool.
+    """
+    clients = getattr(_thread_clients, "clients", None)
+    if clients is None:
+        clients = _thread_clients.clients = {}
+    if target not in clients:
+        if target not in CLICKHOUSE_TARGETS:
+            raise KeyError(f"Unknown ClickHouse target {target!r}; expected one of {sorted(CLICKHOUSE_TARGETS)}")
+        clients[target] = Client(**CLICKHOUSE_TARGETS[target])
+    return clients[target]
+
+def query_df(
+    sql: str,
+    params: Optional[dict] = None,
+    target: str = DEFAULT_TARGET,
+    columnar: bool = False,
+    categories: bool = False,
+) -> pd.DataFrame:
+    """Execute a SELECT query and return a pandas DataFrame.
+
+    With `columnar=True` the result is read column by column into NumPy
+    arrays (clickhouse-driver's `use_numpy`) and the frame is built from them
+    without a Python object per cell; use it for large loads. Column dtypes
+    then follow the ClickHouse types (see `typed_frame`). Types NumPy cannot
+    read (Decimal, Array, ...) come back as in the row mode.
+    """
     try:
-        result, columns = client.execute(sql, params=params or {}, with_column_types=True)
+        with track_query("query", sql, target) as tracked, connection(target) as client:
+            if columnar:
+                result, columns = client.execute(sql, params=params or {}, with_column_types=True, columnar=True,
+                                                 settings={"use_numpy": True})
+                tracked.done(client)
+                return typed_frame(result, columns, categories)
+            result, columns = client.execute(sql, params=params or {}, with_column_types=True)
+            tracked.done(client)
         if not columns:
             return pd.DataFrame()
         col_names = [c[0] for c in columns]
@@ -32,45 +168,217 @@ def query_df(sql: str, params: Optional[dict] = None) -> pd.DataFrame:
         logger.error(f"Query failed: {e}")
         raise
 
-def insert_df(table: str, df: pd.DataFrame):
-    """Insert a pandas DataFrame into a table."""
-    if df.empty:
-        return
-    
-    client = get_client()
-    data = df.to_dict('records')
-    columns = ', '.join(df.columns)
-    
+
+def iter_row_chunks(
+    sql: str,
+    chunk_rows: int = QUERY_ITER_CHUNK_ROWS,
+    params: Optional[dict] = None,
+    target: str = DEFAULT_TARGET,
+    client: Optional[Client] = None,
+) -> Iterator[Tuple[List[Tuple[str, str]], List[tuple]]]:
+    """Stream a SELECT as (columns with types, rows) chunks of at most `chunk_rows` rows.
+
+    Uses the driver's streaming `execute_iter`, so only one server block plus
+    one chunk is held in memory at a time. Rows are yielded exactly as the
+    driver decodes them (safe to insert back as-is). The connection -- a
+    pooled one for `target`, or `client` -- is busy until the iterator is
+    exhausted or closed; one closed early is disconnected, dropping the
+    rest of the result.
+    """
+    settings = {"max_block_size": min(chunk_rows, 65536)}
+
+    def chunks(conn: Client):
+        rows_iter = conn.execute_iter(sql, params=params or {}, with_column_types=True, settings=settings)
+        finished = False
+        try:
+            columns = next(rows_iter, [])
+            chunk: List[tuple] = []
+            for row in rows_iter:
+                chunk.append(row)
+                if len(chunk) >= chunk_rows:
+                    yield columns, chunk
+                    chunk = []
+            if chunk:
+                yield columns, chunk
+            finished = True
+        finally:
+            if not finished:
+                conn.disconnect()
+
+    if client is not None:
+        yield from chunks(client)
+    else:
+        with connection(target) as pooled:
+            yield from chunks(pooled)
+
+
+def query_iter(
+    sql: str,
+    chunk_rows: int = QUERY_ITER_CHUNK_ROWS,
+    params: Optional[dict] = None,
+    target: str = DEFAULT_TARGET,
+    client: Optional[Client] = None,
+) -> Iterator[pd.DataFrame]:
+    """Stream a SELECT as DataFrames of at most `chunk_rows` rows (see `iter_row_chunks`).
+
+    Memory stays bounded by the chunk size however large the result is. An
+    empty result yields nothing.
+    """
+    for columns, rows in iter_row_chunks(sql, chunk_rows, params, target, client):
+        yield pd.DataFrame(rows, columns=[c[0] for c in columns])
+
+
+def _unwrap_type(ch_type: str) -> Tuple[str, bool]:
+    """Strip LowCardinality(...)/Nullable(...); returns (inner type, nullable)."""
+    nullable = False
+    while True:
+        if ch_type.startswith("LowCardinality("):
+            ch_type = ch_type[len("LowCardinality("):-1]
+        elif ch_type.startswith("Nullable("):
+            ch_type, nullable = ch_type[len("Nullable("):-1], True
+        else:
+            return ch_type, nullable
+
+
+_PANDAS_NULLABLE_INTS = {"Int8", "Int16", "Int32", "Int64", "UInt8", "UInt16", "UInt32", "UInt64"}
+
+
+def _typed_column(values: Any, ch_type: str, categories: bool) -> Any:
+    base, nullable = _unwrap_type(ch_type)
+    if isinstance(values, pd.Categorical):
+        # LowCardinality
+        return values if categories else np.asarray(values)
+    if not isinstance(values, np.ndarray):
+        return values
+    tz = re.search(r"'([^']+)'", base) if base.startswith("DateTime") else None
+    if values.dtype == object and nullable:
+        if base.startswith("Float"):
+            return pd.array(values, dtype="Float64").to_numpy("float64", na_value=np.nan)
+        if base in _PANDAS_NULLABLE_INTS:
+            return pd.array(values, dtype=base)
+        if base.startswith("Date"):
+            values = pd.to_datetime(pd.Series(values)).to_numpy()
+            return pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(tz.group(1)).array if tz else values
+        return values
+    if tz and np.issubdtype(values.dtype, np.datetime64):
+        # NumPy reads DateTime('tz') as naive UTC
+        return pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(tz.group(1)).array
+    return values
+
+
+def typed_frame(data: Sequence[Any], columns: Sequence[Tuple[str, str]], categories: bool = False) -> pd.DataFrame:
+    """DataFrame from a columnar `use_numpy` result, with dtypes from the ClickHouse types.
+
+    Numbers keep their width; Nullable floats become float64 with NaN and
+    Nullable ints pandas' nullable Int/UInt dtypes. Date/DateTime/DateTime64
+    are datetime64 (tz-aware for DateTime('tz') columns). LowCardinality
+    columns are decoded to plain values, or kept as pandas categoricals with
+    `categories=True`.
+    """
+    names = [name for name, _ in columns]
+    if not data:
+        return pd.DataFrame(columns=names)
+    return pd.DataFrame(
+        {name: _typed_column(values, ch_type, categories) for (name, ch_type), values in zip(columns, data)},
+        columns=names,
+    )
+
+def to_columns(data: Union[pd.DataFrame, pa.Table], columns: Optional[Sequence[str]] = None) -> List[list]:
+    """One Python list per column, for a columnar native insert.
+
+    Goes through Arrow, which converts whole columns at once instead of
+    building a dict or tuple per row. Dictionary (categorical) columns are
+    decoded and null floats become NaN, as they did through pandas.
+    """
+    if isinstance(data, pd.DataFrame):
+        data = pa.Table.from_pandas(data, preserve_index=False)
+    out = []
+    for name in columns or data.column_names:
+        col = data.column(name)
+        if pa.types.is_dictionary(col.type):
+            col = col.cast(col.type.value_type)
+        if pa.types.is_floating(col.type) and col.null_count:
+            col = pc.fill_null(col, float("nan"))
+        out.append(col.to_pylist())
+    return out
+
+
+def dedup_settings(token: Optional[str]) -> Dict[str, Any]:
+    """Query settings that make an insert idempotent under `token`.
+
+    Replicated/Shared MergeTree tables (ClickHouse Cloud) deduplicate on the
+    token out of the box; plain MergeTree tables need
+    `non_replicated_deduplication_window` > 0 (see init_db.sql).
+    """
+    return {"insert_deduplication_token": token} if token else {}
+
+
+def insert_columns(
+    table: str,
+    data: Union[pd.DataFrame, pa.Table],
+    columns: Optional[Sequence[str]] = None,
+    client: Optional[Client] = None,
+    dedup_token: Optional[str] = None,
+    target: str = DEFAULT_TARGET,
+) -> int:
+    """Insert a DataFrame or Arrow table column by column (`columnar=True`).
+
+    Defaults to all columns and a pooled connection to `target`; pass
+    `client` to use one the caller already holds (e.g. the flush's
+    local/remote pair). With `dedup_token`
+    the server drops the insert if it already took one with that token
+    (`insert_deduplication_token`), so a retry is safe. Returns rows sent.
+    """
+    if len(data) == 0:
+        return 0
+    cols = list(columns or (data.columns if isinstance(data, pd.DataFrame) else data.column_names))
+    payload = to_columns(data, cols)
+    sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES"
     try:
-        client.execute(f"INSERT INTO {table} ({columns}) VALUES", data)
+        with track_query("insert", sql, target) as tracked:
+            if client is not None:
+                client.execute(sql, payload, columnar=True, settings=dedup_settings(dedup_token))
+                tracked.done(client)
+            else:
+                with connection(target) as pooled:
+                    pooled.execute(sql, payload, columnar=True, settings=dedup_settings(dedup_token))
+                    tracked.done(pooled)
     except Exception as e:
         logger.error(f"Insert failed for {table}: {e}")
         raise
+    return len(data)
+
+
+def insert_df(table: str, df: pd.DataFrame, target: str = DEFAULT_TARGET):
+    """Insert a pandas DataFrame into a table."""
+    insert_columns(table, df, target=target)
 
-def execute(sql: str, params: Optional[dict] = None):
+def execute(sql: str, params: Optional[dict] = None, target: str = DEFAULT_TARGET):
     """Execute a DDL or DML statement (CREATE, DROP, ALTER, etc)."""
-    client = get_client()
-    return client.execute(sql, params=params or {})
+    with track_query("execute", sql, target) as tracked, connection(target) as client:
+        result = client.execute(sql, params=params or {})
+        tracked.done(client)
+        return result
 
-def table_exists(full_table_name: str) -> bool:
+def table_exists(full_table_name: str, target: str = DEFAULT_TARGET) -> bool:
     """Check if a table exists."""
-    client = get_client()
     try:
         if "." in full_table_name:
             db, table = full_table_name.split(".", 1)
         else:
-            db = CLICKHOUSE_CONFIG.get('database', 'default')
+            db = CLICKHOUSE_TARGETS[target].get('database', 'default')
             table = full_table_name
             
         sql = "SELECT 1 FROM system.tables WHERE database = %(db)s AND name = %(table)s LIMIT 1"
-        result = client.execute(sql, params={"db": db, "table": table})
+        with connection(target) as client:
+            result = client.execute(sql, params={"db": db, "table": table})
         return bool(result)
     except Exception:
         return False
 
-def first_existing(tables: Iterable[str]) -> Optional[str]:
+def first_existing(tables: Iterable[str], target: str = DEFAULT_TARGET) -> Optional[str]:
     """Return the first table from the list that exists."""
     for t in tables:
-        if table_exists(t):
+        if table_exists(t, target):
             return t
     return None
@@ -0,0 +1,133 @@
+"""Persistent per-address, per-stream high-water marks for incremental ingest.
+
+State lives in a single JSON file (default `data/state/cursors.json`) shaped as:
+
+    {
+      "0xabc...": {
+        "fills":   {"time": 1733990400123, "keys": ["123456789"]},
+        "funding": {"time": 1733990400000, "keys": ["BTC", "ETH"]}
+      }
+    }
+
+`time` is the newest epoch-ms already buffered and `keys` the natural ids seen
+at exactly that millisecond, so a boundary-inclusive re-fetch can drop them.
+
+Cursors only move forward. Writers that share a stream (the 15-minute ping
+and the WebSocket stream both buffer fills) go through `buffer_new`, which
+filters, buffers and advances under the store's file lock, so two processes
+cannot both buffer the same rows.
+"""
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CURSOR_PATH = os.path.join(PROJECT_ROOT, "data", "state", "cursors.json")
+
+
+class CursorStore:
+    def __init__(self, path: str = DEFAULT_CURSOR_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """Serialize read-modify-write across threads and processes."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock, open(self.path + ".lock", "a") as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, address: str, stream: str) -> Optional[Dict[str, Any]]:
+        return self._read().get(address.lower(), {}).get(stream)
+
+    def set(self, address: str, stream: str, cursor: Dict[str, Any]) -> None:
+        """Store `cursor`, unless the stored one is already further along."""
+        with self._locked():
+            self._store(address, stream, cursor)
+
+    def _store(self, address: str, stream: str, cursor: Dict[str, Any]) -> None:
+        state = self._read()
+        streams = state.setdefault(address.lower(), {})
+        streams[stream] = _forward(streams.get(stream), cursor)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def buffer_new(
+        self,
+        address: str,
+        stream: str,
+        rows: Iterable[Dict[str, Any]],
+        key_fn: Callable[[Dict[str, Any]], str],
+        write: Callable[[List[Dict[str, Any]]], None],
+        time_field: str = "time",
+    ) -> List[Dict[str, Any]]:
+        """Atomically: drop rows at or before the stored cursor, `write` the rest, advance the cursor.
+
+        The lock is held across all three steps, so concurrent writers of the
+        same stream (other threads or processes) never both write a row. If
+        `write` raises, the cursor is left untouched. Returns the rows written.
+        """
+        with self._locked():
+            new_rows, cursor = filter_new_rows(rows, self.get(address, stream), key_fn, time_field)
+            if new_rows:
+                write(new_rows)
+                self._store(address, stream, cursor)
+        return new_rows
+
+
+def _forward(old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> Dict[str, Any]:
+    """The further of two cursors (keys merged when they sit on the same millisecond)."""
+    if old is None or int(new["time"]) > int(old["time"]):
+        return new
+    if int(new["time"]) < int(old["time"]):
+        return old
+    return {"time": int(new["time"]), "keys": sorted(set(old.get("keys", [])) | set(new.get("keys", [])))}
+
+
+def filter_new_rows(
+    rows: Iterable[Dict[str, Any]],
+    cursor: Optional[Dict[str, Any]],
+    key_fn: Callable[[Dict[str, Any]], str],
+    time_field: str = "time",
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Drop rows at or before the cursor and return (new_rows, advanced_cursor).
+
+    Rows newer than `cursor["time"]` are kept; rows at exactly that time are
+    kept only if their key was not already recorded. The returned cursor is
+    None when nothing new arrived (leave the stored one untouched).
+    """
+    last_time = int(cursor["time"]) if cursor else None
+    seen = set(cursor.get("keys", [])) if cursor else set()
+
+    new_rows: List[Dict[str, Any]] = []
+    for row in rows:
+        t = int(row[time_field])
+        if last_time is not None:
+            if t < last_time or (t == last_time and key_fn(row) in seen):
+                continue
+        new_rows.append(row)
+
+    if not new_rows:
+        return [], None
+
+    max_time = max(int(r[time_field]) for r in new_rows)
+    boundary = {key_fn(r) for r in new_rows if int(r[time_field]) == max_time}
+    if last_time is not None and max_time == last_time:
+        boundary |= seen
+    return new_rows, {"time": max_time, "keys": sorted(boundary)}
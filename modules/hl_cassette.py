@@ -0,0 +1,238 @@
+"""Record/replay cassette for Hyperliquid /info traffic.
+
+With `HL_CASSETTE_MODE=record` every HyperliquidClient call is appended to
+`<HL_CASSETTE_DIR>/cassette.jsonl` (endpoint, payload, latency, response).
+With `HL_CASSETTE_MODE=replay` the client never touches the network, the rate
+limiter or the response cache: responses come from the cassette, so the ping →
+BufferManager → flush path can be run and timed offline.
+
+Replay options:
+  - HL_CASSETTE_TIME_WARP=1     shift every recorded timestamp (`time`,
+                                `timestamp`, `t`, ...) so the newest recording
+                                lands at "now"; cursors and candle gaps then
+                                behave as they would live.
+  - HL_CASSETTE_ACCOUNTS=N      replay N synthetic accounts, each backed by a
+                                recorded one (round robin) with its ids
+                                (tid/oid/hash) rewritten so rows stay distinct.
+  - HL_CASSETTE_LATENCY_SCALE=x sleep x × the recorded latency per call
+                                (0, the default, replays as fast as possible).
+
+Time-ranged requests (startTime/endTime) are matched without their bounds:
+the union of recorded rows for that request is filtered to the requested
+window and capped at the largest page recorded, so cursor paging still works.
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CASSETTE_DIR = os.path.join(PROJECT_ROOT, "data", "cassettes", "default")
+CASSETTE_FILE = "cassette.jsonl"
+
+HL_CASSETTE_MODE = os.getenv("HL_CASSETTE_MODE", "").lower()
+HL_CASSETTE_DIR = os.getenv("HL_CASSETTE_DIR", DEFAULT_CASSETTE_DIR)
+HL_CASSETTE_TIME_WARP = os.getenv("HL_CASSETTE_TIME_WARP", "").lower() in ("1", "true", "yes")
+HL_CASSETTE_ACCOUNTS = int(os.getenv("HL_CASSETTE_ACCOUNTS", "0"))
+HL_CASSETTE_LATENCY_SCALE = float(os.getenv("HL_CASSETTE_LATENCY_SCALE", "0"))
+
+# Response fields holding epoch-ms timestamps (shifted by the time warp).
+TIME_FIELDS = {"time", "timestamp", "statusTimestamp", "t", "T"}
+# Request fields ignored when matching a replayed call to a recording.
+RANGE_FIELDS = {"startTime", "endTime"}
+# Integer ids offset per synthetic account so multiplied rows do not collide.
+ID_FIELDS = {"tid", "oid"}
+SYNTHETIC_ID_STRIDE = 10 ** 15
+# A cursored replay asks for userFillsByTime even if the recording (a first
+# run) only has the full userFills pull; serve the window from that instead.
+FALLBACK_TYPES = {"userFillsByTime": "userFills"}
+
+
+class CassetteMiss(LookupError):
+    """Replay was asked for a request that was never recorded."""
+
+
+def _strip_range(payload: Any) -> Any:
+    if isinstance(payload, dict):
+        return {k: _strip_range(v) for k, v in payload.items() if k not in RANGE_FIELDS}
+    return payload
+
+
+def _range(payload: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+    src = payload.get("req") if isinstance(payload.get("req"), dict) else payload
+    start, end = src.get("startTime"), src.get("endTime")
+    return (int(start) if start is not None else None, int(end) if end is not None else None)
+
+
+def _match_key(endpoint: str, payload: Dict[str, Any]) -> str:
+    canonical = json.dumps(_strip_range(payload), sort_keys=True, separators=(",", ":"))
+    return f"{endpoint} {canonical}"
+
+
+def _row_time(row: Any) -> Optional[int]:
+    if not isinstance(row, dict):
+        return None
+    for field in ("time", "t", "timestamp"):
+        if isinstance(row.get(field), int):
+            return row[field]
+    order = row.get("order")
+    if isinstance(order, dict) and isinstance(order.get("timestamp"), int):
+        return order["timestamp"]
+    return None
+
+
+def _rewrite(obj: Any, shift_ms: int, account_idx: int) -> Any:
+    """Apply the time warp and synthetic-account id rewrite in place."""
+    if isinstance(obj, list):
+        for item in obj:
+            _rewrite(item, shift_ms, account_idx)
+    elif isinstance(obj, dict):
+        for k, v in obj.items():
+            if isinstance(v, (dict, list)):
+                _rewrite(v, shift_ms, account_idx)
+            elif shift_ms and k in TIME_FIELDS and isinstance(v, int) and not isinstance(v, bool):
+                obj[k] = v + shift_ms
+            elif account_idx and k in ID_FIELDS and isinstance(v, int) and not isinstance(v, bool):
+                obj[k] = v + account_idx * SYNTHETIC_ID_STRIDE
+            elif account_idx and k == "hash" and isinstance(v, str) and len(v) > 8:
+                obj[k] = f"{v[:-8]}{account_idx:08x}"
+    return obj
+
+
+def synthetic_address(source: str, idx: int) -> str:
+    """Deterministic fake address for the idx-th synthetic copy of `source`."""
+    if idx == 0:
+        return source
+    return "0x" + hashlib.sha1(f"{source.lower()}:{idx}".encode()).hexdigest()
+
+
+class Cassette:
+    def __init__(
+        self,
+        path: str = HL_CASSETTE_DIR,
+        mode: str = HL_CASSETTE_MODE,
+        time_warp: bool = HL_CASSETTE_TIME_WARP,
+        accounts: int = HL_CASSETTE_ACCOUNTS,
+        latency_scale: float = HL_CASSETTE_LATENCY_SCALE,
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r} (expected 'record' or 'replay')")
+        self.path = path
+        self.mode = mode
+        self.time_warp = time_warp
+        self.accounts = accounts
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._shift_ms = 0
+        # synthetic address (lowercase) -> (recorded address, account index)
+        self._aliases: Dict[str, Tuple[str, int]] = {}
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def file(self) -> str:
+        return os.path.join(self.path, CASSETTE_FILE)
+
+    # -- record -------------------------------------------------------------
+
+    def record(self, endpoint: str, payload: Dict[str, Any], data: Any, elapsed_ms: float) -> None:
+        line = json.dumps({
+            "endpoint": endpoint,
+            "payload": payload,
+            "recorded_at": int(time.time() * 1000),
+            "elapsed_ms": round(elapsed_ms, 3),
+            "data": data,
+        }, separators=(",", ":"))
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.file, "a") as f:
+                f.write(line + "\n")
+
+    # -- replay -------------------------------------------------------------
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            if self._entries is None:
+                entries: Dict[str, List[Dict[str, Any]]] = {}
+                newest = 0
+                try:
+                    with open(self.file, "r") as f:
+                        for line in f:
+                            if not line.strip():
+                                continue
+                            entry = json.loads(line)
+                            entries.setdefault(_match_key(entry["endpoint"], entry["payload"]), []).append(entry)
+                            newest = max(newest, int(entry.get("recorded_at", 0)))
+                except FileNotFoundError:
+                    raise CassetteMiss(f"No cassette at {self.file}; record one with HL_CASSETTE_MODE=record")
+                if self.time_warp and newest:
+                    self._shift_ms = int(time.time() * 1000) - newest
+                self._entries = entries
+            return self._entries
+
+    def addresses(self, recorded: List[str]) -> List[str]:
+        """Account list for a replay run: the recorded ones, or N synthetic copies."""
+        if not self.replaying or self.accounts <= 0 or not recorded:
+            return list(recorded)
+        out = []
+        for i in range(self.accounts):
+            source = recorded[i % len(recorded)]
+            idx = i // len(recorded)
+            addr = synthetic_address(source, idx)
+            self._aliases[addr.lower()] = (source, idx)
+            out.append(addr)
+        return out
+
+    def play(self, endpoint: str, payload: Dict[str, Any]) -> Any:
+        entries = self._load()
+        user = payload.get("user")
+        source, idx = self._aliases.get(str(user).lower(), (user, 0)) if user else (None, 0)
+        lookup = dict(payload, user=source) if user else payload
+        recorded = entries.get(_match_key(endpoint, lookup))
+        if not recorded and lookup.get("type") in FALLBACK_TYPES:
+            fallback = {k: v for k, v in lookup.items() if k not in RANGE_FIELDS}
+            fallback["type"] = FALLBACK_TYPES[lookup["type"]]
+            recorded = entries.get(_match_key(endpoint, fallback))
+        if not recorded:
+            raise CassetteMiss(f"No recording for {endpoint} {payload.get('type')} (user={user})")
+
+        if self.latency_scale > 0:
+            time.sleep(recorded[-1].get("elapsed_ms", 0.0) / 1000.0 * self.latency_scale)
+
+        start, end = _range(payload)
+        if start is None and end is None:
+            return _rewrite(copy.deepcopy(recorded[-1]["data"]), self._shift_ms, idx)
+
+        # Time-ranged: union of recorded pages, re-cut to the requested window.
+        pages = [e["data"] for e in recorded if isinstance(e["data"], list)]
+        page_cap = max((len(p) for p in pages), default=0)
+        rows: Dict[str, Any] = {}
+        for page in pages:
+            for row in page:
+                rows.setdefault(json.dumps(row, sort_keys=True), row)
+        window = []
+        for row in _rewrite(copy.deepcopy(list(rows.values())), self._shift_ms, idx):
+            t = _row_time(row)
+            if t is None or ((start is None or t >= start) and (end is None or t <= end)):
+                window.append(row)
+        window.sort(key=lambda r: _row_time(r) or 0)
+        return window[:page_cap] if page_cap else window
+
+
+_default_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Process-wide cassette from HL_CASSETTE_MODE / HL_CASSETTE_DIR (None when unset)."""
+    global _default_cassette
+    if not HL_CASSETTE_MODE:
+        return None
+    if _default_cassette is None:
+        _default_cassette = Cassette()
+    return _default_cassette
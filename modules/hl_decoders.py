@@ -0,0 +1,225 @@
+"""Schema-driven decoders for Hyperliquid /info responses.
+
+Each endpoint has a column spec: output name, path into the JSON object,
+Arrow type, and the value used for missing fields. Decoding pulls each
+column out of the parsed response in one pass and lets Arrow do the
+string → float / int → timestamp conversions in C, instead of going through
+a list of per-row dicts, `pd.DataFrame(...)` and repeated `astype(float)`.
+
+`loads` uses orjson when it is installed and falls back to the stdlib.
+"""
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    import orjson
+
+    def loads(raw: bytes) -> Any:
+        return orjson.loads(raw)
+except ImportError:  # pragma: no cover - depends on the environment
+    def loads(raw: bytes) -> Any:
+        return json.loads(raw)
+
+
+# (column, path into the object, arrow type, fill value for missing/null)
+ColumnSpec = Tuple[str, Tuple[str, ...], pa.DataType, Any]
+
+TS_MS = pa.timestamp("ms")
+
+FILL_COLUMNS: List[ColumnSpec] = [
+    ("coin", ("coin",), pa.string(), ""),
+    ("side", ("side",), pa.string(), ""),
+    ("px", ("px",), pa.float64(), 0.0),
+    ("sz", ("sz",), pa.float64(), 0.0),
+    ("time", ("time",), TS_MS, None),
+    ("hash", ("hash",), pa.string(), ""),
+    ("startPosition", ("startPosition",), pa.float64(), 0.0),
+    ("dir", ("dir",), pa.string(), ""),
+    ("closedPnl", ("closedPnl",), pa.float64(), 0.0),
+    ("oid", ("oid",), pa.int64(), 0),
+    ("cloid", ("cloid",), pa.string(), ""),
+    ("fee", ("fee",), pa.float64(), 0.0),
+    ("tid", ("tid",), pa.int64(), None),
+]
+
+ORDER_COLUMNS: List[ColumnSpec] = [
+    ("coin", ("order", "coin"), pa.string(), ""),
+    ("side", ("order", "side"), pa.string(), ""),
+    ("limitPx", ("order", "limitPx"), pa.float64(), 0.0),
+    ("sz", ("order", "sz"), pa.float64(), 0.0),
+    ("oid", ("order", "oid"), pa.int64(), 0),
+    ("timestamp", ("order", "timestamp"), TS_MS, None),
+    ("status", ("status",), pa.string(), ""),
+    ("orderType", ("order", "orderType"), pa.string(), ""),
+    ("reduceOnly", ("order", "reduceOnly"), pa.bool_(), False),
+]
+
+FUNDING_COLUMNS: List[ColumnSpec] = [
+    ("time", ("time",), TS_MS, None),
+    ("coin", ("delta", "coin"), pa.string(), ""),
+    ("usdc", ("delta", "usdc"), pa.float64(), 0.0),
+    ("szi", ("delta", "szi"), pa.float64(), 0.0),
+    ("fundingRate", ("delta", "fundingRate"), pa.float64(), 0.0),
+]
+
+LEDGER_COLUMNS: List[ColumnSpec] = [
+    ("time", ("time",), TS_MS, None),
+    ("hash", ("hash",), pa.string(), ""),
+    ("type", ("delta", "type"), pa.string(), "unknown"),
+    ("usdc", ("delta", "usdc"), pa.float64(), 0.0),
+    ("coin", ("delta", "coin"), pa.string(), ""),
+]
+
+POSITION_COLUMNS: List[ColumnSpec] = [
+    ("coin", ("position", "coin"), pa.string(), ""),
+    ("szi", ("position", "szi"), pa.float64(), 0.0),
+    ("entryPx", ("position", "entryPx"), pa.float64(), 0.0),
+    ("positionValue", ("position", "positionValue"), pa.float64(), 0.0),
+    ("unrealizedPnl", ("position", "unrealizedPnl"), pa.float64(), 0.0),
+    ("returnOnEquity", ("position", "returnOnEquity"), pa.float64(), 0.0),
+    ("liquidationPx", ("position", "liquidationPx"), pa.float64(), 0.0),
+    ("leverage", ("position", "leverage", "value"), pa.float64(), 0.0),
+    ("maxLeverage", ("position", "maxLeverage"), pa.int32(), 0),
+    ("marginUsed", ("position", "marginUsed"), pa.float64(), 0.0),
+]
+
+CANDLE_COLUMNS: List[ColumnSpec] = [
+    ("ts", ("t",), TS_MS, None),
+    ("open", ("o",), pa.float64(), 0.0),
+    ("high", ("h",), pa.float64(), 0.0),
+    ("low", ("l",), pa.float64(), 0.0),
+    ("close", ("c",), pa.float64(), 0.0),
+    ("volume", ("v",), pa.float64(), 0.0),
+]
+
+ASSET_CTX_COLUMNS: List[ColumnSpec] = [
+    ("markPx", ("markPx",), pa.float64(), None),
+    ("midPx", ("midPx",), pa.float64(), None),
+    ("oraclePx", ("oraclePx",), pa.float64(), None),
+    ("funding", ("funding",), pa.float64(), None),
+    ("openInterest", ("openInterest",), pa.float64(), None),
+    ("premium", ("premium",), pa.float64(), None),
+    ("dayNtlVlm", ("dayNtlVlm",), pa.float64(), None),
+    ("prevDayPx", ("prevDayPx",), pa.float64(), None),
+]
+
+
+def _getter(path: Tuple[str, ...]) -> Callable[[Any], Any]:
+    if len(path) == 1:
+        key = path[0]
+        return lambda r: r.get(key) if isinstance(r, dict) else None
+
+    def get(r: Any) -> Any:
+        for key in path:
+            if not isinstance(r, dict):
+                return None
+            r = r.get(key)
+        return r
+    return get
+
+
+def to_arrow(values: List[Any], arrow_type: pa.DataType) -> pa.Array:
+    """Convert raw JSON values (decimal strings, ints, bools, None) to `arrow_type`."""
+    try:
+        arr = pa.array(values)
+        if arr.type != arrow_type:
+            if pa.types.is_timestamp(arrow_type) and not pa.types.is_integer(arr.type):
+                arr = arr.cast(pa.int64())
+            arr = arr.cast(arrow_type)
+        return arr
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        # Mixed Python types in one column: normalize in Python, then convert.
+        if pa.types.is_floating(arrow_type):
+            conv: Callable[[Any], Any] = float
+        elif pa.types.is_integer(arrow_type) or pa.types.is_timestamp(arrow_type):
+            conv = lambda v: int(float(v))  # noqa: E731
+        elif pa.types.is_boolean(arrow_type):
+            conv = lambda v: str(v).lower() in ("1", "true")  # noqa: E731
+        else:
+            conv = str
+        cleaned = []
+        for v in values:
+            try:
+                cleaned.append(None if v is None else conv(v))
+            except (TypeError, ValueError):
+                cleaned.append(None)
+        return pa.array(cleaned, type=pa.int64() if pa.types.is_timestamp(arrow_type) else arrow_type).cast(arrow_type)
+
+
+def decode(
+    rows: Sequence[Any],
+    spec: List[ColumnSpec],
+    constants: Optional[Dict[str, Any]] = None,
+) -> pa.Table:
+    """Decode a list of JSON objects into an Arrow table following `spec`.
+
+    `constants` are appended as extra columns repeated for every row
+    (e.g. address, snapshot timestamp).
+    """
+    n = len(rows)
+    arrays: List[pa.Array] = []
+    names: List[str] = []
+    for name, path, arrow_type, fill in spec:
+        get = _getter(path)
+        arr = to_arrow([get(r) for r in rows], arrow_type)
+        if fill is not None and arr.null_count:
+            arr = pc.fill_null(arr, pa.scalar(fill, type=arrow_type))
+        arrays.append(arr)
+        names.append(name)
+    for name, value in (constants or {}).items():
+        arrays.append(pa.array([value] * n))
+        names.append(name)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def decode_fills(fills: Sequence[Dict[str, Any]], address: str) -> pa.Table:
+    table = decode(fills, FILL_COLUMNS, {"address": address})
+    tid = table.column("tid")
+    if tid.null_count:
+        # Older fills may lack a tid; fall back to the fill time in ms.
+        fallback = pc.cast(table.column("time"), pa.int64())
+        table = table.set_column(table.schema.get_field_index("tid"), "tid", pc.coalesce(tid, fallback))
+    return table
+
+
+def decode_orders(orders: Sequence[Dict[str, Any]], address: str) -> pa.Table:
+    return decode(orders, ORDER_COLUMNS, {"address": address})
+
+
+def decode_funding(funding: Sequence[Dict[str, Any]], address: str) -> pa.Table:
+    table = decode(funding, FUNDING_COLUMNS)
+    table = table.append_column("tid", pc.cast(table.column("time"), pa.int64()))
+    return table.append_column("address", pa.array([address] * table.num_rows))
+
+
+def decode_ledger(updates: Sequence[Dict[str, Any]], address: str) -> pa.Table:
+    table = decode(updates, LEDGER_COLUMNS)
+    raw = [json.dumps((u.get("delta") or {}) if isinstance(u, dict) else {}) for u in updates]
+    table = table.append_column("raw_json", pa.array(raw, type=pa.string()))
+    return table.append_column("address", pa.array([address] * table.num_rows))
+
+
+def decode_positions(asset_positions: Sequence[Dict[str, Any]], timestamp: Any, address: str) -> pa.Table:
+    """Non-zero positions from clearinghouseState.assetPositions."""
+    table = decode(asset_positions, POSITION_COLUMNS)
+    table = table.filter(pc.not_equal(table.column("szi"), 0.0))
+    table = table.add_column(0, "timestamp", pa.array([timestamp] * table.num_rows, type=TS_MS))
+    return table.append_column("address", pa.array([address] * table.num_rows))
+
+
+def decode_candles(candles: Sequence[Dict[str, Any]], coin: str, interval: str) -> pa.Table:
+    table = decode(candles, CANDLE_COLUMNS)
+    table = table.add_column(0, "interval", pa.array([interval] * table.num_rows, type=pa.string()))
+    return table.add_column(0, "coin", pa.array([coin] * table.num_rows, type=pa.string()))
+
+
+def decode_asset_ctxs(universe: Sequence[Dict[str, Any]], ctxs: Sequence[Dict[str, Any]], timestamp: Any) -> pa.Table:
+    """metaAndAssetCtxs → one row per named coin."""
+    pairs = [(u, c) for u, c in zip(universe, ctxs)
+             if isinstance(u, dict) and isinstance(c, dict) and u.get("name")]
+    table = decode([c for _, c in pairs], ASSET_CTX_COLUMNS)
+    table = table.add_column(0, "coin", pa.array([str(u["name"]) for u, _ in pairs], type=pa.string()))
+    return table.add_column(0, "timestamp", pa.array([timestamp] * table.num_rows, type=TS_MS))
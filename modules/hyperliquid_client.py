@@ -1,30 +1,346 @@
+import asyncio
+import functools
+import json
+import os
+import threading
 import requests
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+from requests.adapters import HTTPAdapter
+
+from modules.hl_cassette import Cassette, get_cassette
+from modules.hl_decoders import loads
+from modules.rate_limiter import (
+    BACKOFF_BASE_S,
+    BACKOFF_MAX_S,
+    SharedRateLimiter,
+    get_rate_limiter,
+    request_weight,
+    response_weight,
+)
+from modules.response_cache import ResponseCache, get_response_cache
+from modules.stats import percentile
+
 logger = logging.getLogger(__name__)
 
+# Connection pool sizing for the shared session. One pool per host is enough
+# (everything goes to api.hyperliquid.xyz); maxsize bounds concurrent sockets.
+HL_POOL_MAXSIZE = int(os.getenv("HL_POOL_MAXSIZE", "16"))
+HL_REQUEST_TIMEOUT = float(os.getenv("HL_REQUEST_TIMEOUT", "30"))
+# Retries for 429/5xx; the shared limiter's backoff spaces them out.
+HL_MAX_RETRIES = int(os.getenv("HL_MAX_RETRIES", "3"))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+# Absolute `time.monotonic()` deadline of the call running on this thread, if any
+_call_deadline = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call's deadline passed before (another) request could be sent."""
+
+
+def _remaining_s() -> Optional[float]:
+    """Seconds left before this thread's call deadline (None if it has none)."""
+    deadline = getattr(_call_deadline, "at", None)
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("call deadline passed")
+    return remaining
+
+
+def _with_deadline(fn, deadline: float):
+    """Wrap `fn` to run under `deadline` on whichever worker thread picks it up."""
+    def call():
+        _call_deadline.at = deadline
+        try:
+            return fn()
+        finally:
+            _call_deadline.at = None
+    return call
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide pooled keep-alive session.
+
+    All HyperliquidClient instances share it, so the TLS connection opened by
+    the first call is reused by every later call in the same run.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HL_POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({
+                    "Content-Type": "application/json",
+                    "Accept-Encoding": "gzip, deflate",
+                    "Connection": "keep-alive",
+                })
+                _session = session
+    return _session
+
+
+class RequestMetrics:
+    """Thread-safe per-request-type latency / bytes / status counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, List[float]] = {}
+        self._bytes: Dict[str, int] = {}
+        self._status: Dict[str, Dict[str, int]] = {}
+        self.started_at = datetime.utcnow()
+
+    def record(self, req_type: str, elapsed_ms: float, nbytes: int, status: Any) -> None:
+        with self._lock:
+            self._latencies.setdefault(req_type, []).append(elapsed_ms)
+            self._bytes[req_type] = self._bytes.get(req_type, 0) + int(nbytes)
+            codes = self._status.setdefault(req_type, {})
+            codes[str(status)] = codes.get(str(status), 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latencies.clear()
+            self._bytes.clear()
+            self._status.clear()
+            self.started_at = datetime.utcnow()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per request type: count, p50/p95/p99/total latency (ms), bytes, status codes."""
+        with self._lock:
+            out: Dict[str, Dict[str, Any]] = {}
+            for req_type, lat in self._latencies.items():
+                ordered = sorted(lat)
+                out[req_type] = {
+                    "count": len(ordered),
+                    "p50_ms": round(percentile(ordered, 50), 2),
+                    "p95_ms": round(percentile(ordered, 95), 2),
+                    "p99_ms": round(percentile(ordered, 99), 2),
+                    "total_ms": round(sum(ordered), 2),
+                    "bytes": self._bytes.get(req_type, 0),
+                    "status_codes": dict(self._status.get(req_type, {})),
+                }
+            return out
+
+    def write(self, path: str, extra: Optional[Dict[str, Any]] = None) -> str:
+        """Write the summary as a small JSON artifact and return its path."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        doc = {
+            "started_at": self.started_at.isoformat(),
+            "written_at": datetime.utcnow().isoformat(),
+            "requests": self.summary(),
+        }
+        if extra:
+            doc.update(extra)
+        with open(path, "w") as f:
+            json.dump(doc, f, indent=2, sort_keys=True)
+        return path
+
+
+# Shared across all clients in the process; the ping job dumps it at the end of a run.
+METRICS = RequestMetrics()
+
+
+def parse_account_state(data: Any, address: str) -> Dict[str, Any]:
+    """
+    Parse a clearinghouseState payload (REST or the webData2 stream) into the
+    standardized dictionary returned by HyperliquidClient.fetch_account_state.
+    """
+    # --- equity & margin ---
+    equity = None
+    margin_used = None
+    ms = None
+    if isinstance(data, dict):
+        ms = data.get("marginSummary") or data.get("margin")
+    if isinstance(ms, dict):
+        for k in ("accountValue", "equity", "total"):
+            if k in ms:
+                try:
+                    equity = float(ms[k])
+                    break
+                except Exception:
+                    pass
+        for k in ("totalMarginUsed", "initialMargin", "maintMarginUsed",
+                  "marginUsed", "positionMargin"):
+            if k in ms:
+                try:
+                    margin_used = float(ms[k])
+                    break
+                except Exception:
+                    pass
+    if equity is None and isinstance(data, dict):
+        for k in ("accountValue", "equity", "total"):
+            if k in data:
+                try:
+                    equity = float(data[k])
+                    break
+                except Exception:
+                    pass
+    if equity is None:
+        equity = 0.0
+
+    # --- positions ---
+    positions: Dict[str, float] = {}
+    arrays = []
+
+    if isinstance(data, dict):
+        for key in ("assetPositions", "positions"):
+            arr = data.get(key)
+            if isinstance(arr, list):
+                arrays.append(arr)
+        if not arrays:
+            acct = data.get("account")
+            if isinstance(acct, dict):
+                for key in ("assetPositions", "positions"):
+                    arr = acct.get(key)
+                    if isinstance(arr, list):
+                        arrays.append(arr)
+
+    def _f(v):
+        try:
+            return float(v)
+        except Exception:
+            return 0.0
+
+    for arr in arrays:
+        for item in arr:
+            if not isinstance(item, dict):
+                continue
+            pos = item.get("position") if "position" in item else item
+            if not isinstance(pos, dict):
+                continue
+            sym = pos.get("coin") or pos.get("symbol")
+            szi = None
+            for k in ("szi", "size", "positionSize"):
+                if k in pos:
+                    szi = pos[k]
+                    break
+            if sym is None or szi is None:
+                continue
+            su = str(sym).strip().upper()
+            positions[su] = positions.get(su, 0.0) + _f(szi)
+
+    return {
+        "equity_usd": float(equity),
+        "margin_used_usd": float(margin_used) if margin_used is not None else None,
+        "positions": positions,
+        "meta": {"source": "sdk", "address": address},
+        "raw": data,
+    }
+
+
 class HyperliquidClient:
     BASE_URL = "https://api.hyperliquid.xyz"
 
-    def __init__(self, address: str):
+    def __init__(
+        self,
+        address: str,
+        session: Optional[requests.Session] = None,
+        rate_limiter: Optional[SharedRateLimiter] = None,
+        response_cache: Optional[ResponseCache] = None,
+        cassette: Optional[Cassette] = None,
+    ):
         self.address = address
+        self.session = session or get_session()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.response_cache = response_cache or get_response_cache()
+        self.cassette = cassette or get_cassette()
 
     def _post(self, endpoint: str, payload: Dict[str, Any]) -> Any:
-        url = f"{self.BASE_URL}{endpoint}"
+        """Serve from / record to the cassette when one is active, else go to the API."""
+        cassette = self.cassette
+        req_type = payload.get("type", endpoint)
+        start = time.perf_counter()
+        if cassette is not None and cassette.replaying:
+            data = cassette.play(endpoint, payload)
+            METRICS.record(f"{req_type}(replay)", (time.perf_counter() - start) * 1000.0, 0, "replay")
+            return data
+
+        data = self._post_cached(endpoint, payload)
+        if cassette is not None:
+            cassette.record(endpoint, payload, data, (time.perf_counter() - start) * 1000.0)
+        return data
+
+    def _post_cached(self, endpoint: str, payload: Dict[str, Any]) -> Any:
+        """POST with the TTL response cache in front (cacheable request types only)."""
+        cache = self.response_cache
+        if cache is None or cache.ttl_for(payload) is None:
+            return self._post_uncached(endpoint, payload)
+
+        entry = cache.get(payload)
+        if entry is not None:
+            METRICS.record(f"{payload.get('type', endpoint)}(cached)", 0.0, 0, "cache")
+            return entry["data"]
+        data = self._post_uncached(endpoint, payload)
         try:
-            resp = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
-            resp.raise_for_status()
-            return resp.json()
+            cache.put(payload, data)
         except Exception as e:
-            logger.error(f"Error calling {endpoint}: {e}")
-            raise
+            logger.warning(f"Could not cache {payload.get('type')} response: {e}")
+        return data
+
+    def _post_uncached(self, endpoint: str, payload: Dict[str, Any]) -> Any:
+        url = f"{self.BASE_URL}{endpoint}"
+        req_type = payload.get("type", endpoint)
+        for attempt in range(HL_MAX_RETRIES + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(request_weight(payload), max_wait=_remaining_s())
+            remaining = _remaining_s()
+            timeout = HL_REQUEST_TIMEOUT if remaining is None else min(HL_REQUEST_TIMEOUT, remaining)
+            start = time.perf_counter()
+            status: Any = "error"
+            nbytes = 0
+            try:
+                resp = self.session.post(url, json=payload, timeout=timeout)
+                status = resp.status_code
+                nbytes = len(resp.content)
+            except Exception as e:
+                logger.error(f"Error calling {endpoint}: {e}")
+                raise
+            finally:
+                METRICS.record(req_type, (time.perf_counter() - start) * 1000.0, nbytes, status)
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.report(status)
+            if (status == 429 or status >= 500) and attempt < HL_MAX_RETRIES:
+                logger.warning(f"{req_type} returned {status}; retry {attempt + 1}/{HL_MAX_RETRIES}")
+                if self.rate_limiter is None:
+                    # No shared limiter to space the retries out.
+                    delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)
+                    remaining = _remaining_s()
+                    if remaining is not None and delay >= remaining:
+                        raise DeadlineExceeded(f"{req_type} retry backoff would pass the call deadline")
+                    time.sleep(delay)
+                continue
+
+            try:
+                resp.raise_for_status()
+                data = loads(resp.content)
+            except Exception as e:
+                logger.error(f"Error calling {endpoint}: {e}")
+                raise
+            if self.rate_limiter is not None:
+                self.rate_limiter.charge(response_weight(payload, data))
+            return data
 
     def get_user_fills(self) -> List[Dict[str, Any]]:
         """Get all user fills (trades)."""
         return self._post("/info", {"type": "userFills", "user": self.address})
 
+    def get_user_fills_by_time(self, start_time: int, end_time: int = None) -> List[Dict[str, Any]]:
+        """Get user fills with time >= start_time (capped at 2000 per response)."""
+        payload = {"type": "userFillsByTime", "user": self.address, "startTime": start_time}
+        if end_time:
+            payload["endTime"] = end_time
+        return self._post("/info", payload)
+
     def get_open_orders(self) -> List[Dict[str, Any]]:
         """Get currently open orders."""
         return self._post("/info", {"type": "openOrders", "user": self.address})
@@ -41,6 +357,14 @@ class HyperliquidClient:
         """Get global exchange metadata (universe, decimals, etc.)."""
         return self._post("/info", {"type": "meta"})
 
+    def get_meta_and_asset_ctxs(self) -> List[Any]:
+        """Get [meta, assetCtxs]: universe plus mark/mid/oracle px, funding and OI per coin."""
+        return self._post("/info", {"type": "metaAndAssetCtxs"})
+
+    def get_all_mids(self) -> Dict[str, str]:
+        """Get mid prices for every coin."""
+        return self._post("/info", {"type": "allMids"})
+
     def get_user_funding(self, start_time: int, end_time: int = None) -> List[Dict[str, Any]]:
         """Get user funding history."""
         # Note: userFunding endpoint takes startTime (and optional endTime?)
@@ -82,86 +406,89 @@ class HyperliquidClient:
                 "raw": ...
             }
         """
-        data = self.get_user_state()
-
-        # --- equity & margin ---
-        equity = None
-        margin_used = None
-        ms = None
-        if isinstance(data, dict):
-            ms = data.get("marginSummary") or data.get("margin")
-        if isinstance(ms, dict):
-            for k in ("accountValue", "equity", "total"):
-                if k in ms:
-                    try:
-                        equity = float(ms[k])
-                        break
-                    except Exception:
-                        pass
-            for k in ("totalMarginUsed", "initialMargin", "maintMarginUsed",
-                      "marginUsed", "positionMargin"):
-                if k in ms:
-                    try:
-                        margin_used = float(ms[k])
-                        break
-                    except Exception:
-                        pass
-        if equity is None and isinstance(data, dict):
-            for k in ("accountValue", "equity", "total"):
-                if k in data:
-                    try:
-                        equity = float(data[k])
-                        break
-                    except Exception:
-                        pass
-        if equity is None:
-            equity = 0.0
-
-        # --- positions ---
-        positions: Dict[str, float] = {}
-        arrays = []
-
-        if isinstance(data, dict):
-            for key in ("assetPositions", "positions"):
-                arr = data.get(key)
-                if isinstance(arr, list):
-                    arrays.append(arr)
-            if not arrays:
-                acct = data.get("account")
-                if isinstance(acct, dict):
-                    for key in ("assetPositions", "positions"):
-                        arr = acct.get(key)
-                        if isinstance(arr, list):
-                            arrays.append(arr)
-
-        def _f(v):
+        return parse_account_state(self.get_user_state(), self.address)
+
+
+class AsyncHyperliquidClient:
+    """asyncio variant of HyperliquidClient.
+
+    Each call runs the blocking request on a shared thread pool (reusing the
+    pooled keep-alive session), bounded by a semaphore and cut off after
+    `request_deadline` seconds. The deadline is also handed to the worker
+    thread, which will not wait on the rate limiter or send a request past
+    it, so a timed-out call does not go out late or hold up interpreter
+    exit. Pass the same `semaphore` / `executor` to every instance to cap
+    concurrency across all accounts in a run.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+        request_deadline: float = HL_REQUEST_TIMEOUT,
+        max_concurrency: int = 8,
+    ):
+        self.address = address
+        self.sync = HyperliquidClient(address)
+        self.semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+        self.executor = executor
+        self.request_deadline = request_deadline
+
+    async def _call(self, method: str, *args, **kwargs) -> Any:
+        return await self._submit(method, functools.partial(getattr(self.sync, method), *args, **kwargs))
+
+    async def _submit(self, name: str, fn, deadline_s: Optional[float] = None) -> Any:
+        deadline_s = self.request_deadline if deadline_s is None else deadline_s
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            bounded = _with_deadline(fn, time.monotonic() + deadline_s)
             try:
-                return float(v)
-            except Exception:
-                return 0.0
-
-        for arr in arrays:
-            for item in arr:
-                if not isinstance(item, dict):
-                    continue
-                pos = item.get("position") if "position" in item else item
-                if not isinstance(pos, dict):
-                    continue
-                sym = pos.get("coin") or pos.get("symbol")
-                szi = None
-                for k in ("szi", "size", "positionSize"):
-                    if k in pos:
-                        szi = pos[k]
-                        break
-                if sym is None or szi is None:
-                    continue
-                su = str(sym).strip().upper()
-                positions[su] = positions.get(su, 0.0) + _f(szi)
-
-        return {
-            "equity_usd": float(equity),
-            "margin_used_usd": float(margin_used) if margin_used is not None else None,
-            "positions": positions,
-            "meta": {"source": "sdk", "address": self.address},
-            "raw": data,
-        }
+                return await asyncio.wait_for(loop.run_in_executor(self.executor, bounded), timeout=deadline_s)
+            except (asyncio.TimeoutError, DeadlineExceeded):
+                logger.error(f"{name} for {self.address[:8]} exceeded {deadline_s:g}s deadline")
+                raise
+
+    async def run(self, fn, *args, budget_s: Optional[float] = None, **kwargs) -> Any:
+        """Run `fn(sync_client, *args)` (e.g. a paginated fetch) as one bounded call.
+
+        `budget_s` bounds the whole call (every request it makes); defaults to
+        `request_deadline`.
+        """
+        return await self._submit(fn.__name__, functools.partial(fn, self.sync, *args, **kwargs), budget_s)
+
+    async def get_user_fills(self) -> List[Dict[str, Any]]:
+        return await self._call("get_user_fills")
+
+    async def get_user_fills_by_time(self, start_time: int, end_time: int = None) -> List[Dict[str, Any]]:
+        return await self._call("get_user_fills_by_time", start_time, end_time)
+
+    async def get_open_orders(self) -> List[Dict[str, Any]]:
+        return await self._call("get_open_orders")
+
+    async def get_historical_orders(self) -> List[Dict[str, Any]]:
+        return await self._call("get_historical_orders")
+
+    async def get_user_state(self) -> Dict[str, Any]:
+        return await self._call("get_user_state")
+
+    async def get_meta_info(self) -> Dict[str, Any]:
+        return await self._call("get_meta_info")
+
+    async def get_meta_and_asset_ctxs(self) -> List[Any]:
+        return await self._call("get_meta_and_asset_ctxs")
+
+    async def get_all_mids(self) -> Dict[str, str]:
+        return await self._call("get_all_mids")
+
+    async def get_user_funding(self, start_time: int, end_time: int = None) -> List[Dict[str, Any]]:
+        return await self._call("get_user_funding", start_time, end_time)
+
+    async def get_user_non_funding_ledger_updates(self, start_time: int, end_time: int = None) -> List[Dict[str, Any]]:
+        return await self._call("get_user_non_funding_ledger_updates", start_time, end_time)
+
+    async def get_candles(self, coin: str, interval: str, start_time: int, end_time: int) -> List[Dict[str, Any]]:
+        return await self._call("get_candles", coin, interval, start_time, end_time)
+
+    async def fetch_account_state(self) -> Dict[str, Any]:
+        return await self._call("fetch_account_state")
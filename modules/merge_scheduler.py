@@ -0,0 +1,180 @@
+"""Targeted OPTIMIZE ... FINAL for the flush's ReplacingMergeTree tables.
+
+Instead of rewriting whole tables after every flush, the flush asks for the
+partitions its inserts touched. Partitions with a single active part have
+nothing to merge and are skipped. Small partitions are merged right away;
+partitions larger than `HL_MERGE_HEAVY_BYTES` are queued and merged in the
+off-peak window (`HL_MERGE_OFFPEAK_UTC`, hours `start-end`, UTC) by
+`scheduled_processes/run_deferred_merges.py`, or immediately if the flush
+itself runs off-peak.
+
+Queue and merge history live in `data/state/merges.sqlite`; every merge is
+logged with its duration, size and outcome so the cost can be watched.
+"""
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from clickhouse_driver import Client
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MERGE_STATE_PATH = os.path.join(PROJECT_ROOT, "data", "state", "merges.sqlite")
+MERGE_HEAVY_BYTES = int(os.getenv("HL_MERGE_HEAVY_BYTES", str(256 * 1024 * 1024)))
+MERGE_OFFPEAK_UTC = os.getenv("HL_MERGE_OFFPEAK_UTC", "2-6")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    target TEXT NOT NULL,
+    tbl TEXT NOT NULL,
+    partition_id TEXT NOT NULL,
+    requested_at REAL NOT NULL,
+    PRIMARY KEY (target, tbl, partition_id)
+);
+CREATE TABLE IF NOT EXISTS merge_log (
+    target TEXT NOT NULL,
+    tbl TEXT NOT NULL,
+    partition_id TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    seconds REAL NOT NULL,
+    bytes INTEGER,
+    parts INTEGER,
+    status TEXT NOT NULL,
+    error TEXT
+);
+"""
+
+
+def is_offpeak(now: Optional[datetime] = None, window: str = MERGE_OFFPEAK_UTC) -> bool:
+    hour = (now or datetime.now(timezone.utc)).hour
+    start, end = (int(h) for h in window.split("-", 1))
+    return start <= hour < end if start <= end else (hour >= start or hour < end)
+
+
+def _split(table: str) -> Tuple[str, str]:
+    db, _, name = table.rpartition(".")
+    return db or "default", name
+
+
+class MergeScheduler:
+    def __init__(self, path: str = DEFAULT_MERGE_STATE_PATH):
+        self.path = path
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def active_parts(client: Client, table: str) -> Dict[str, str]:
+        """Active part name -> partition id (a `system.parts` read, no table data)."""
+        db, name = _split(table)
+        rows = client.execute(
+            "SELECT name, partition_id FROM system.parts WHERE database = %(db)s AND table = %(name)s AND active",
+            {"db": db, "name": name},
+        )
+        return {r[0]: r[1] for r in rows}
+
+    def new_partitions(self, client: Client, table: str, before: Dict[str, str]) -> List[str]:
+        """Partitions holding active parts that are not in `before` (see `active_parts`).
+
+        Taken around a flush's inserts, that is the partitions it wrote to
+        (plus any a background merge rewrote meanwhile).
+        """
+        return sorted({pid for part, pid in self.active_parts(client, table).items() if part not in before})
+
+    @staticmethod
+    def _parts(client: Client, table: str, partitions: List[str]) -> Dict[str, Tuple[int, int]]:
+        """partition_id -> (active parts, bytes on disk)."""
+        db, name = _split(table)
+        rows = client.execute(
+            "SELECT partition_id, count(), sum(bytes_on_disk) FROM system.parts "
+            "WHERE database = %(db)s AND table = %(name)s AND active AND partition_id IN %(ids)s "
+            "GROUP BY partition_id",
+            {"db": db, "name": name, "ids": tuple(partitions)},
+        )
+        return {r[0]: (int(r[1]), int(r[2])) for r in rows}
+
+    def request(self, client: Client, target: str, table: str, partitions: List[str]) -> None:
+        """Merge the given partitions now if cheap (or off-peak), else queue them."""
+        if not partitions:
+            return
+        offpeak = is_offpeak()
+        for pid, (parts, nbytes) in sorted(self._parts(client, table, partitions).items()):
+            if parts < 2:
+                continue
+            if offpeak or nbytes <= MERGE_HEAVY_BYTES:
+                self.optimize(client, target, table, pid, parts, nbytes)
+            else:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO pending (target, tbl, partition_id, requested_at) VALUES (?, ?, ?, ?)",
+                        (target, table, pid, time.time()),
+                    )
+                print(f"[merge/{target}] {table} partition {pid} ({nbytes / 1e6:.0f} MB, {parts} parts) "
+                      f"deferred to the off-peak window ({MERGE_OFFPEAK_UTC} UTC)")
+
+    def optimize(self, client: Client, target: str, table: str, partition_id: str,
+                 parts: Optional[int] = None, nbytes: Optional[int] = None) -> float:
+        """OPTIMIZE one partition FINAL and log how long it took."""
+        sql = f"OPTIMIZE TABLE {table} FINAL" if partition_id == "all" else \
+            f"OPTIMIZE TABLE {table} PARTITION ID '{partition_id}' FINAL"
+        started = time.time()
+        status, error = "ok", None
+        try:
+            client.execute(sql)
+        except Exception as e:
+            status, error = "error", str(e)[:500]
+        seconds = time.time() - started
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO merge_log (target, tbl, partition_id, started_at, seconds, bytes, parts, status, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (target, table, partition_id, started, seconds, nbytes, parts, status, error),
+            )
+            if status == "ok":
+                conn.execute("DELETE FROM pending WHERE target = ? AND tbl = ? AND partition_id = ?",
+                             (target, table, partition_id))
+        if error:
+            print(f"[merge/{target}] Warning: OPTIMIZE {table} partition {partition_id} failed after {seconds:.1f}s: {error}")
+        else:
+            print(f"[merge/{target}] Optimized {table} partition {partition_id} in {seconds:.1f}s")
+        return seconds
+
+    def pending(self, target: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT target, tbl, partition_id FROM pending ORDER BY requested_at").fetchall()
+        return [r for r in rows if target in (None, r[0])]
+
+    def run_pending(self, target: str, client: Client) -> int:
+        """Merge every queued partition of `target`; returns how many were run."""
+        done = 0
+        for _, table, pid in self.pending(target):
+            stats = self._parts(client, table, [pid]).get(pid, (0, 0))
+            if stats[0] < 2:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM pending WHERE target = ? AND tbl = ? AND partition_id = ?",
+                                 (target, table, pid))
+                continue
+            self.optimize(client, target, table, pid, *stats)
+            done += 1
+        return done
+
+    def report(self, days: float = 7.0) -> List[Dict[str, Any]]:
+        """Per target and table: merges, failures, total and max seconds over the last `days`."""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "SELECT target, tbl, COUNT(*), SUM(status != 'ok'), SUM(seconds), MAX(seconds), SUM(bytes) "
+                "FROM merge_log WHERE started_at >= ? GROUP BY target, tbl ORDER BY SUM(seconds) DESC",
+                (time.time() - days * 86400,),
+            )
+            keys = ("target", "table", "merges", "failed", "total_s", "max_s", "bytes")
+            return [dict(zip(keys, r)) for r in cur.fetchall()]
@@ -0,0 +1,208 @@
+"""Disk cache for SQL results, invalidated by table changes rather than a TTL.
+
+The dashboard, the daily emails and the diagnosis scripts run the same
+expensive reads against chenlin (latest targets per (date, symbol), EOD
+snapshots, hourly Binance closes). `cached_query_df` stores each result as a
+parquet file under `data/cache/sql/`, keyed by target, whitespace-normalized
+SQL and params, together with a version of every `db.table` the query reads:
+active part count, newest part modification time and row count from
+`system.parts`. A later call (from any process) probes those versions with
+one metadata query and reuses the file while none of them changed; any
+insert, merge or mutation on a source table invalidates it.
+
+A query is cached only if every FROM/JOIN source is a `db.table` with parts
+or the name of one of its own CTEs. Anything else -- an unqualified table,
+a `system` table, a table function (`remote(...)`, `s3(...)`), `dictGet`/
+`joinGet`, a view, a dictionary, a table without parts -- cannot be
+versioned, so the query is run uncached. The cache is capped at
+`CLICKHOUSE_QUERY_CACHE_MAX_MB` (least recently used files go first) and can
+be turned off with `CLICKHOUSE_QUERY_CACHE_DISABLED=1`.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from modules.clickhouse_client import DEFAULT_TARGET, connection, query_df
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, "data", "cache", "sql")
+QUERY_CACHE_DISABLED = os.getenv("CLICKHOUSE_QUERY_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+QUERY_CACHE_MAX_MB = float(os.getenv("CLICKHOUSE_QUERY_CACHE_MAX_MB", "1024"))
+
+_SOURCE_KEYWORD_RE = re.compile(r"\b(?:(ARRAY\s+)?JOIN|FROM)\s*", re.IGNORECASE)
+# What follows FROM/JOIN: [db.]name, then "(" if it is a table function
+_SOURCE_RE = re.compile(r"(?:`?([A-Za-z_]\w*)`?\s*\.\s*)?`?([A-Za-z_]\w*)`?\s*(\()?")
+_CTE_RE = re.compile(r"(?:\bWITH|,)\s*`?([A-Za-z_]\w*)`?\s+AS\s*\(", re.IGNORECASE)
+_UNVERSIONED_FUNC_RE = re.compile(r"\b(?:dict\w*|joinGet\w*)\s*\(", re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_META_KEY = b"maicro_query_cache"
+
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(sql.split()).rstrip(";").strip()
+
+
+def source_tables(sql: str) -> Optional[List[Tuple[str, str]]]:
+    """The (db, table) sources after FROM/JOIN, or None if any source cannot be versioned.
+
+    A subquery is not a source itself (its own FROMs are); an unqualified
+    name counts only if it is a CTE of the query. Table functions, system
+    tables and dictionary/join lookups make the whole query unversioned.
+    """
+    sql = _STRING_RE.sub("''", _COMMENT_RE.sub(" ", sql))
+    if _UNVERSIONED_FUNC_RE.search(sql):
+        return None
+    ctes = {name.lower() for name in _CTE_RE.findall(sql)}
+    tables = set()
+    for kw in _SOURCE_KEYWORD_RE.finditer(sql):
+        if kw.group(1):  # ARRAY JOIN unfolds a column, not a source
+            continue
+        m = _SOURCE_RE.match(sql, kw.end())
+        if m is None:
+            if sql.startswith("(", kw.end()):  # subquery
+                continue
+            return None
+        db, name, call = m.groups()
+        if call or (db or "").lower() == "system":
+            return None
+        if db:
+            tables.add((db, name))
+        elif name.lower() not in ctes:
+            return None
+    return sorted(tables) or None
+
+
+def cache_key(sql: str, params: Optional[dict], target: str, columnar: bool = False) -> str:
+    payload = json.dumps([target, normalize_sql(sql), params or {}, columnar], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def table_versions(tables: Optional[List[Tuple[str, str]]], target: str = DEFAULT_TARGET) -> Optional[Dict[str, list]]:
+    """`db.table` -> [active parts, newest part modification time, rows], or None if any table has no parts."""
+    if not tables:
+        return None
+    with connection(target) as client:
+        rows = client.execute(
+            "SELECT database, table, count(), toUnixTimestamp(max(modification_time)), sum(rows) "
+            "FROM system.parts WHERE active AND (database, table) IN %(tables)s GROUP BY database, table",
+            {"tables": tuple(tables)},
+        )
+    versions = {f"{db}.{t}": [int(parts), int(mtime), int(nrows)] for db, t, parts, mtime, nrows in rows}
+    return versions if len(versions) == len(tables) else None
+
+
+class QueryCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_mb: float = QUERY_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def get(self, key: str, versions: Dict[str, list]) -> Optional[pd.DataFrame]:
+        """The cached frame if it was stored for exactly these table versions."""
+        path = self._path(key)
+        try:
+            meta = pq.read_schema(path).metadata or {}
+            if json.loads(meta.get(_META_KEY, b"{}")).get("versions") != versions:
+                return None
+            df = pq.read_table(path).to_pandas()
+        except (FileNotFoundError, OSError, ValueError, pa.ArrowException):
+            return None
+        os.utime(path)  # recency for eviction
+        return df
+
+    def put(self, key: str, versions: Dict[str, list], sql: str, df: pd.DataFrame) -> bool:
+        """Store a result; False if it cannot be written as parquet (e.g. mixed-type columns)."""
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            logger.info(f"Query result not cacheable: {e}")
+            return False
+        meta = dict(table.schema.metadata or {})
+        meta[_META_KEY] = json.dumps({"versions": versions, "sql": normalize_sql(sql)[:2000],
+                                      "stored_at": time.time()}).encode("utf-8")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(table.replace_schema_metadata(meta), tmp)
+        os.replace(tmp, path)
+        self.evict()
+        return True
+
+    def evict(self) -> int:
+        """Delete least recently used entries beyond the size cap; returns files removed."""
+        try:
+            entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith(".parquet")]
+        except FileNotFoundError:
+            return 0
+        stats = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries), reverse=True)
+        total, removed = 0, 0
+        for _, size, path in stats:
+            total += size
+            if total > self.max_bytes:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def clear(self) -> None:
+        for e in os.scandir(self.cache_dir) if os.path.isdir(self.cache_dir) else []:
+            if e.name.endswith(".parquet"):
+                os.remove(e.path)
+
+
+_default_cache: Optional[QueryCache] = None
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """Process-wide cache (None if disabled via CLICKHOUSE_QUERY_CACHE_DISABLED)."""
+    global _default_cache
+    if QUERY_CACHE_DISABLED:
+        return None
+    if _default_cache is None:
+        _default_cache = QueryCache()
+    return _default_cache
+
+
+def cached_query_df(
+    sql: str,
+    params: Optional[dict] = None,
+    target: str = DEFAULT_TARGET,
+    columnar: bool = False,
+) -> pd.DataFrame:
+    """`query_df`, served from the disk cache while the source tables are unchanged."""
+    cache = get_query_cache()
+    if cache is None:
+        return query_df(sql, params, target=target, columnar=columnar)
+    try:
+        versions = table_versions(source_tables(sql), target)
+    except Exception as e:
+        logger.warning(f"Query cache probe failed, running uncached: {e}")
+        versions = None
+    if versions is None:
+        return query_df(sql, params, target=target, columnar=columnar)
+
+    key = cache_key(sql, params, target, columnar)
+    df = cache.get(key, versions)
+    if df is not None:
+        return df
+    df = query_df(sql, params, target=target, columnar=columnar)
+    try:
+        cache.put(key, versions, sql, df)
+    except Exception as e:
+        logger.warning(f"Could not cache query result: {e}")
+    return df
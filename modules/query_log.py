@@ -0,0 +1,397 @@
+"""Per-query instrumentation and the `maicro_monitors.query_log` table.
+
+`query_df`, `execute` and `insert_columns`/`insert_df` in
+modules/clickhouse_client.py wrap each statement in `track_query`, which
+records wall time, rows/bytes read and written (the driver's progress
+packets), result rows/bytes (profile info), the calling module and
+function, and a fingerprint of the statement with literals stripped, so the
+same query with different dates or symbol lists groups together.
+
+Records are buffered in memory and written in batches
+(`CLICKHOUSE_QUERY_LOG_BATCH_ROWS`, or every `CLICKHOUSE_QUERY_LOG_FLUSH_S`,
+and at exit) to `maicro_monitors.query_log` on `CLICKHOUSE_QUERY_LOG_TARGET`
+through a dedicated connection, so logging never takes a slot from the
+pools. Writes happen on a daemon thread, never in the thread that ran the
+query; at exit the final flush is given `CLICKHOUSE_QUERY_LOG_EXIT_WAIT_S`
+and then abandoned. While that target is unreachable batches go to
+`data/state/query_log.sqlite` and are sent with the next successful write.
+`CLICKHOUSE_QUERY_LOG_DISABLED=1` turns it all off.
+
+`scripts/query_log_report.py` ranks fingerprints by total time or bytes.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import re
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from clickhouse_driver import Client
+
+from config.settings import CLICKHOUSE_TARGETS
+from modules.stats import nearest_rank_sql, percentile
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_QUERY_LOG_PATH = os.path.join(PROJECT_ROOT, "data", "state", "query_log.sqlite")
+QUERY_LOG_TABLE = "maicro_monitors.query_log"
+QUERY_LOG_DISABLED = os.getenv("CLICKHOUSE_QUERY_LOG_DISABLED", "").lower() in ("1", "true", "yes")
+QUERY_LOG_TARGET = os.getenv("CLICKHOUSE_QUERY_LOG_TARGET", "local")
+QUERY_LOG_BATCH_ROWS = int(os.getenv("CLICKHOUSE_QUERY_LOG_BATCH_ROWS", "200"))
+QUERY_LOG_FLUSH_S = float(os.getenv("CLICKHOUSE_QUERY_LOG_FLUSH_S", "60"))
+# After a failed write, spill locally for this long before trying ClickHouse again
+QUERY_LOG_RETRY_S = float(os.getenv("CLICKHOUSE_QUERY_LOG_RETRY_S", "300"))
+# How long interpreter exit waits for the last flush
+QUERY_LOG_EXIT_WAIT_S = float(os.getenv("CLICKHOUSE_QUERY_LOG_EXIT_WAIT_S", "5"))
+REPORT_PCT = 95
+
+_HOST = socket.gethostname()
+
+COLUMNS = [
+    "event_time", "host", "target", "kind", "caller_module", "caller_function", "fingerprint", "query",
+    "duration_ms", "rows_read", "bytes_read", "rows_written", "bytes_written", "result_rows", "result_bytes",
+    "exception",
+]
+
+_DDL = f"""
+CREATE TABLE IF NOT EXISTS {QUERY_LOG_TABLE} (
+    event_time DateTime64(3),
+    host LowCardinality(String),
+    target LowCardinality(String),
+    kind LowCardinality(String),
+    caller_module LowCardinality(String),
+    caller_function LowCardinality(String),
+    fingerprint UInt64,
+    query String,
+    duration_ms Float64,
+    rows_read UInt64,
+    bytes_read UInt64,
+    rows_written UInt64,
+    bytes_written UInt64,
+    result_rows UInt64,
+    result_bytes UInt64,
+    exception String
+) ENGINE = MergeTree()
+PARTITION BY toYYYYMM(event_time)
+ORDER BY (event_time, fingerprint)
+TTL toDateTime(event_time) + INTERVAL 90 DAY
+"""
+
+_SQLITE_SCHEMA = f"CREATE TABLE IF NOT EXISTS pending ({', '.join(COLUMNS)})"
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+# Frames in these files are skipped when looking for the caller
+_INTERNAL_FILES = {
+    os.path.join(PROJECT_ROOT, "modules", name)
+    for name in ("clickhouse_client.py", "query_log.py", "query_cache.py")
+}
+
+
+def normalize_query(sql: str) -> str:
+    """Statement with comments dropped, literals replaced by `?` and `IN` lists collapsed."""
+    sql = _COMMENT_RE.sub(" ", sql)
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _LIST_RE.sub("(?)", sql)
+    return " ".join(sql.split()).rstrip(";").strip()
+
+
+def fingerprint(sql: str) -> int:
+    """UInt64 hash of `normalize_query(sql)`."""
+    digest = hashlib.blake2b(normalize_query(sql).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def caller() -> Tuple[str, str]:
+    """(module, function) of the nearest frame outside the ClickHouse helpers."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        path = os.path.abspath(frame.f_code.co_filename)
+        if path not in _INTERNAL_FILES and os.sep + "contextlib.py" not in path:
+            module = frame.f_globals.get("__name__", "")
+            if module == "__main__" and path.startswith(PROJECT_ROOT):
+                module = os.path.splitext(os.path.relpath(path, PROJECT_ROOT))[0].replace(os.sep, ".")
+            return module, frame.f_code.co_name
+        frame = frame.f_back
+    return "", ""
+
+
+class QueryLog:
+    """Buffers query records and writes them to ClickHouse in batches (sqlite while it is down).
+
+    `record` only appends; batches are written by a background daemon
+    thread, woken when a batch is full or `flush_s` has passed. `flush`
+    writes synchronously and `close` stops the thread with a bounded wait.
+    """
+
+    def __init__(
+        self,
+        target: str = QUERY_LOG_TARGET,
+        path: str = DEFAULT_QUERY_LOG_PATH,
+        batch_rows: int = QUERY_LOG_BATCH_ROWS,
+        flush_s: float = QUERY_LOG_FLUSH_S,
+    ):
+        self.target = target
+        self.path = path
+        self.batch_rows = batch_rows
+        self.flush_s = flush_s
+        self._rows: List[tuple] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._last_flush = time.time()
+        self._down_until = 0.0
+        self._client: Optional[Client] = None
+        self._table_ready = False
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, row: tuple) -> None:
+        with self._lock:
+            self._rows.append(row)
+            due = len(self._rows) >= self.batch_rows or time.time() - self._last_flush >= self.flush_s
+            # Started lazily, and again in a forked child (threads do not survive fork)
+            if not self._closed and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="query-log-flush", daemon=True)
+                self._thread.start()
+        if due:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_s)
+            self._wake.clear()
+            closed = self._closed
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Query log flush failed: {e}")
+            if closed:
+                return
+
+    def close(self, timeout: float = QUERY_LOG_EXIT_WAIT_S) -> None:
+        """Stop the flush thread after a last flush, waiting at most `timeout` seconds for it."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            self.flush()
+            return
+        self._wake.set()
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"Query log flush to {self.target} still running after {timeout:g}s; abandoning it")
+
+    def flush(self) -> None:
+        """Write buffered records (and any spilled backlog); spill them locally if that fails."""
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._last_flush = time.time()
+        if not rows:
+            return
+        if time.time() < self._down_until:
+            self._spill(rows)
+            return
+        with self._write_lock:
+            try:
+                self._write(rows)
+            except Exception as e:
+                logger.warning(f"Query log write to {self.target} failed, keeping {len(rows)} records locally: {e}")
+                self._mark_down()
+                self._spill(rows)
+                return
+            try:
+                self._drain()
+            except Exception as e:
+                logger.warning(f"Sending spilled query log records to {self.target} failed: {e}")
+                self._mark_down()
+
+    def _mark_down(self) -> None:
+        self._down_until = time.time() + QUERY_LOG_RETRY_S
+        if self._client is not None:
+            self._client.disconnect()
+
+    def _write(self, rows: List[tuple]) -> None:
+        if self._client is None:
+            self._client = Client(**CLICKHOUSE_TARGETS[self.target])
+        if not self._table_ready:
+            self._client.execute(_DDL)
+            self._table_ready = True
+        self._client.execute(f"INSERT INTO {QUERY_LOG_TABLE} ({', '.join(COLUMNS)}) VALUES", rows)
+
+    @staticmethod
+    def _to_sqlite(row: tuple) -> tuple:
+        return (row[0].timestamp(),) + row[1:6] + (str(row[6]),) + row[7:]
+
+    @staticmethod
+    def _from_sqlite(row: tuple) -> tuple:
+        return (datetime.fromtimestamp(row[0], timezone.utc),) + tuple(row[1:6]) + (int(row[6]),) + tuple(row[7:])
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute(_SQLITE_SCHEMA)
+        return conn
+
+    def _spill(self, rows: List[tuple]) -> None:
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(f"INSERT INTO pending VALUES ({', '.join('?' * len(COLUMNS))})",
+                                 [self._to_sqlite(r) for r in rows])
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Dropping {len(rows)} query log records: {e}")
+
+    def _drain(self, batch: int = 10_000) -> None:
+        """Send the locally spilled backlog, oldest first."""
+        if not os.path.exists(self.path):
+            return
+        conn = self._connect()
+        try:
+            while True:
+                pending = conn.execute(f"SELECT rowid, * FROM pending ORDER BY rowid LIMIT {batch}").fetchall()
+                if not pending:
+                    return
+                self._write([self._from_sqlite(r[1:]) for r in pending])
+                with conn:
+                    conn.execute("DELETE FROM pending WHERE rowid <= ?", (pending[-1][0],))
+                logger.info(f"Sent {len(pending)} spilled query log records to {self.target}")
+        finally:
+            conn.close()
+
+    def pending_rows(self) -> List[tuple]:
+        """The locally spilled records, as they would be inserted."""
+        if not os.path.exists(self.path):
+            return []
+        conn = self._connect()
+        try:
+            return [self._from_sqlite(r) for r in conn.execute("SELECT * FROM pending ORDER BY rowid")]
+        finally:
+            conn.close()
+
+
+# --by choice -> report key; each is also a column alias of `top_queries`, distinct from
+# the table's own column names (an alias that shadows a column would nest the aggregates).
+REPORT_ORDER = {"time": "total_s", "bytes": "total_bytes_read", "written": "total_bytes_written", "calls": "calls"}
+_REPORT_KEYS = ("fingerprint", "query", "callers", "calls", "errors", "total_s", "p95_ms", "max_ms",
+                "total_rows_read", "total_bytes_read", "total_bytes_written")
+
+
+def top_queries(client: Client, days: float = 7.0, by: str = "time", limit: int = 20) -> List[Dict[str, Any]]:
+    """Fingerprints ranked by total time (or bytes read/written, calls) over the last `days`."""
+    rows = client.execute(
+        f"SELECT fingerprint, any(query), arrayStringConcat(groupUniqArray(5)(concat(caller_module, '.', caller_function)), ', '), "
+        f"count() AS calls, countIf(exception != ''), sum(duration_ms) / 1000 AS total_s, "
+        f"{nearest_rank_sql('duration_ms', REPORT_PCT)}, max(duration_ms), sum(rows_read) AS total_rows_read, "
+        "sum(bytes_read) AS total_bytes_read, sum(bytes_written) AS total_bytes_written "
+        f"FROM {QUERY_LOG_TABLE} WHERE event_time >= now() - toIntervalSecond(%(s)s) "
+        f"GROUP BY fingerprint ORDER BY {REPORT_ORDER[by]} DESC LIMIT %(limit)s",
+        {"s": int(days * 86400), "limit": limit},
+    )
+    return [dict(zip(_REPORT_KEYS, r)) for r in rows]
+
+
+def top_pending_queries(log: QueryLog, days: float = 7.0, by: str = "time", limit: int = 20) -> List[Dict[str, Any]]:
+    """`top_queries` over the locally spilled records (when ClickHouse is unreachable)."""
+    cutoff = time.time() - days * 86400
+    groups: Dict[int, Dict[str, Any]] = {}
+    for row in log.pending_rows():
+        r = dict(zip(COLUMNS, row))
+        if r["event_time"].timestamp() < cutoff:
+            continue
+        g = groups.setdefault(r["fingerprint"], {
+            "fingerprint": r["fingerprint"], "query": r["query"], "callers": set(), "durations": [],
+            "total_rows_read": 0, "total_bytes_read": 0, "total_bytes_written": 0, "errors": 0,
+        })
+        g["callers"].add(f"{r['caller_module']}.{r['caller_function']}")
+        g["durations"].append(r["duration_ms"])
+        g["errors"] += bool(r["exception"])
+        for key in ("rows_read", "bytes_read", "bytes_written"):
+            g[f"total_{key}"] += r[key]
+    out = []
+    for g in groups.values():
+        durations = sorted(g.pop("durations"))
+        g.update(callers=", ".join(sorted(g["callers"])[:5]), calls=len(durations), total_s=sum(durations) / 1000,
+                 p95_ms=percentile(durations, REPORT_PCT), max_ms=durations[-1])
+        out.append({k: g[k] for k in _REPORT_KEYS})
+    return sorted(out, key=lambda r: r[REPORT_ORDER[by]], reverse=True)[:limit]
+
+
+_default_log: Optional[QueryLog] = None
+_default_log_lock = threading.Lock()
+
+
+def get_query_log() -> Optional[QueryLog]:
+    """Process-wide log (None if disabled via CLICKHOUSE_QUERY_LOG_DISABLED); flushed at exit."""
+    global _default_log
+    if QUERY_LOG_DISABLED:
+        return None
+    with _default_log_lock:
+        if _default_log is None:
+            _default_log = QueryLog()
+            atexit.register(_default_log.close)
+        return _default_log
+
+
+class _Tracked:
+    __slots__ = ("info",)
+
+    def __init__(self):
+        self.info = None
+
+    def done(self, client: Client) -> None:
+        """Take the driver's progress/profile counters for the statement just run on `client`."""
+        self.info = client.last_query
+
+
+def _counters(info: Any) -> Tuple[int, int, int, int, int, int]:
+    progress = getattr(info, "progress", None)
+    profile = getattr(info, "profile_info", None)
+    return (
+        getattr(progress, "rows", 0) or 0,
+        getattr(progress, "bytes", 0) or 0,
+        getattr(progress, "written_rows", 0) or 0,
+        getattr(progress, "written_bytes", 0) or 0,
+        getattr(profile, "rows", 0) or 0,
+        getattr(profile, "bytes", 0) or 0,
+    )
+
+
+@contextmanager
+def track_query(kind: str, sql: str, target: str) -> Iterator[_Tracked]:
+    """Time the block and log it; call `.done(client)` right after the statement runs."""
+    log = get_query_log()
+    tracked = _Tracked()
+    if log is None:
+        yield tracked
+        return
+    started = time.perf_counter()
+    error = ""
+    try:
+        yield tracked
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"[:1000]
+        raise
+    finally:
+        try:
+            module, function = caller()
+            log.record((
+                datetime.now(timezone.utc), _HOST, target, kind, module, function,
+                fingerprint(sql), normalize_query(sql)[:4000], (time.perf_counter() - started) * 1000,
+                *_counters(tracked.info), error,
+            ))
+        except Exception as e:
+            logger.debug(f"Query log record failed: {e}")
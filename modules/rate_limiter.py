@@ -0,0 +1,174 @@
+"""Weighted token-bucket rate limiter shared by every Hyperliquid caller.
+
+Hyperliquid meters REST traffic by *weight* per IP (1200 per minute), not
+by request count. The bucket state lives in a small JSON file guarded by an
+`fcntl` lock, so the ping, the backfill and any ad-hoc script running on the
+same box draw from one budget instead of each assuming it has the full quota.
+
+On 429/5xx responses the limiter blocks every caller for an exponentially
+growing backoff window; successful responses shrink it again. The state file
+is only rewritten when a call changes it, and weight charged after a
+response is carried in-process and debited with the next `acquire`, so a
+request costs one locked write rather than three.
+"""
+import fcntl
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STATE_PATH = os.path.join(PROJECT_ROOT, "data", "state", "hl_rate_limit.json")
+
+HL_WEIGHT_PER_MINUTE = float(os.getenv("HL_WEIGHT_PER_MINUTE", "1200"))
+# Fraction of the exchange limit we allow ourselves, leaving headroom for
+# anything else sharing the IP.
+HL_WEIGHT_BUDGET_FRACTION = float(os.getenv("HL_WEIGHT_BUDGET_FRACTION", "0.8"))
+HL_RATE_LIMIT_DISABLED = os.getenv("HL_RATE_LIMIT_DISABLED", "").lower() in ("1", "true", "yes")
+
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+
+# /info request weights (https://hyperliquid.gitbook.io/hyperliquid-docs/ → rate limits).
+_LIGHT_TYPES = {"l2Book", "allMids", "clearinghouseState", "orderStatus",
+                "spotClearinghouseState", "exchangeStatus"}
+_HEAVY_TYPES = {"userRole": 60}
+DEFAULT_INFO_WEIGHT = 20
+
+# Endpoints that cost an extra unit of weight per N items returned.
+_ITEM_WEIGHT_DIVISOR = {
+    "userFills": 20,
+    "userFillsByTime": 20,
+    "historicalOrders": 20,
+    "userFunding": 20,
+    "userNonFundingLedgerUpdates": 20,
+    "fundingHistory": 20,
+    "recentTrades": 20,
+    "candleSnapshot": 60,
+}
+
+
+def request_weight(payload: Dict[str, Any]) -> int:
+    """Up-front weight of an /info request."""
+    req_type = payload.get("type", "")
+    if req_type in _LIGHT_TYPES:
+        return 2
+    return _HEAVY_TYPES.get(req_type, DEFAULT_INFO_WEIGHT)
+
+
+def response_weight(payload: Dict[str, Any], response: Any) -> int:
+    """Additional weight charged after the fact for item-heavy responses."""
+    divisor = _ITEM_WEIGHT_DIVISOR.get(payload.get("type", ""))
+    if not divisor or not isinstance(response, list):
+        return 0
+    return len(response) // divisor
+
+
+class SharedRateLimiter:
+    """Token bucket persisted to `state_path`, safe across threads and processes."""
+
+    def __init__(
+        self,
+        weight_per_minute: float = HL_WEIGHT_PER_MINUTE * HL_WEIGHT_BUDGET_FRACTION,
+        state_path: str = DEFAULT_STATE_PATH,
+    ):
+        self.capacity = float(weight_per_minute)
+        self.refill_per_s = self.capacity / 60.0
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        # Weight charged after the fact, debited with the next state write
+        self._debt = 0.0
+
+    @contextmanager
+    def _locked_state(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with self._lock, open(self.state_path + ".lock", "a") as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.state_path, "r") as f:
+                        state = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    state = {}
+                now = time.time()
+                tokens = float(state.get("tokens", self.capacity))
+                updated = float(state.get("updated", now))
+                state["tokens"] = min(self.capacity, tokens + max(0.0, now - updated) * self.refill_per_s)
+                state["updated"] = now
+                state.setdefault("blocked_until", 0.0)
+                state.setdefault("backoff_s", 0.0)
+                before = dict(state)
+                yield state
+                if self._debt:
+                    state["tokens"] -= self._debt
+                    self._debt = 0.0
+                if state == before:
+                    # Refill is recomputed from the stored values; nothing to persist.
+                    return
+                tmp = f"{self.state_path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp, self.state_path)
+            finally:
+                fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+    def acquire(self, weight: float, max_wait: Optional[float] = None) -> float:
+        """Block until `weight` tokens are available; return seconds waited.
+
+        Raises TimeoutError instead of waiting past `max_wait` seconds.
+        """
+        weight = min(float(weight), self.capacity)
+        waited = 0.0
+        while True:
+            with self._locked_state() as state:
+                now = state["updated"]
+                if now < state["blocked_until"]:
+                    delay = state["blocked_until"] - now
+                elif state["tokens"] - self._debt >= weight:
+                    state["tokens"] -= weight
+                    return waited
+                else:
+                    delay = (weight - state["tokens"] + self._debt) / self.refill_per_s
+            if max_wait is not None and waited + delay > max_wait:
+                raise TimeoutError(f"rate limiter wait of {delay:.1f}s exceeds the {max_wait:.1f}s left")
+            time.sleep(delay)
+            waited += delay
+
+    def charge(self, weight: float) -> None:
+        """Debit weight after the fact (may push the bucket negative) with the next state write."""
+        if weight <= 0:
+            return
+        with self._lock:
+            self._debt += float(weight)
+
+    def report(self, status: Optional[int]) -> None:
+        """Feed back a response status: 429/5xx widen the shared backoff."""
+        throttled = status == 429 or (status is not None and status >= 500)
+        if not throttled:
+            with self._locked_state() as state:
+                if state["backoff_s"]:
+                    state["backoff_s"] = state["backoff_s"] / 2 if state["backoff_s"] > BACKOFF_BASE_S else 0.0
+            return
+        with self._locked_state() as state:
+            backoff = min(BACKOFF_MAX_S, max(BACKOFF_BASE_S, state["backoff_s"] * 2))
+            state["backoff_s"] = backoff
+            until = state["updated"] + backoff * (1 + random.random() * 0.25)
+            state["blocked_until"] = max(state["blocked_until"], until)
+            # Assume the exchange's view of our budget is exhausted.
+            state["tokens"] = min(state["tokens"], 0.0)
+
+
+_default_limiter: Optional[SharedRateLimiter] = None
+
+
+def get_rate_limiter() -> Optional[SharedRateLimiter]:
+    """Process-wide limiter backed by the shared state file (None if disabled)."""
+    global _default_limiter
+    if HL_RATE_LIMIT_DISABLED:
+        return None
+    if _default_limiter is None:
+        _default_limiter = SharedRateLimiter()
+    return _default_limiter
@@ -0,0 +1,84 @@
+"""TTL disk cache for slow-changing Hyperliquid /info responses.
+
+Only request types listed in the TTL table are cached (exchange metadata by
+default); per-account and market data always go to the API. Entries are
+keyed by a hash of the request payload and stored as JSON under
+`data/cache/hl/`, together with a content hash of the response so callers can
+tell whether anything actually changed.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, "data", "cache", "hl")
+
+HL_RESPONSE_CACHE_DISABLED = os.getenv("HL_RESPONSE_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+# Seconds each request type may be served from disk.
+DEFAULT_TTLS: Dict[str, float] = {
+    "meta": float(os.getenv("HL_CACHE_TTL_META", str(24 * 3600))),
+    "spotMeta": float(os.getenv("HL_CACHE_TTL_SPOT_META", str(24 * 3600))),
+}
+
+
+def _canonical(obj: Any) -> bytes:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def content_hash(data: Any) -> str:
+    """Stable hash of a JSON-able response (key order does not matter)."""
+    return hashlib.sha256(_canonical(data)).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttls: Optional[Dict[str, float]] = None):
+        self.cache_dir = cache_dir
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+
+    def ttl_for(self, payload: Dict[str, Any]) -> Optional[float]:
+        return self.ttls.get(payload.get("type", ""))
+
+    def _path(self, payload: Dict[str, Any]) -> str:
+        key = hashlib.sha256(_canonical(payload)).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{payload.get('type', 'info')}_{key}.json")
+
+    def get(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the cached entry ({fetched_at, content_hash, data}) if still fresh."""
+        ttl = self.ttl_for(payload)
+        if ttl is None:
+            return None
+        try:
+            with open(self._path(payload), "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - float(entry.get("fetched_at", 0)) > ttl:
+            return None
+        return entry
+
+    def put(self, payload: Dict[str, Any], data: Any) -> str:
+        """Store a fresh response and return its content hash."""
+        digest = content_hash(data)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(payload)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"fetched_at": time.time(), "content_hash": digest, "data": data}, f)
+        os.replace(tmp, path)
+        return digest
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide cache (None if disabled via HL_RESPONSE_CACHE_DISABLED)."""
+    global _default_cache
+    if HL_RESPONSE_CACHE_DISABLED:
+        return None
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
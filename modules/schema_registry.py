@@ -0,0 +1,179 @@
+"""Cached ClickHouse table schemas, per target.
+
+The flush, the Cloud down-sync and the dashboard all need column lists of
+the same few tables. Looking them up on every run costs a metadata round
+trip per table and target, and on ClickHouse Cloud wakes an idle service
+for nothing. The registry keeps each (target, table) column list in memory
+and in `data/state/schemas.sqlite` for `HL_SCHEMA_TTL_S` (default 24h),
+together with a short version hash of the (name, type) list, so a refresh
+can tell whether the table actually changed.
+
+Callers refresh early with `refresh=True` when ClickHouse rejects a
+statement with a schema error (see `is_schema_error`), e.g. after a column
+was added or retyped, instead of waiting for the TTL.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from clickhouse_driver import Client
+from clickhouse_driver.errors import ErrorCodes
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCHEMA_CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "state", "schemas.sqlite")
+SCHEMA_TTL_S = float(os.getenv("HL_SCHEMA_TTL_S", str(24 * 3600)))
+
+# Error codes meaning "the table is not shaped the way we think it is".
+SCHEMA_ERROR_CODES = {
+    ErrorCodes.THERE_IS_NO_COLUMN,
+    ErrorCodes.NOT_FOUND_COLUMN_IN_BLOCK,
+    ErrorCodes.NO_SUCH_COLUMN_IN_TABLE,
+    ErrorCodes.NUMBER_OF_COLUMNS_DOESNT_MATCH,
+    ErrorCodes.INCORRECT_NUMBER_OF_COLUMNS,
+    ErrorCodes.UNKNOWN_IDENTIFIER,
+    ErrorCodes.TYPE_MISMATCH,
+    ErrorCodes.UNKNOWN_TABLE,
+}
+
+# Columns that cannot be named in an INSERT.
+_COMPUTED_KINDS = {"MATERIALIZED", "ALIAS", "EPHEMERAL"}
+
+Column = Tuple[str, str, str]  # name, type, default_kind
+
+
+def is_schema_error(e: Exception) -> bool:
+    """True if `e` is a ClickHouse error caused by a stale column list."""
+    return getattr(e, "code", None) in SCHEMA_ERROR_CODES
+
+
+def schema_version(columns: List[Column]) -> str:
+    payload = "\n".join(f"{name} {type_}" for name, type_, _ in columns)
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+def _split(table: str) -> Tuple[str, str]:
+    db, _, name = table.rpartition(".")
+    return db or "default", name
+
+
+class SchemaRegistry:
+    def __init__(self, path: str = DEFAULT_SCHEMA_CACHE_PATH, ttl_s: float = SCHEMA_TTL_S):
+        self.path = path
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        # (target, table) -> (fetched_at, version, columns)
+        self._memo: Dict[Tuple[str, str], Tuple[float, str, List[Column]]] = {}
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS schemas ("
+                " target TEXT NOT NULL, tbl TEXT NOT NULL, version TEXT NOT NULL,"
+                " columns TEXT NOT NULL, fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (target, tbl))"
+            )
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _fetch(client: Client, table: str) -> List[Column]:
+        db, name = _split(table)
+        rows = client.execute(
+            "SELECT name, type, default_kind FROM system.columns "
+            "WHERE database = %(db)s AND table = %(name)s ORDER BY position",
+            {"db": db, "name": name},
+        )
+        return [(r[0], r[1], r[2] or "") for r in rows]
+
+    def _cached(self, target: str, table: str) -> Optional[Tuple[float, str, List[Column]]]:
+        entry = self._memo.get((target, table))
+        if entry is None:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT fetched_at, version, columns FROM schemas WHERE target = ? AND tbl = ?",
+                    (target, table),
+                ).fetchone()
+            if row is not None:
+                entry = (row[0], row[1], [tuple(c) for c in json.loads(row[2])])
+                self._memo[(target, table)] = entry
+        return entry
+
+    def describe(self, client: Client, target: str, table: str, refresh: bool = False) -> List[Column]:
+        """(name, type, default_kind) of every column of `table` on `target`, in table order.
+
+        Served from the cache while younger than the TTL; otherwise read from
+        `system.columns` through `client`. A missing table gives [] and is not
+        cached.
+        """
+        with self._lock:
+            entry = None if refresh else self._cached(target, table)
+            if entry is not None and time.time() - entry[0] < self.ttl_s:
+                return entry[2]
+            previous = self._memo.get((target, table))
+            columns = self._fetch(client, table)
+            if not columns:
+                self._forget(target, table)
+                return []
+            version = schema_version(columns)
+            if previous is not None and previous[1] != version:
+                print(f"[schema/{target}] {table} changed ({previous[1]} -> {version})")
+            fetched_at = time.time()
+            self._memo[(target, table)] = (fetched_at, version, columns)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO schemas (target, tbl, version, columns, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    (target, table, version, json.dumps(columns), fetched_at),
+                )
+            return columns
+
+    def columns(self, client: Client, target: str, table: str, refresh: bool = False) -> List[Tuple[str, str]]:
+        """(name, type) pairs, in table order."""
+        return [(name, type_) for name, type_, _ in self.describe(client, target, table, refresh)]
+
+    def insert_columns(self, client: Client, target: str, table: str, refresh: bool = False) -> List[str]:
+        """Names an INSERT can list (no MATERIALIZED/ALIAS columns), in table order."""
+        return [name for name, _, kind in self.describe(client, target, table, refresh) if kind not in _COMPUTED_KINDS]
+
+    def column_type(self, client: Client, target: str, table: str, column: str) -> Optional[str]:
+        return dict(self.columns(client, target, table)).get(column)
+
+    def version(self, target: str, table: str) -> Optional[str]:
+        """Version hash of the cached schema, or None if nothing is cached."""
+        with self._lock:
+            entry = self._cached(target, table)
+        return entry[1] if entry else None
+
+    def invalidate(self, target: Optional[str] = None, table: Optional[str] = None) -> None:
+        """Drop cached schemas (all of them by default) so the next lookup re-reads them."""
+        with self._lock:
+            self._forget(target, table)
+
+    def _forget(self, target: Optional[str], table: Optional[str]) -> None:
+        for key in [k for k in self._memo if target in (None, k[0]) and table in (None, k[1])]:
+            del self._memo[key]
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM schemas WHERE (? IS NULL OR target = ?) AND (? IS NULL OR tbl = ?)",
+                (target, target, table, table),
+            )
+
+
+_registry = None
+
+
+def get_registry() -> SchemaRegistry:
+    """The process-wide registry (shared by the flush threads, down-sync and dashboard)."""
+    global _registry
+    if _registry is None:
+        _registry = SchemaRegistry()
+    return _registry
@@ -0,0 +1,174 @@
+"""Persistent index of natural keys already delivered to ClickHouse.
+
+The ping re-fetches full order histories (and full fill histories when a
+cursor is reset), so most buffered trade/order/funding/ledger rows are
+already in ClickHouse. The flush checks each chunk against this index and
+only sends rows whose key it has not delivered before.
+
+Keys are stored as 64-bit hashes in a small SQLite table
+(`data/state/seen_keys.sqlite`), one row per (prefix, key). The address is
+part of every key except orders (oids are exchange-wide): a fill, transfer or
+funding payment between two tracked accounts shows up under both, with the
+same tid/hash/time. Keys older than `HL_SEEN_KEYS_RETENTION_DAYS` are pruned;
+a pruned key that comes back is simply inserted again and collapsed by the
+ReplacingMergeTree.
+
+Keys are tracked per target (`trades@local`, `trades@remote`) so a row that
+reached one target but not the other is still sent to the other; keys stored
+under the bare prefix (before per-target tracking) count for every target.
+
+The flush also records the hash of each inserted row's *table* key (the
+ReplacingMergeTree ORDER BY, `record_table_keys`); a repeat there is what
+tells it a partition needs a FINAL merge.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+import pyarrow as pa
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SEEN_KEYS_PATH = os.path.join(PROJECT_ROOT, "data", "state", "seen_keys.sqlite")
+SEEN_KEYS_RETENTION_DAYS = float(os.getenv("HL_SEEN_KEYS_RETENTION_DAYS", "90"))
+
+# Buffer prefix -> natural key columns.
+KEY_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "trades": ("address", "tid"),
+    "orders": ("oid", "status", "timestamp"),
+    "funding": ("address", "time", "coin"),
+    "ledger": ("address", "hash"),
+}
+
+
+def _key_values(table: pa.Table, columns: Tuple[str, ...]) -> List[list]:
+    out = []
+    for col in columns:
+        arr = table.column(col)
+        if pa.types.is_timestamp(arr.type):
+            arr = arr.cast(pa.timestamp("ms"), safe=False).cast(pa.int64())
+        out.append(arr.to_pylist())
+    return out
+
+
+def row_hashes(table: pa.Table, columns: Tuple[str, ...]) -> List[int]:
+    """Signed 64-bit hash of each row's key (fits an SQLite INTEGER)."""
+    hashes = []
+    for parts in zip(*_key_values(table, columns)):
+        digest = hashlib.blake2b("\x1f".join(map(str, parts)).encode(), digest_size=8).digest()
+        hashes.append(int.from_bytes(digest, "big", signed=True))
+    return hashes
+
+
+def _namespace(prefix: str, target: Optional[str]) -> str:
+    return f"{prefix}@{target}" if target else prefix
+
+
+class SeenKeyIndex:
+    def __init__(self, path: str = DEFAULT_SEEN_KEYS_PATH):
+        self.path = path
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen ("
+                " prefix TEXT NOT NULL, h INTEGER NOT NULL, seen_at REAL NOT NULL,"
+                " PRIMARY KEY (prefix, h)) WITHOUT ROWID"
+            )
+            yield conn
+        finally:
+            conn.close()
+
+    def filter_new(self, prefix: str, table: pa.Table, pending: Optional[Set[int]] = None,
+                   target: Optional[str] = None) -> Tuple[pa.Table, List[int]]:
+        """Drop rows already delivered (to `target`), repeated within `table`, or in `pending`.
+
+        Returns the remaining rows and their key hashes, to `mark` once the
+        rows are safely inserted. `pending` (keys of rows filtered earlier but
+        not yet inserted) is updated in place. Prefixes without a key pass through.
+        """
+        columns = KEY_COLUMNS.get(prefix)
+        if not columns or table.num_rows == 0 or any(c not in table.column_names for c in columns):
+            return table, []
+
+        hashes = row_hashes(table, columns)
+        with self._connect() as conn:
+            conn.execute("CREATE TEMP TABLE batch (h INTEGER PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO batch (h) VALUES (?)", ((h,) for h in hashes))
+            seen = {r[0] for r in conn.execute(
+                "SELECT s.h FROM seen s JOIN batch b ON s.h = b.h WHERE s.prefix IN (?, ?)",
+                (prefix, _namespace(prefix, target)),
+            )}
+
+        keep, new_hashes = [], []
+        taken = pending if pending is not None else set()
+        for i, h in enumerate(hashes):
+            if h in seen or h in taken:
+                continue
+            taken.add(h)
+            keep.append(i)
+            new_hashes.append(h)
+        if len(keep) == table.num_rows:
+            return table, new_hashes
+        return table.take(pa.array(keep, type=pa.int64())), new_hashes
+
+    def mark(self, prefix: str, hashes: List[int], target: Optional[str] = None) -> None:
+        if not hashes:
+            return
+        prefix = _namespace(prefix, target)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR IGNORE INTO seen (prefix, h, seen_at) VALUES (?, ?, ?)",
+                ((prefix, h, now) for h in hashes),
+            )
+            conn.execute("COMMIT")
+
+    def record_table_keys(self, prefix: str, hashes: List[int], target: Optional[str] = None) -> Optional[int]:
+        """Mark the table-key hashes of inserted rows; returns how many were already there.
+
+        Kept apart from the natural keys (under `<prefix>@<target>#table`): it
+        tracks the target table's own ORDER BY key, so a repeat means the
+        table now holds two rows a ReplacingMergeTree merge would collapse.
+        Repeats within `hashes` count too. Returns None while nothing has
+        been recorded for the prefix yet (no history to compare against).
+        """
+        if not hashes:
+            return 0
+        namespace = f"{_namespace(prefix, target)}#table"
+        now = time.time()
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM seen WHERE prefix = ? LIMIT 1", (namespace,)).fetchone() is None:
+                repeats = None
+            else:
+                conn.execute("CREATE TEMP TABLE batch (h INTEGER PRIMARY KEY)")
+                conn.executemany("INSERT OR IGNORE INTO batch (h) VALUES (?)", ((h,) for h in hashes))
+                repeats = conn.execute(
+                    "SELECT count(*) FROM seen s JOIN batch b ON s.h = b.h WHERE s.prefix = ?", (namespace,)
+                ).fetchone()[0]
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR IGNORE INTO seen (prefix, h, seen_at) VALUES (?, ?, ?)",
+                ((namespace, h, now) for h in hashes),
+            )
+            conn.execute("COMMIT")
+        if repeats is None:
+            return None
+        return repeats + len(hashes) - len(set(hashes))
+
+    def prune(self, retention_days: float = SEEN_KEYS_RETENTION_DAYS) -> int:
+        with self._connect() as conn:
+            cur = conn.execute("DELETE FROM seen WHERE seen_at < ?", (time.time() - retention_days * 86400,))
+            return cur.rowcount
+
+    def reset(self, prefix: str) -> None:
+        """Forget everything delivered for a prefix (e.g. after truncating its table)."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM seen WHERE prefix = ? OR prefix LIKE ?", (prefix, f"{prefix}@%"))
@@ -0,0 +1,23 @@
+"""Small statistics helpers shared by the request metrics and query log reports.
+
+Percentiles are nearest-rank everywhere: the value at 1-based rank
+`ceil(pct/100 * N)` of the sorted sample. `nearest_rank_sql` is the same
+definition as a ClickHouse aggregate expression, so a p95 in
+`hl_ping_*.json`, the query log report and the spilled-records report all
+mean the same thing.
+"""
+import math
+from typing import List
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list (0.0 if empty)."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def nearest_rank_sql(column: str, pct: float) -> str:
+    """ClickHouse aggregate expression for `percentile` over `column` within a GROUP BY."""
+    return f"arrayElement(arraySort(groupArray({column})), toUInt64(greatest(1, ceil({pct / 100.0} * count()))))"
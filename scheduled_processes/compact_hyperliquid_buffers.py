@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+compact_hyperliquid_buffers.py
+------------------------------
+
+Merges the small per-save parquet files in each settled hour partition of
+`data/buffer/<prefix>/date=YYYY-MM-DD/hour=HH/` into a single file with
+large row groups (see BufferManager.compact). Run it between flushes (e.g.
+hourly) so the 3-hour flush reads a few files per prefix instead of one per
+ping × account.
+
+Also indexes any buffer files missing from the manifest (legacy flat files,
+saves that crashed before registering). Does not talk to ClickHouse; files
+claimed by a running flush are left alone.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from modules.buffer_manager import COMPACT_SETTLE_S, BufferManager  # noqa: E402
+from scheduled_processes.flush_hyperliquid_buffers import BUFFER_DIR, PREFIX_TABLES  # noqa: E402
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Compact buffered Hyperliquid parquet partitions.")
+    parser.add_argument("--buffer-dir", default=BUFFER_DIR)
+    parser.add_argument("--settle", type=float, default=COMPACT_SETTLE_S,
+                        help="Seconds after an hour ends before its partition is compacted")
+    args = parser.parse_args(argv)
+
+    print("[compact_hyperliquid_buffers] Starting...")
+    if not os.path.isdir(args.buffer_dir):
+        print(f"[compact] Buffer directory does not exist: {args.buffer_dir}")
+        return
+
+    buffer_mgr = BufferManager(buffer_dir=args.buffer_dir)
+    started = time.perf_counter()
+    buffer_mgr.reconcile()
+    merged = 0
+    for prefix, _ in PREFIX_TABLES:
+        merged += buffer_mgr.compact(prefix, settle_s=args.settle)
+    print(f"[compact_hyperliquid_buffers] Merged {merged} files in {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
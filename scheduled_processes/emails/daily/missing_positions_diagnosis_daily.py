@@ -47,6 +47,7 @@ if REPO_ROOT not in sys.path:
     sys.path.append(REPO_ROOT)
 
 from modules.clickhouse_client import query_df  # type: ignore  # noqa: E402
+from modules.query_cache import cached_query_df  # type: ignore  # noqa: E402
 from scheduled_processes.emails.daily.targets_vs_actuals_daily import (  # type: ignore  # noqa: E402
     _load_latest_run_context,
     _load_targets_for_date,
@@ -144,7 +145,7 @@ def _load_latest_binance_prices(symbols: List[str]) -> Dict[str, float]:
         )
         WHERE rn = 1
     """
-    df = query_df(sql)
+    df = cached_query_df(sql)
     if df.empty:
         return {}
 
@@ -176,7 +177,7 @@ def _load_binance_price_at_time(symbol: str, ts: datetime) -> Optional[float]:
         ORDER BY timestamp DESC
         LIMIT 1
     """
-    df = query_df(sql, params={"sym": bn_sym, "ts": ts})
+    df = cached_query_df(sql, params={"sym": bn_sym, "ts": ts})
     if df.empty:
         return None
     return float(df.iloc[0]["close"])
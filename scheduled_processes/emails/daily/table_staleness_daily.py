@@ -19,6 +19,7 @@ Tables covered (by default):
   - maicro_monitors.funding_payments (time) [Per Account]
   - maicro_monitors.ledger_updates (time) [Per Account]
   - maicro_monitors.candles (ts)
+  - maicro_monitors.market_snapshots (timestamp)
   - maicro_monitors.tracking_error_multilag (timestamp)
   - binance.* tables
 
@@ -57,6 +58,7 @@ GLOBAL_TABLES: List[Tuple[str, str, timedelta]] = [
     ("maicro_logs.positions_jianan_v6", "inserted_at", timedelta(hours=26)),
     # Global Monitors
     ("maicro_monitors.candles", "ts", timedelta(hours=6)),
+    ("maicro_monitors.market_snapshots", "timestamp", timedelta(hours=6)),
     ("maicro_monitors.tracking_error_multilag", "timestamp", timedelta(days=2)),
     # Binance (synced every 6h)
     ("binance.bn_funding_rates", "fundingTime", timedelta(hours=12)),
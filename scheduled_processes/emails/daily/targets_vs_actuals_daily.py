@@ -26,7 +26,8 @@ REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.p
 if REPO_ROOT not in sys.path:
     sys.path.append(REPO_ROOT)
 
-from modules.clickhouse_client import query_df, execute
+from modules.clickhouse_client import execute
+from modules.query_cache import cached_query_df
 from config.settings import get_secret, HYPERLIQUID_ADDRESSES
 
 RESEND_API_KEY = get_secret("RESEND_API_KEY")
@@ -75,7 +76,7 @@ def _load_actuals_snapshot(snapshot_date: date, address: str) -> Tuple[pd.DataFr
       AND a.address = %(addr)s
     GROUP BY p.coin
     """
-    df = query_df(sql, params={"d": snapshot_date, "addr": address})
+    df = cached_query_df(sql, params={"d": snapshot_date, "addr": address})
     
     if df.empty:
         return pd.DataFrame(), 0.0
@@ -107,7 +108,7 @@ def _load_targets(target_date: date) -> pd.DataFrame:
             LIMIT 1 BY symbol
         )
     """
-    df = query_df(sql, params={"d": target_date})
+    df = cached_query_df(sql, params={"d": target_date})
     if df.empty:
         return pd.DataFrame(columns=["symbol", "target_weight"])
     
@@ -3,7 +3,8 @@
 flush_hyperliquid_buffers.py
 ----------------------------
 
-Flushes buffered Hyperliquid data from `data/buffer/*.parquet` into
+Flushes buffered Hyperliquid data from `data/buffer/<prefix>/date=*/hour=*/`
+(plus any legacy flat `data/buffer/<prefix>_*.parquet` files) into
 two ClickHouse targets:
 
 1. Local/chenlin host (CLICKHOUSE_LOCAL_CONFIG)
@@ -20,13 +21,23 @@ has been buffering data via BufferManager.save() using the prefixes:
   - funding   -> maicro_monitors.funding_payments
   - ledger    -> maicro_monitors.ledger_updates
   - candles   -> maicro_monitors.candles
+  - market    -> maicro_monitors.market_snapshots
+  - meta      -> maicro_monitors.hl_meta
+
+`--dry-run` reads and converts the buffer exactly as a real flush would but
+skips ClickHouse and keeps the files (for offline timing against a cassette
+replay buffer, see `--buffer-dir`).
 """
 
+import argparse
 import os
-import glob
-from typing import List, Tuple
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-import pandas as pd
+import pyarrow as pa
 from clickhouse_driver import Client
 
 import sys
@@ -35,7 +46,12 @@ REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if REPO_ROOT not in sys.path:
     sys.path.append(REPO_ROOT)
 
-from config.settings import CLICKHOUSE_LOCAL_CONFIG, CLICKHOUSE_REMOTE_CONFIG  # noqa: E402
+from modules.buffer_manager import FLUSH_CHUNK_ROWS, BufferManager, time_bounds, time_column  # noqa: E402
+from modules.clickhouse_client import connection, dedup_settings, to_columns  # noqa: E402
+from modules.query_log import track_query  # noqa: E402
+from modules.merge_scheduler import MergeScheduler  # noqa: E402
+from modules.schema_registry import SchemaRegistry, get_registry, is_schema_error  # noqa: E402
+from modules.seen_keys import SEEN_KEYS_RETENTION_DAYS, SeenKeyIndex, row_hashes  # noqa: E402
 
 
 BUFFER_DIR = os.path.join(REPO_ROOT, "data", "buffer")
@@ -48,112 +64,355 @@ PREFIX_TABLES: List[Tuple[str, str]] = [
     ("funding", "maicro_monitors.funding_payments"),
     ("ledger", "maicro_monitors.ledger_updates"),
     ("candles", "maicro_monitors.candles"),
+    ("market", "maicro_monitors.market_snapshots"),
     ("meta", "maicro_monitors.hl_meta"),
 ]
 
-# Prefixes whose target tables use ReplacingMergeTree and should be optimized
-REPLACING_MERGE_TREE_PREFIXES = {"trades", "orders", "funding", "ledger", "candles"}
-
-
-def get_clients() -> Tuple[Client, Client]:
-    local_client = Client(**CLICKHOUSE_LOCAL_CONFIG)
-    remote_client = Client(**CLICKHOUSE_REMOTE_CONFIG)
-    return local_client, remote_client
-
-
-def _common_insert_columns(table: str, local_client: Client, remote_client: Client, df: pd.DataFrame) -> List[str]:
-    """
-    Determine a safe column subset to insert: intersection of
-    (local table columns) ∩ (remote table columns) ∩ (df columns),
-    preserving local table column order.
+# Prefixes whose target tables use ReplacingMergeTree -> the table's ORDER BY
+# (replacing) key, as in scripts/sql/init_db.sql.
+REPLACING_KEYS: Dict[str, Tuple[str, ...]] = {
+    "trades": ("coin", "time", "tid"),
+    "orders": ("coin", "timestamp", "oid"),
+    "funding": ("coin", "time"),
+    "ledger": ("time", "hash"),
+    "candles": ("coin", "interval", "ts"),
+}
+
+# Every insert carries a deterministic deduplication token (see
+# BufferManager.insert_token), so a failed insert is simply sent again.
+INSERT_RETRIES = int(os.getenv("HL_FLUSH_INSERT_RETRIES", "3"))
+INSERT_RETRY_BACKOFF_S = float(os.getenv("HL_FLUSH_INSERT_RETRY_BACKOFF_S", "2"))
+
+
+def flush_prefix(
+    prefix: str,
+    table: str,
+    local_client: Optional[Client],
+    remote_client: Optional[Client],
+    buffer_dir: str = BUFFER_DIR,
+    dry_run: bool = False,
+    chunk_rows: int = FLUSH_CHUNK_ROWS,
+    seen_keys: Optional[SeenKeyIndex] = None,
+    merges: Optional[MergeScheduler] = None,
+    schemas: Optional[SchemaRegistry] = None,
+) -> None:
+    # Claim the exact file set from the manifest: saves that land meanwhile
+    # stay unclaimed for the next run, and compaction skips claimed files.
+    buffer_mgr = BufferManager(buffer_dir=buffer_dir)
+    owner = f"flush-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    files = buffer_mgr.claim(prefix, owner)
+    try:
+        if not dry_run:
+            files = buffer_mgr.drop_delivered(prefix, files)
+        _flush_files(prefix, table, local_client, remote_client, buffer_mgr, files, dry_run, chunk_rows, seen_keys,
+                     merges or MergeScheduler(), schemas or get_registry())
+    finally:
+        # Delivered files are already gone from the manifest; this frees the rest.
+        buffer_mgr.release(owner)
+
+
+def _flush_files(
+    prefix: str,
+    table: str,
+    local_client: Optional[Client],
+    remote_client: Optional[Client],
+    buffer_mgr: BufferManager,
+    files: List[str],
+    dry_run: bool,
+    chunk_rows: int,
+    seen_keys: Optional[SeenKeyIndex],
+    merges: MergeScheduler,
+    schemas: SchemaRegistry,
+) -> None:
+    """Stream the claimed files into both targets at once.
+
+    Each target runs in its own thread from its own checkpoint, so a slow or
+    unreachable cloud neither holds up the local insert nor makes the next
+    run re-send rows the local table already has. A file is deleted once
+    both targets have all of it.
     """
-    def describe(client: Client) -> List[str]:
-        rows = client.execute(f"DESCRIBE TABLE {table}")
-        return [r[0] for r in rows]
-
-    local_cols = describe(local_client)
-    remote_cols = describe(remote_client)
-    df_cols = set(df.columns)
-
-    common = [c for c in local_cols if c in remote_cols and c in df_cols]
-    return common
-
-
-def flush_prefix(prefix: str, table: str, local_client: Client, remote_client: Client) -> None:
-    pattern = os.path.join(BUFFER_DIR, f"{prefix}_*.parquet")
-    files = sorted(glob.glob(pattern))
+    started = time.perf_counter()
 
     if not files:
         print(f"[{prefix}] No buffered files to flush.")
         return
 
-    print(f"[{prefix}] Found {len(files)} buffered files. Loading...")
-    dfs = []
-    valid_files = []
-    for f in files:
-        try:
-            dfs.append(pd.read_parquet(f))
-            valid_files.append(f)
-        except Exception as e:
-            print(f"[{prefix}] Error reading {f}: {e}")
-
-    if not dfs:
-        print(f"[{prefix}] No valid dataframes to flush.")
-        return
-
-    df = pd.concat(dfs, ignore_index=True)
-    if df.empty:
-        print(f"[{prefix}] Combined dataframe is empty; nothing to insert.")
+    print(f"[{prefix}] Found {len(files)} buffered files. Streaming in chunks of {chunk_rows} rows...")
+    if dry_run:
+        stats = _flush_target(prefix, table, None, None, (), buffer_mgr, files, chunk_rows, seen_keys, None, merges,
+                              schemas)
+        print(f"[{prefix}] Dry run: prepared {stats['rows']} rows in {stats['chunks']} chunks for {table} in "
+              f"{time.perf_counter() - started:.3f}s; buffer kept.")
         return
 
-    # Determine common columns that are safe to insert into both targets
-    cols = _common_insert_columns(table, local_client, remote_client, df)
-    if not cols:
-        print(f"[{prefix}] No common columns between df and table {table}; skipping.")
+    clients = {"local": local_client, "remote": remote_client}
+    targets = tuple(clients)
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=len(clients), thread_name_prefix=f"flush-{prefix}") as pool:
+        futures = {
+            target: pool.submit(_flush_target, prefix, table, target, client, targets, buffer_mgr, files,
+                                chunk_rows, seen_keys, lock, merges, schemas)
+            for target, client in clients.items()
+        }
+        results = {target: f.result() for target, f in futures.items()}
+
+    summary = ", ".join(
+        f"{t} {r['rows']} rows/{r['chunks']} chunks in {r['seconds']:.1f}s{'' if r['ok'] else ' (FAILED)'}"
+        for t, r in results.items()
+    )
+    if all(r["ok"] for r in results.values()):
+        print(f"[{prefix}] Flush complete; {summary}; buffer cleared.")
+    else:
+        print(f"[{prefix}] Flush incomplete; {summary}; undelivered rows kept for retry.")
+
+
+def _flush_target(
+    prefix: str,
+    table: str,
+    target: Optional[str],
+    client: Optional[Client],
+    targets: Tuple[str, ...],
+    buffer_mgr: BufferManager,
+    files: List[str],
+    chunk_rows: int,
+    seen_keys: Optional[SeenKeyIndex],
+    lock: Optional[threading.Lock],
+    merges: MergeScheduler,
+    schemas: SchemaRegistry,
+) -> Dict[str, Any]:
+    """Deliver the files to one target (`target=None`: dry run, no inserts).
+
+    Reads from the target's own manifest checkpoint, `chunk_rows` rows per
+    insert, and checkpoints each chunk once the target has accepted it. With
+    a seen-key index, rows whose natural key this target already has are
+    dropped before the insert, and the survivors of several read chunks are
+    combined so inserts stay full-sized. The table's columns come from the
+    schema registry and are re-read once if the insert fails with a schema
+    error. For ReplacingMergeTree tables the inserted rows' table keys are
+    recorded too, and afterwards the partitions this flush created parts in
+    are handed to the merge scheduler if any key repeated (see
+    `_schedule_merges`).
+    """
+    dry_run = target is None
+    tag = prefix if dry_run else f"{prefix}/{target}"
+    started = time.perf_counter()
+    replacing_key = REPLACING_KEYS.get(prefix)
+    stats: Dict[str, Any] = {"rows": 0, "chunks": 0, "skipped": 0, "ok": True, "seconds": 0.0,
+                             "time_col": None, "min_ts": None, "max_ts": None,
+                             # table-key repeats among inserted rows; None = unknown
+                             "key_repeats": 0 if seen_keys is not None else None, "parts_before": None}
+    pending: List[pa.Table] = []
+    pending_spans: Dict[str, Tuple[int, int]] = {}
+    pending_keys: List[int] = []
+    pending_key_set: Set[int] = set()
+
+    def checkpoint() -> None:
+        with lock:
+            buffer_mgr.checkpoint(prefix, pending_spans, target, targets)
+
+    def deliver() -> bool:
+        """Insert the pending rows, then checkpoint them."""
+        rows = sum(t.num_rows for t in pending)
+        if rows == 0:
+            if not dry_run:
+                checkpoint()
+            return True
+
+        data = pa.concat_tables(pending, promote_options="permissive")
+        cols = data.column_names if dry_run else [c for c in table_cols if c in data.column_names]
+        if not cols:
+            print(f"[{tag}] No common columns between buffer and table {table}; skipping.")
+            return False
+
+        columns = to_columns(data, cols)
+        if dry_run:
+            stats["chunks"] += 1
+            stats["rows"] += data.num_rows
+            return True
+
+        token = buffer_mgr.insert_token(prefix, pending_spans, data.select(cols))
+        print(f"[{tag}] Inserting chunk {stats['chunks'] + 1}: {data.num_rows} rows into {table}...")
+        attempt, refreshed = 0, False
+        while True:
+            try:
+                sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES"
+                with track_query("insert", sql, target) as tracked:
+                    client.execute(sql, columns, columnar=True, settings=dedup_settings(token))
+                    tracked.done(client)
+                break
+            except Exception as e:
+                if is_schema_error(e) and not refreshed:
+                    # The cached column list is stale: re-read it and retry at once.
+                    refreshed = True
+                    try:
+                        table_cols[:] = schemas.insert_columns(client, target, table, refresh=True)
+                    except Exception as describe_error:
+                        print(f"[{tag}] ERROR describing {table}: {describe_error}")
+                        return False
+                    cols = [c for c in table_cols if c in data.column_names]
+                    if not cols:
+                        print(f"[{tag}] No common columns between buffer and table {table}; skipping.")
+                        return False
+                    print(f"[{tag}] Insert failed with a schema error ({e}); retrying with the refreshed columns...")
+                    columns = to_columns(data, cols)
+                    token = buffer_mgr.insert_token(prefix, pending_spans, data.select(cols))
+                    continue
+                if attempt < INSERT_RETRIES:
+                    delay = INSERT_RETRY_BACKOFF_S * 2 ** attempt
+                    print(f"[{tag}] Insert failed ({e}); retrying in {delay:.0f}s with the same dedup token...")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                print(f"[{tag}] ERROR inserting into ClickHouse: {e}")
+                print(f"[{tag}] {stats['rows']} rows delivered before the failure; the rest is retried next run.")
+                return False
+
+        # Advance this target's checkpoint only after its insert succeeded
+        if seen_keys is not None:
+            seen_keys.mark(prefix, pending_keys, target)
+            if replacing_key is not None and stats["key_repeats"] is not None:
+                if all(c in data.column_names for c in replacing_key):
+                    repeats = seen_keys.record_table_keys(prefix, row_hashes(data, replacing_key), target)
+                    stats["key_repeats"] = None if repeats is None else stats["key_repeats"] + repeats
+                else:
+                    stats["key_repeats"] = None
+        checkpoint()
+        stats["chunks"] += 1
+        stats["rows"] += data.num_rows
+        lo, hi = time_bounds(data)
+        if lo is not None:
+            stats["time_col"] = time_column(data.schema)
+            stats["min_ts"] = lo if stats["min_ts"] is None else min(stats["min_ts"], lo)
+            stats["max_ts"] = hi if stats["max_ts"] is None else max(stats["max_ts"], hi)
+        return True
+
+    def run() -> bool:
+        pending_rows = 0
+        for chunk, spans in buffer_mgr.iter_chunks(prefix, files, chunk_rows, target):
+            if seen_keys is not None:
+                read_rows = chunk.num_rows
+                chunk, keys = seen_keys.filter_new(prefix, chunk, pending_key_set, target)
+                stats["skipped"] += read_rows - chunk.num_rows
+                pending_keys.extend(keys)
+            pending.append(chunk)
+            pending_spans.update(spans)
+            pending_rows += chunk.num_rows
+            if pending_rows >= chunk_rows:
+                if not deliver():
+                    return False
+                pending.clear()
+                pending_spans.clear()
+                pending_keys.clear()
+                pending_key_set.clear()
+                pending_rows = 0
+        return not pending or deliver()
+
+    table_cols: List[str] = []
+    if not dry_run:
+        try:
+            table_cols = schemas.insert_columns(client, target, table)
+        except Exception as e:
+            print(f"[{tag}] ERROR describing {table}: {e}")
+            stats["ok"] = False
+    if stats["ok"] and not dry_run and replacing_key is not None:
+        try:
+            stats["parts_before"] = merges.active_parts(client, table)
+        except Exception as e:
+            print(f"[{tag}] Warning: could not list the parts of {table}; no merge this run: {e}")
+    if stats["ok"]:
+        stats["ok"] = run()
+
+    if stats["skipped"]:
+        print(f"[{tag}] Dropped {stats['skipped']} rows already delivered (seen-key index).")
+    if not dry_run and stats["rows"] and stats["parts_before"] is not None:
+        _schedule_merges(prefix, table, target, client, merges, stats)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def _schedule_merges(
+    prefix: str,
+    table: str,
+    target: str,
+    client: Client,
+    merges: MergeScheduler,
+    stats: Dict[str, Any],
+) -> None:
+    """Ask for a FINAL merge of the partitions this flush wrote to, if it may have left duplicates.
+
+    Decided from what the flush already knows, without reading table data:
+    a merge is needed when an inserted row's table key was recorded before
+    (or repeats within the flush), when there is no key record to go by
+    (`--no-dedup`, first flush with table keys, key columns missing), or
+    when rows older than the index retention went in (their keys may have
+    been pruned). The partitions are the ones holding parts that were not
+    there before the first insert.
+    """
+    tag = f"{prefix}/{target}"
+    cutoff_ms = (time.time() - SEEN_KEYS_RETENTION_DAYS * 86400) * 1000
+    repeats = stats["key_repeats"]
+    if repeats == 0 and (stats["min_ts"] is None or stats["min_ts"] >= cutoff_ms):
+        print(f"[{tag}] No repeated table keys among the inserted rows; no merge needed.")
         return
-
-    df = df[cols]
-    values = [tuple(row[c] for c in cols) for _, row in df.iterrows()]
-
-    col_list = ", ".join(cols)
-    print(f"[{prefix}] Inserting {len(values)} rows into {table} ({col_list}) on both local and remote...")
     try:
-        local_client.execute(f"INSERT INTO {table} ({col_list}) VALUES", values)
-        remote_client.execute(f"INSERT INTO {table} ({col_list}) VALUES", values)
-
-        if prefix in REPLACING_MERGE_TREE_PREFIXES:
-            print(f"[{prefix}] Running OPTIMIZE TABLE FINAL...")
-            try:
-                local_client.execute(f"OPTIMIZE TABLE {table} FINAL")
-                remote_client.execute(f"OPTIMIZE TABLE {table} FINAL")
-            except Exception as opt_e:
-                print(f"[{prefix}] Warning: OPTIMIZE failed: {opt_e}")
-
+        partitions = merges.new_partitions(client, table, stats["parts_before"])
+        if repeats:
+            print(f"[{tag}] {repeats} inserted rows repeat a table key; merging {len(partitions)} partitions.")
+        merges.request(client, target, table, partitions)
     except Exception as e:
-        print(f"[{prefix}] ERROR inserting into ClickHouse: {e}")
-        print(f"[{prefix}] Buffer files retained for retry.")
-        return
-
-    # Delete files only after successful insert on both targets
-    for f in valid_files:
-        try:
-            os.remove(f)
-        except OSError as e:
-            print(f"[{prefix}] Error deleting {f}: {e}")
-
-    print(f"[{prefix}] Flush complete; buffer cleared.")
+        print(f"[{tag}] Warning: merge scheduling failed: {e}")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Flush buffered Hyperliquid data to both ClickHouse targets.")
+    parser.add_argument("--buffer-dir", default=BUFFER_DIR)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Read and convert the buffer without connecting to ClickHouse or deleting files.")
+    parser.add_argument("--chunk-rows", type=int, default=FLUSH_CHUNK_ROWS,
+                        help="Rows per insert (default HL_FLUSH_CHUNK_ROWS)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Send every buffered row, ignoring the seen-key index")
+    parser.add_argument("--reset-seen", action="append", default=[], metavar="PREFIX",
+                        help="Forget delivered keys for PREFIX first (e.g. after truncating its table)")
+    parser.add_argument("--refresh-schemas", action="store_true",
+                        help="Re-read every target table's columns instead of using the cached schemas")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="First index buffer files missing from the manifest (the hourly compaction does this too).")
+    args = parser.parse_args(argv)
 
-
-def main():
     print("[flush_hyperliquid_buffers] Starting dual-target flush...")
-    if not os.path.isdir(BUFFER_DIR):
-        print(f"[flush] Buffer directory does not exist: {BUFFER_DIR}")
+    if not os.path.isdir(args.buffer_dir):
+        print(f"[flush] Buffer directory does not exist: {args.buffer_dir}")
         return
 
-    local_client, remote_client = get_clients()
-
-    for prefix, table in PREFIX_TABLES:
-        flush_prefix(prefix, table, local_client, remote_client)
+    if args.reconcile:
+        BufferManager(buffer_dir=args.buffer_dir).reconcile()
+
+    seen_keys = None if args.no_dedup else SeenKeyIndex()
+    for prefix in args.reset_seen:
+        SeenKeyIndex().reset(prefix)
+        print(f"[flush] Reset seen keys for {prefix}")
+
+    merges = MergeScheduler()
+    schemas = get_registry()
+    if args.refresh_schemas:
+        schemas.invalidate()
+
+    started = time.perf_counter()
+    if args.dry_run:
+        for prefix, table in PREFIX_TABLES:
+            flush_prefix(prefix, table, None, None, args.buffer_dir, True, args.chunk_rows, seen_keys, merges, schemas)
+    else:
+        # One pooled connection per target, each used only by that target's flush thread.
+        with connection("local") as local_client, connection("remote") as remote_client:
+            for prefix, table in PREFIX_TABLES:
+                flush_prefix(prefix, table, local_client, remote_client, args.buffer_dir, False, args.chunk_rows,
+                             seen_keys, merges, schemas)
+    if seen_keys is not None and not args.dry_run:
+        pruned = seen_keys.prune()
+        if pruned:
+            print(f"[flush] Pruned {pruned} expired seen keys")
+    print(f"[flush_hyperliquid_buffers] Flushed all prefixes in {time.perf_counter() - started:.3f}s")
 
     print("[flush_hyperliquid_buffers] Done.")
 
@@ -31,7 +31,9 @@ REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if REPO_ROOT not in sys.path:
     sys.path.append(REPO_ROOT)
 
-from config.settings import CLICKHOUSE_LOCAL_CONFIG, CLICKHOUSE_REMOTE_CONFIG  # noqa: E402
+from config.settings import CLICKHOUSE_REMOTE_CONFIG  # noqa: E402
+from modules.clickhouse_client import connection  # noqa: E402
+from modules.schema_registry import get_registry  # noqa: E402
 
 
 DATABASES_TO_SYNC = ["hyperliquid", "maicro_logs", "binance", "maicro_monitors"]
@@ -46,6 +48,7 @@ CURSOR_OVERRIDES: Dict[Tuple[str, str], str] = {
     ("maicro_monitors", "funding_payments"): "time",
     ("maicro_monitors", "ledger_updates"): "time",
     ("maicro_monitors", "candles"): "updated_at",
+    ("maicro_monitors", "market_snapshots"): "timestamp",
     ("maicro_monitors", "hl_meta"): "updated_at",
     ("maicro_monitors", "tracking_error"): "timestamp",
 
@@ -99,16 +102,6 @@ SKIP_TABLES: Tuple[Tuple[str, str], ...] = (
 )
 
 
-def get_local_client() -> Client:
-    """Connect to local ClickHouse (chenlin04)."""
-    return Client(**CLICKHOUSE_LOCAL_CONFIG)
-
-
-def get_remote_client() -> Client:
-    """Connect to ClickHouse Cloud."""
-    return Client(**CLICKHOUSE_REMOTE_CONFIG)
-
-
 def get_tables_in_database(client: Client, database: str) -> List[Tuple[str, str]]:
     q = f"""
     SELECT name, engine
@@ -127,14 +120,9 @@ def get_table_create_statement(client: Client, database: str, table: str) -> str
     return result[0][0]
 
 
-def get_table_columns(client: Client, database: str, table: str) -> List[Tuple[str, str]]:
-    q = f"""
-    SELECT name, type
-    FROM system.columns
-    WHERE database = '{database}' AND table = '{table}'
-    ORDER BY position
-    """
-    return client.execute(q)
+def get_table_columns(client: Client, database: str, table: str, target: str = "remote") -> List[Tuple[str, str]]:
+    """(name, type) of every column, via the shared schema registry."""
+    return get_registry().columns(client, target, f"{database}.{table}")
 
 
 def local_database_exists(local_client: Client, database: str) -> bool:
@@ -148,12 +136,8 @@ def local_table_exists(local_client: Client, database: str, table: str) -> bool:
 
 
 def remote_column_exists(remote_client: Client, database: str, table: str, column: str) -> bool:
-    q = (
-        "SELECT count() FROM system.columns "
-        f"WHERE database = '{database}' AND table = '{table}' AND name = '{column}'"
-    )
     try:
-        return remote_client.execute(q)[0][0] > 0
+        return any(name == column for name, _ in get_table_columns(remote_client, database, table))
     except Exception:
         return False
 
@@ -186,12 +170,9 @@ def get_local_max_date(local_client: Client, database: str, table: str, date_col
         q = f"SELECT max({date_column}) FROM {database}.{table}"
         result = local_client.execute(q)
         max_date = result[0][0]
-
-        type_q = f"""
-        SELECT type FROM system.columns
-        WHERE database = '{database}' AND table = '{table}' AND name = '{date_column}'
-        """
-        col_type = local_client.execute(type_q)[0][0]
+        col_type = get_registry().column_type(local_client, "local", f"{database}.{table}", date_column)
+        if col_type is None:
+            raise ValueError(f"no column {date_column}")
         return max_date, col_type
     except Exception as e:
         print(f"  Warning: Could not get max({date_column}) for {database}.{table}: {e}")
@@ -204,6 +185,7 @@ def sync_table_initial(local_client: Client, remote_client: Client, database: st
     create_statement = get_table_create_statement(remote_client, database, table)
     create_statement = convert_cloud_create_statement(create_statement)
     local_client.execute(create_statement)
+    get_registry().invalidate("local", f"{database}.{table}")
 
     remote = CLICKHOUSE_REMOTE_CONFIG
     insert_query = f"""
@@ -225,25 +207,18 @@ def sync_table_initial(local_client: Client, remote_client: Client, database: st
 
 
 def find_date_column(remote_client: Client, database: str, table: str) -> Optional[str]:
-    q = f"""
-    SELECT name, type
-    FROM system.columns
-    WHERE database = '{database}' AND table = '{table}'
-      AND (type LIKE '%Date%' OR type LIKE '%Time%')
-    ORDER BY
-        CASE
-            WHEN name LIKE '%timestamp%' THEN 1
-            WHEN name LIKE '%time%' THEN 2
-            WHEN name LIKE '%date%' THEN 3
-            ELSE 4
-        END,
-        name
-    LIMIT 1
-    """
-    result = remote_client.execute(q)
-    if result:
-        return result[0][0]
-    return None
+    """First Date/DateTime column, preferring names with timestamp, then time, then date."""
+    def rank(name: str) -> int:
+        for i, word in enumerate(("timestamp", "time", "date")):
+            if word in name:
+                return i
+        return 3
+
+    candidates = [
+        name for name, type_ in get_table_columns(remote_client, database, table)
+        if "Date" in type_ or "Time" in type_
+    ]
+    return min(candidates, key=lambda name: (rank(name), name), default=None)
 
 
 def sync_table_incremental(local_client: Client, remote_client: Client, database: str, table: str, date_column: str) -> None:
@@ -333,11 +308,9 @@ def sync_database(local_client: Client, remote_client: Client, database: str) ->
 
 def main():
     print(f"[pull_data_downward_from_cloud] Starting at {datetime.utcnow()}")
-    local_client = get_local_client()
-    remote_client = get_remote_client()
-
-    for db in DATABASES_TO_SYNC:
-        sync_database(local_client, remote_client, db)
+    with connection("local") as local_client, connection("remote") as remote_client:
+        for db in DATABASES_TO_SYNC:
+            sync_database(local_client, remote_client, db)
 
     print(f"[pull_data_downward_from_cloud] Done at {datetime.utcnow()}")
 
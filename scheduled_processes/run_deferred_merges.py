@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+run_deferred_merges.py
+----------------------
+
+Runs the `OPTIMIZE ... PARTITION ... FINAL` merges the flush deferred because
+the partition was larger than `HL_MERGE_HEAVY_BYTES` (see
+modules/merge_scheduler.py), on both ClickHouse targets. Meant to be cronned
+inside the off-peak window (`HL_MERGE_OFFPEAK_UTC`).
+
+`--report` prints merge counts and durations per target and table from the
+merge log instead.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from modules.clickhouse_client import connection  # noqa: E402
+from modules.merge_scheduler import MergeScheduler, is_offpeak  # noqa: E402
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Run deferred ClickHouse partition merges.")
+    parser.add_argument("--force", action="store_true", help="Run even outside the off-peak window")
+    parser.add_argument("--report", action="store_true", help="Print merge durations instead of merging")
+    parser.add_argument("--days", type=float, default=7.0, help="Report window in days")
+    args = parser.parse_args(argv)
+
+    merges = MergeScheduler()
+    if args.report:
+        for r in merges.report(args.days):
+            print(f"{r['target']:<7} {r['table']:<40} {r['merges']:>4} merges  {r['failed']:>2} failed  "
+                  f"total {r['total_s']:8.1f}s  max {r['max_s']:7.1f}s  {(r['bytes'] or 0) / 1e9:7.2f} GB")
+        pending = merges.pending()
+        print(f"{len(pending)} partitions queued")
+        return
+
+    if not args.force and not is_offpeak():
+        print("[run_deferred_merges] Outside the off-peak window; use --force to run anyway.")
+        return
+
+    started = time.perf_counter()
+    done = 0
+    for target in ("local", "remote"):
+        try:
+            with connection(target) as client:
+                done += merges.run_pending(target, client)
+        except Exception as e:
+            print(f"[run_deferred_merges] {target}: {e}")
+    print(f"[run_deferred_merges] Ran {done} merges in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,16 +5,23 @@ scheduled_ping_hyperliquid.py
 
 15-minute buffer-only ping:
   - Calls Hyperliquid HTTP APIs for MULTIPLE ACCOUNTS.
-  - Writes results to `data/buffer/*.parquet` using BufferManager
+  - Writes results to `data/buffer/<prefix>/date=*/hour=*/` using BufferManager
   - Does NOT talk to ClickHouse (no insert_df, no query_df).
+  - Fills, funding and ledger are incremental: per-address high-water marks
+    in `data/state/cursors.json` (CursorStore) limit each run to rows not yet
+    buffered. Delete that file to force a full re-fetch.
 """
 
+import argparse
+import asyncio
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import pandas as pd
+import pyarrow as pa
 
 # Make repo modules importable
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -22,14 +29,156 @@ if REPO_ROOT not in sys.path:
     sys.path.append(REPO_ROOT)
 
 from config.settings import HYPERLIQUID_ADDRESSES  # type: ignore  # noqa: E402
-from modules.hyperliquid_client import HyperliquidClient  # noqa: E402
+from modules.hyperliquid_client import AsyncHyperliquidClient, HyperliquidClient, METRICS  # noqa: E402
 from modules.buffer_manager import BufferManager  # noqa: E402
+from modules.cursor_store import CursorStore, filter_new_rows  # noqa: E402
+from modules.hl_cassette import get_cassette  # noqa: E402
+from modules.hl_decoders import (  # noqa: E402
+    decode_asset_ctxs,
+    decode_candles,
+    decode_fills,
+    decode_funding,
+    decode_ledger,
+    decode_orders,
+    decode_positions,
+)
+from modules.response_cache import content_hash  # noqa: E402
+
+METRICS_DIR = os.path.join(REPO_ROOT, "data", "metrics")
+
+# Concurrent mode defaults (see --concurrent). The run budget keeps a slow
+# account from pushing the job past its 15-minute cron slot.
+PING_MODE = os.getenv("HL_PING_MODE", "sequential")
+PING_MAX_CONCURRENCY = int(os.getenv("HL_PING_MAX_CONCURRENCY", "8"))
+PING_REQUEST_DEADLINE_S = float(os.getenv("HL_PING_REQUEST_DEADLINE_S", "30"))
+PING_RUN_BUDGET_S = float(os.getenv("HL_PING_RUN_BUDGET_S", "600"))
+# Budget for one paginated walk (fills/funding/ledger) in concurrent mode
+PING_PAGE_WALK_BUDGET_S = float(os.getenv("HL_PING_PAGE_WALK_BUDGET_S", "180"))
+
+# Max rows per response of the time-ranged /info endpoints. A full page means
+# there may be more rows after its last timestamp, so we page forward.
+PAGE_LIMITS = {"fills": 2000, "funding": 500, "ledger": 500}
+
+# CursorStore key for exchange-wide (not per-account) state.
+GLOBAL_CURSOR_KEY = "_global"
+
+CANDLE_INTERVAL_MS = {"1h": 3_600_000, "1d": 86_400_000}
 
 
 def _now() -> datetime:
     return datetime.utcnow()
 
 
+def _lookback_start_ms(days: int = 30) -> int:
+    """Start of the fixed funding/ledger window, in epoch ms."""
+    return int((_now() - timedelta(days=days)).timestamp() * 1000)
+
+
+def _fill_key(row: Dict[str, Any]) -> str:
+    return str(row.get("tid", row.get("hash", "")))
+
+
+def _funding_key(row: Dict[str, Any]) -> str:
+    return str((row.get("delta") or {}).get("coin", ""))
+
+
+def _ledger_key(row: Dict[str, Any]) -> str:
+    return str(row.get("hash", ""))
+
+
+def _fetch_pages(
+    fetch: Callable[[int], List[Dict[str, Any]]],
+    start_ms: int,
+    page_limit: int,
+    key_fn: Callable[[Dict[str, Any]], str],
+) -> List[Dict[str, Any]]:
+    """Walk a time-ranged endpoint forward from start_ms until a short page.
+
+    Pages are requested by start time, so a full page whose rows all share
+    one millisecond cannot be continued from that millisecond; the walk then
+    moves on from the next one (rows past the page limit at that exact
+    millisecond are not reachable through this endpoint).
+    """
+    rows: List[Dict[str, Any]] = []
+    seen = set()
+    while True:
+        page = fetch(start_ms) or []
+        for r in page:
+            k = (int(r["time"]), key_fn(r))
+            if k not in seen:
+                seen.add(k)
+                rows.append(r)
+        if len(page) < page_limit:
+            return rows
+        next_start = max(int(r["time"]) for r in page)
+        if next_start <= start_ms:
+            print(f"[pages] Full page of {len(page)} rows all at {start_ms}; continuing from {start_ms + 1}")
+            next_start = start_ms + 1
+        start_ms = next_start
+
+
+def fetch_new_fills(hl: HyperliquidClient, cursors: CursorStore, address: str) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Fills not yet buffered. Without a cursor, falls back to the full userFills pull."""
+    cursor = cursors.get(address, "fills")
+    if cursor is None:
+        fills = hl.get_user_fills() or []
+    else:
+        fills = _fetch_pages(
+            lambda start: hl.get_user_fills_by_time(start_time=start),
+            int(cursor["time"]), PAGE_LIMITS["fills"], _fill_key,
+        )
+    return filter_new_rows(fills, cursor, _fill_key)
+
+
+def fetch_new_funding(hl: HyperliquidClient, cursors: CursorStore, address: str) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Funding payments since the cursor (or the last 30 days on first run)."""
+    cursor = cursors.get(address, "funding")
+    start_ms = int(cursor["time"]) if cursor else _lookback_start_ms()
+    funding = _fetch_pages(
+        lambda start: hl.get_user_funding(start_time=start),
+        start_ms, PAGE_LIMITS["funding"], _funding_key,
+    )
+    return filter_new_rows(funding, cursor, _funding_key)
+
+
+def fetch_new_ledger(hl: HyperliquidClient, cursors: CursorStore, address: str) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Non-funding ledger updates since the cursor (or the last 30 days on first run)."""
+    cursor = cursors.get(address, "ledger")
+    start_ms = int(cursor["time"]) if cursor else _lookback_start_ms()
+    updates = _fetch_pages(
+        lambda start: hl.get_user_non_funding_ledger_updates(start_time=start),
+        start_ms, PAGE_LIMITS["ledger"], _ledger_key,
+    )
+    return filter_new_rows(updates, cursor, _ledger_key)
+
+
+CURSOR_KEYS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "fills": _fill_key,
+    "funding": _funding_key,
+    "ledger": _ledger_key,
+}
+
+
+def buffer_past_cursor(
+    cursors: CursorStore,
+    address: str,
+    stream: str,
+    rows: List[Dict[str, Any]],
+    buffer_fn: Callable[[List[Dict[str, Any]], BufferManager, str], None],
+    buffer_mgr: BufferManager,
+) -> None:
+    """Buffer the rows still past the stored cursor and advance it, as one locked step.
+
+    The fetch ran against an older view of the cursor; re-filtering under the
+    lock drops anything another process (the stream, a parallel ping)
+    buffered in the meantime.
+    """
+    written = cursors.buffer_new(address, stream, rows, CURSOR_KEYS[stream],
+                                 lambda new_rows: buffer_fn(new_rows, buffer_mgr, address))
+    if not written:
+        buffer_fn([], buffer_mgr, address)
+
+
 def sync_account_and_positions(hl: HyperliquidClient, buffer_mgr: BufferManager, address: str) -> None:
     print(f"[account/positions] Fetching user state for {address[:8]}...")
     try:
@@ -37,7 +186,10 @@ def sync_account_and_positions(hl: HyperliquidClient, buffer_mgr: BufferManager,
     except Exception as e:
         print(f"[account/positions] Error fetching state for {address[:8]}: {e}")
         return
+    buffer_account_state(state_bundle, buffer_mgr, address)
+
 
+def buffer_account_state(state_bundle: Dict[str, Any], buffer_mgr: BufferManager, address: str) -> None:
     state = state_bundle.get("raw")
     if not state:
         print(f"[account/positions] No user state returned for {address[:8]}.")
@@ -66,152 +218,78 @@ def sync_account_and_positions(hl: HyperliquidClient, buffer_mgr: BufferManager,
 
     # Positions snapshot
     positions = state.get("assetPositions", []) or []
-    pos_rows: List[Dict[str, Any]] = []
-    for p in positions:
-        pos = p.get("position") or {}
-        szi = float(pos.get("szi", 0.0) or 0.0)
-        if szi == 0:
-            continue
-        row = {
-            "timestamp": ts,
-            "coin": pos.get("coin", ""),
-            "szi": szi,
-            "entryPx": float(pos.get("entryPx", 0.0) or 0.0),
-            "positionValue": float(pos.get("positionValue", 0.0) or 0.0),
-            "unrealizedPnl": float(pos.get("unrealizedPnl", 0.0) or 0.0),
-            "returnOnEquity": float(pos.get("returnOnEquity", 0.0) or 0.0),
-            "liquidationPx": float(pos.get("liquidationPx", 0.0) or 0.0),
-            "leverage": float((pos.get("leverage") or {}).get("value", 0.0)),
-            "maxLeverage": int(pos.get("maxLeverage", 0) or 0),
-            "marginUsed": float(pos.get("marginUsed", 0.0) or 0.0),
-            "address": address,
-        }
-        pos_rows.append(row)
-
-    if pos_rows:
-        df_pos = pd.DataFrame(pos_rows)
-        buffer_mgr.save(df_pos, "positions")
-        print(f"[positions] Buffered {len(df_pos)} positions for {address[:8]}.")
+    table = decode_positions(positions, ts, address)
+    if table.num_rows:
+        buffer_mgr.save(table, "positions")
+        print(f"[positions] Buffered {table.num_rows} positions for {address[:8]}.")
     else:
         print(f"[positions] No active positions for {address[:8]}.")
 
 
-def sync_trades(hl: HyperliquidClient, buffer_mgr: BufferManager, address: str) -> None:
-    print(f"[trades] Fetching user fills for {address[:8]}...")
-    fills = hl.get_user_fills() or []
-    if not fills:
-        print(f"[trades] No fills returned for {address[:8]}.")
-        return
-
-    df = pd.DataFrame(fills)
-    df["time"] = pd.to_datetime(df["time"], unit="ms")
+def sync_trades(hl: HyperliquidClient, buffer_mgr: BufferManager, address: str, cursors: CursorStore = None) -> None:
+    cursors = cursors or CursorStore()
+    print(f"[trades] Fetching new user fills for {address[:8]}...")
+    fills, _ = fetch_new_fills(hl, cursors, address)
+    buffer_past_cursor(cursors, address, "fills", fills, buffer_trades, buffer_mgr)
 
-    for col in ["px", "sz", "fee", "closedPnl", "startPosition"]:
-        if col in df.columns:
-            df[col] = df[col].astype(float)
 
-    if "tid" not in df.columns:
-        df["tid"] = (df["time"].astype("int64") // 10**6).astype("int64")
+def buffer_trades(fills: List[Dict[str, Any]], buffer_mgr: BufferManager, address: str) -> None:
+    if not fills:
+        print(f"[trades] No new fills for {address[:8]}.")
+        return
 
-    cols = [
-        "coin", "side", "px", "sz", "time", "hash", "startPosition",
-        "dir", "closedPnl", "oid", "cloid", "fee", "tid"
-    ]
-    df = df[[c for c in cols if c in df.columns]].copy()
-    df["address"] = address
-    
-    buffer_mgr.save(df, "trades")
-    print(f"[trades] Buffered {len(df)} fills for {address[:8]}.")
+    table = decode_fills(fills, address)
+    buffer_mgr.save(table, "trades")
+    print(f"[trades] Buffered {table.num_rows} fills for {address[:8]}.")
 
 
 def sync_orders(hl: HyperliquidClient, buffer_mgr: BufferManager, address: str) -> None:
     print(f"[orders] Fetching historical orders for {address[:8]}...")
-    orders = hl.get_historical_orders() or []
+    buffer_orders(hl.get_historical_orders() or [], buffer_mgr, address)
+
+
+def buffer_orders(orders: List[Dict[str, Any]], buffer_mgr: BufferManager, address: str) -> None:
     if not orders:
         print(f"[orders] No historical orders for {address[:8]}.")
         return
 
-    flat_orders: List[Dict[str, Any]] = []
-    for o in orders:
-        order = (o.get("order") or {}).copy()
-        order["status"] = o.get("status", "")
-        flat_orders.append(order)
-
-    df = pd.DataFrame(flat_orders)
-    if df.empty:
-        return
+    table = decode_orders(orders, address)
+    buffer_mgr.save(table, "orders")
+    print(f"[orders] Buffered {table.num_rows} orders for {address[:8]}.")
 
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-    for col in ["limitPx", "sz"]:
-        if col in df.columns:
-            df[col] = df[col].astype(float)
 
-    cols = ["coin", "side", "limitPx", "sz", "oid", "timestamp", "status", "orderType", "reduceOnly"]
-    df = df[[c for c in cols if c in df.columns]].copy()
-    df["address"] = address
-    
-    buffer_mgr.save(df, "orders")
-    print(f"[orders] Buffered {len(df)} orders for {address[:8]}.")
+def sync_funding(hl: HyperliquidClient, buffer_mgr: BufferManager, address: str, cursors: CursorStore = None) -> None:
+    cursors = cursors or CursorStore()
+    print(f"[funding] Fetching new funding for {address[:8]}...")
+    funding, _ = fetch_new_funding(hl, cursors, address)
+    buffer_past_cursor(cursors, address, "funding", funding, buffer_funding, buffer_mgr)
 
 
-def sync_funding(hl: HyperliquidClient, buffer_mgr: BufferManager, address: str) -> None:
-    print(f"[funding] Fetching funding for {address[:8]}...")
-    start_time_ms = int((_now() - timedelta(days=30)).timestamp() * 1000)
-    funding = hl.get_user_funding(start_time=start_time_ms) or []
+def buffer_funding(funding: List[Dict[str, Any]], buffer_mgr: BufferManager, address: str) -> None:
     if not funding:
-        print(f"[funding] No funding payments for {address[:8]}.")
+        print(f"[funding] No new funding payments for {address[:8]}.")
         return
 
-    rows: List[Dict[str, Any]] = []
-    for item in funding:
-        delta = item.get("delta", {}) or {}
-        rows.append({
-            "time": item["time"],
-            "coin": delta.get("coin", ""),
-            "usdc": delta.get("usdc", 0.0),
-            "szi": delta.get("szi", 0.0),
-            "fundingRate": delta.get("fundingRate", 0.0),
-        })
+    table = decode_funding(funding, address)
+    buffer_mgr.save(table, "funding")
+    print(f"[funding] Buffered {table.num_rows} rows for {address[:8]}.")
 
-    df = pd.DataFrame(rows)
-    df["time"] = pd.to_datetime(df["time"], unit="ms")
-    df["usdc"] = df["usdc"].astype(float)
-    df["szi"] = df["szi"].astype(float)
-    df["fundingRate"] = df["fundingRate"].astype(float)
-    df["tid"] = df["time"].astype("int64") // 10**6
-    df["address"] = address
 
-    buffer_mgr.save(df, "funding")
-    print(f"[funding] Buffered {len(df)} rows for {address[:8]}.")
+def sync_ledger(hl: HyperliquidClient, buffer_mgr: BufferManager, address: str, cursors: CursorStore = None) -> None:
+    cursors = cursors or CursorStore()
+    print(f"[ledger] Fetching new ledger updates for {address[:8]}...")
+    updates, _ = fetch_new_ledger(hl, cursors, address)
+    buffer_past_cursor(cursors, address, "ledger", updates, buffer_ledger, buffer_mgr)
 
 
-def sync_ledger(hl: HyperliquidClient, buffer_mgr: BufferManager, address: str) -> None:
-    print(f"[ledger] Fetching ledger updates for {address[:8]}...")
-    start_time_ms = int((_now() - timedelta(days=30)).timestamp() * 1000)
-    updates = hl.get_user_non_funding_ledger_updates(start_time=start_time_ms) or []
+def buffer_ledger(updates: List[Dict[str, Any]], buffer_mgr: BufferManager, address: str) -> None:
     if not updates:
-        print(f"[ledger] No ledger updates for {address[:8]}.")
+        print(f"[ledger] No new ledger updates for {address[:8]}.")
         return
 
-    import json
-    rows: List[Dict[str, Any]] = []
-    for item in updates:
-        delta = item.get("delta", {}) or {}
-        rows.append({
-            "time": item["time"],
-            "hash": item.get("hash", ""),
-            "type": delta.get("type", "unknown"),
-            "usdc": float(delta.get("usdc", 0.0) or 0.0),
-            "coin": delta.get("coin", ""),
-            "raw_json": json.dumps(delta),
-        })
-
-    df = pd.DataFrame(rows)
-    df["time"] = pd.to_datetime(df["time"], unit="ms")
-    df["address"] = address
-    
-    buffer_mgr.save(df, "ledger")
-    print(f"[ledger] Buffered {len(df)} updates for {address[:8]}.")
+    table = decode_ledger(updates, address)
+    buffer_mgr.save(table, "ledger")
+    print(f"[ledger] Buffered {table.num_rows} updates for {address[:8]}.")
 
 
 def _discover_target_coins() -> List[str]:
@@ -219,44 +297,77 @@ def _discover_target_coins() -> List[str]:
     return sorted({"BTC", "ETH", "SOL", "HYPE", "XRP", "DOGE"})
 
 
-def sync_candles(hl: HyperliquidClient, buffer_mgr: BufferManager) -> None:
-    """Global market data (not per-account)."""
-    print("[candles] Fetching OHLCV candles...")
+def sync_market_snapshot(hl: HyperliquidClient, buffer_mgr: BufferManager) -> None:
+    """Marks, mids, funding and OI for the whole universe from one metaAndAssetCtxs call."""
+    print("[market] Fetching metaAndAssetCtxs...")
+    try:
+        meta, ctxs = hl.get_meta_and_asset_ctxs()
+    except Exception as e:
+        print(f"[market] Error fetching asset contexts: {e}")
+        return
+
+    table = decode_asset_ctxs(meta.get("universe", []), ctxs, _now())
+    if table.num_rows:
+        buffer_mgr.save(table, "market")
+        print(f"[market] Buffered market snapshot for {table.num_rows} coins.")
+
+
+def sync_candles(hl: HyperliquidClient, buffer_mgr: BufferManager, cursors: CursorStore = None) -> None:
+    """Global market data (not per-account).
+
+    Current prices come from sync_market_snapshot; candles are only requested
+    when a bar has closed since the last one buffered for that (coin, interval).
+    """
+    cursors = cursors or CursorStore()
+    print("[candles] Filling OHLCV candle gaps...")
     coins = _discover_target_coins()
     intervals = [("1h", 48), ("1d", 7 * 24)]
-    all_rows: List[Dict[str, Any]] = []
+    tables: List[pa.Table] = []
+    advanced: Dict[str, Dict[str, Any]] = {}
 
     now_ms = int(_now().timestamp() * 1000)
     for coin in coins:
         for interval, hours_back in intervals:
-            start_ms = int((_now() - timedelta(hours=hours_back)).timestamp() * 1000)
+            step_ms = CANDLE_INTERVAL_MS[interval]
+            stream = f"candles:{coin}:{interval}"
+            cursor = cursors.get(GLOBAL_CURSOR_KEY, stream)
+            if cursor is None:
+                start_ms = int((_now() - timedelta(hours=hours_back)).timestamp() * 1000)
+            else:
+                # Re-fetch from the bar after the last closed one we have.
+                start_ms = int(cursor["time"]) + step_ms
+                if start_ms + step_ms > now_ms:
+                    continue
             try:
                 candles = hl.get_candles(coin, interval, start_ms, now_ms) or []
             except Exception as e:
                 print(f"[candles] Error fetching {interval} candles for {coin}: {e}")
                 continue
 
-            for c in candles:
-                all_rows.append({
-                    "coin": coin,
-                    "interval": interval,
-                    "ts": c["t"],
-                    "open": float(c["o"]),
-                    "high": float(c["h"]),
-                    "low": float(c["l"]),
-                    "close": float(c["c"]),
-                    "volume": float(c["v"]),
-                })
-
-    if all_rows:
-        df = pd.DataFrame(all_rows)
-        df["ts"] = pd.to_datetime(df["ts"], unit="ms")
-        buffer_mgr.save(df, "candles")
-        print(f"[candles] Buffered {len(df)} candle rows.")
-
-
-def sync_meta(hl: HyperliquidClient, buffer_mgr: BufferManager) -> None:
-    """Global metadata (not per-account)."""
+            closed = [int(c["t"]) for c in candles if int(c["t"]) + step_ms <= now_ms]
+            if closed:
+                advanced[stream] = {"time": max(closed)}
+
+            if candles:
+                tables.append(decode_candles(candles, coin, interval))
+
+    if tables:
+        table = pa.concat_tables(tables)
+        buffer_mgr.save(table, "candles")
+        print(f"[candles] Buffered {table.num_rows} candle rows.")
+    else:
+        print("[candles] No candle gaps to fill.")
+    for stream, cursor in advanced.items():
+        cursors.set(GLOBAL_CURSOR_KEY, stream, cursor)
+
+
+def sync_meta(hl: HyperliquidClient, buffer_mgr: BufferManager, cursors: CursorStore = None) -> None:
+    """Global metadata (not per-account).
+
+    `meta` is served from the response cache (about one API call a day) and
+    rows are only buffered when the universe's content hash changes.
+    """
+    cursors = cursors or CursorStore()
     print("[meta] Fetching exchange metadata...")
     try:
         meta_info = hl.get_meta_info() or {}
@@ -265,6 +376,12 @@ def sync_meta(hl: HyperliquidClient, buffer_mgr: BufferManager) -> None:
         print(f"[meta] Error fetching metadata: {e}")
         return
 
+    meta_hash = content_hash(meta_info)
+    last = cursors.get(GLOBAL_CURSOR_KEY, "meta")
+    if last and last.get("hash") == meta_hash:
+        print("[meta] Metadata unchanged since last buffered snapshot; skipping.")
+        return
+
     rows: List[Dict[str, Any]] = []
     ts = _now()
     min_notional_env = float(os.getenv("MIN_NOTIONAL_USD", "10"))
@@ -303,40 +420,173 @@ def sync_meta(hl: HyperliquidClient, buffer_mgr: BufferManager) -> None:
         df = pd.DataFrame(rows)
         buffer_mgr.save(df, "meta")
         print(f"[meta] Buffered metadata for {len(df)} symbols.")
+    cursors.set(GLOBAL_CURSOR_KEY, "meta", {"hash": meta_hash, "time": int(ts.timestamp() * 1000)})
+
 
+def _run_context() -> Tuple[List[str], BufferManager, CursorStore]:
+    """Accounts, buffer and cursors for this run.
 
-def main():
-    print(f"[scheduled_ping_hyperliquid] Starting at {_now()}")
+    A cassette replay (HL_CASSETTE_MODE=replay) keeps its buffer and cursors
+    under the cassette directory, so offline runs never touch the live ones.
+    """
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        return (
+            cassette.addresses(HYPERLIQUID_ADDRESSES),
+            BufferManager(buffer_dir=os.path.join(cassette.path, "buffer")),
+            CursorStore(os.path.join(cassette.path, "state", "cursors.json")),
+        )
+    return list(HYPERLIQUID_ADDRESSES), BufferManager(), CursorStore()
+
+
+def _write_request_metrics(started_at: datetime, accounts: int) -> None:
+    """Dump per-request-type latency/bytes/status for this run to data/metrics/."""
+    path = os.path.join(METRICS_DIR, f"hl_ping_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+    try:
+        METRICS.write(path, extra={
+            "accounts": accounts,
+            "wall_time_s": round((_now() - started_at).total_seconds(), 3),
+        })
+        print(f"[metrics] Wrote request metrics to {path}")
+    except Exception as e:
+        print(f"[metrics] Could not write request metrics: {e}")
+        return
+
+    for req_type, m in sorted(METRICS.summary().items()):
+        print(
+            f"[metrics] {req_type:<28} n={m['count']:<4} p50={m['p50_ms']:.0f}ms "
+            f"p95={m['p95_ms']:.0f}ms p99={m['p99_ms']:.0f}ms bytes={m['bytes']}"
+        )
+
+
+async def sync_account_concurrent(
+    ahl: AsyncHyperliquidClient, buffer_mgr: BufferManager, address: str, cursors: CursorStore
+) -> None:
+    """Fire every per-account endpoint at once, then buffer each result."""
+    # (tag, fetch coroutine, buffer fn, cursor stream or None)
+    jobs = [
+        ("account/positions", ahl.fetch_account_state(), buffer_account_state, None),
+        ("trades", ahl.run(fetch_new_fills, cursors, address, budget_s=PING_PAGE_WALK_BUDGET_S),
+         buffer_trades, "fills"),
+        ("orders", ahl.get_historical_orders(), buffer_orders, None),
+        ("funding", ahl.run(fetch_new_funding, cursors, address, budget_s=PING_PAGE_WALK_BUDGET_S),
+         buffer_funding, "funding"),
+        ("ledger", ahl.run(fetch_new_ledger, cursors, address, budget_s=PING_PAGE_WALK_BUDGET_S),
+         buffer_ledger, "ledger"),
+    ]
+    results = await asyncio.gather(*(coro for _, coro, _, _ in jobs), return_exceptions=True)
+
+    loop = asyncio.get_running_loop()
+    for (tag, _, buffer_fn, stream), result in zip(jobs, results):
+        if isinstance(result, BaseException):
+            print(f"[{tag}] Error fetching for {address[:8]}: {result!r}")
+            continue
+        try:
+            if stream is not None:
+                await loop.run_in_executor(ahl.executor, buffer_past_cursor, cursors, address, stream,
+                                           result[0], buffer_fn, buffer_mgr)
+            else:
+                await loop.run_in_executor(ahl.executor, buffer_fn, result, buffer_mgr, address)
+        except Exception as e:
+            print(f"[{tag}] Error buffering for {address[:8]}: {e}")
+
+
+async def run_concurrent(
+    addresses: List[str],
+    buffer_mgr: BufferManager,
+    cursors: CursorStore,
+    max_concurrency: int,
+    request_deadline: float,
+    run_budget: float,
+) -> None:
+    """Fan out global syncs and all accounts × endpoints under one budget."""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="hl-ping")
+    hl_global = HyperliquidClient(addresses[0])
+
+    tasks: Dict[str, asyncio.Future] = {
+        "market": loop.run_in_executor(executor, sync_market_snapshot, hl_global, buffer_mgr),
+        "candles": loop.run_in_executor(executor, sync_candles, hl_global, buffer_mgr, cursors),
+        "meta": loop.run_in_executor(executor, sync_meta, hl_global, buffer_mgr, cursors),
+    }
+    for address in addresses:
+        ahl = AsyncHyperliquidClient(
+            address, semaphore=semaphore, executor=executor, request_deadline=request_deadline
+        )
+        tasks[address] = asyncio.ensure_future(sync_account_concurrent(ahl, buffer_mgr, address, cursors))
+
+    done, pending = await asyncio.wait(tasks.values(), timeout=run_budget)
+    for name, task in tasks.items():
+        if task in pending:
+            task.cancel()
+            print(f"[main] {name[:10]} did not finish within the {run_budget:.0f}s run budget; skipped this run.")
+        elif task.exception() is not None:
+            print(f"[main] {name[:10]} failed: {task.exception()!r}")
+
+    # Don't wait on stragglers; their requests are bounded by HL_REQUEST_TIMEOUT.
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Buffer-only Hyperliquid ping.")
+    parser.add_argument(
+        "--concurrent", action="store_true", default=PING_MODE == "concurrent",
+        help="Fan out all accounts and endpoints at once (default from HL_PING_MODE).",
+    )
+    parser.add_argument("--max-concurrency", type=int, default=PING_MAX_CONCURRENCY)
+    parser.add_argument("--request-deadline", type=float, default=PING_REQUEST_DEADLINE_S)
+    parser.add_argument("--run-budget", type=float, default=PING_RUN_BUDGET_S)
+    args = parser.parse_args(argv)
+
+    started_at = _now()
+    METRICS.reset()
+    print(f"[scheduled_ping_hyperliquid] Starting at {started_at}")
     
     if not HYPERLIQUID_ADDRESSES:
         print("No addresses configured in HYPERLIQUID_ADDRESSES.")
         return
 
+    addresses, buffer_mgr, cursors = _run_context()
+    cassette = get_cassette()
+    if cassette is not None:
+        print(f"[main] Cassette {cassette.mode}: {cassette.path} ({len(addresses)} accounts)")
+
+    if args.concurrent:
+        print(
+            f"[main] Concurrent mode: {len(addresses)} accounts, "
+            f"max_concurrency={args.max_concurrency}, deadline={args.request_deadline:.0f}s, "
+            f"budget={args.run_budget:.0f}s"
+        )
+        asyncio.run(run_concurrent(
+            addresses, buffer_mgr, cursors, args.max_concurrency, args.request_deadline, args.run_budget
+        ))
+        _write_request_metrics(started_at, len(addresses))
+        print(f"\n[scheduled_ping_hyperliquid] Done at {_now()}")
+        return
+
     # 1. Global Syncs (using the first address as client, doesn't matter which)
-    print("[main] Running global syncs (candles, meta)...")
-    hl_global = HyperliquidClient(HYPERLIQUID_ADDRESSES[0])
-    buffer_mgr = BufferManager()
+    print("[main] Running global syncs (market snapshot, candles, meta)...")
+    hl_global = HyperliquidClient(addresses[0])
     
-    sync_candles(hl_global, buffer_mgr)
-    sync_meta(hl_global, buffer_mgr)
+    sync_market_snapshot(hl_global, buffer_mgr)
+    sync_candles(hl_global, buffer_mgr, cursors)
+    sync_meta(hl_global, buffer_mgr, cursors)
 
     # 2. Per-Account Syncs
-    for address in HYPERLIQUID_ADDRESSES:
+    for address in addresses:
         print(f"\n[main] Processing account: {address}...")
         hl = HyperliquidClient(address)
         
         sync_account_and_positions(hl, buffer_mgr, address)
-        sync_trades(hl, buffer_mgr, address)
+        sync_trades(hl, buffer_mgr, address, cursors)
         sync_orders(hl, buffer_mgr, address)
-        sync_funding(hl, buffer_mgr, address)
-        sync_ledger(hl, buffer_mgr, address)
+        sync_funding(hl, buffer_mgr, address, cursors)
+        sync_ledger(hl, buffer_mgr, address, cursors)
 
+    _write_request_metrics(started_at, len(addresses))
     print(f"\n[scheduled_ping_hyperliquid] Done at {_now()}")
 
 
 if __name__ == "__main__":
     main()
-
-
-if __name__ == "__main__":
-    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+stream_hyperliquid.py
+---------------------
+
+Long-running WebSocket ingest for tracked accounts (complements the
+15-minute `scheduled_ping_hyperliquid.py` poll):
+
+  - One connection per address to HYPERLIQUID_WS_URL, subscribed to
+    `userFills`, `orderUpdates` and `webData2` (clearinghouse state).
+  - Messages are accumulated in memory and written every few seconds as
+    micro-batches through BufferManager, using the same prefixes as the ping
+    (`trades`, `orders`, `account`, `positions`), so the 3-hour flush needs
+    no changes.
+  - Fills are checked against and advance the same per-address cursor as the
+    ping (`data/state/cursors.json`); filtering, buffering and advancing
+    happen under the cursor store's file lock, so the stream, its REST
+    back-fill and the ping do not buffer the same fill twice.
+  - On every (re)connect the REST cursor path back-fills fills missed while
+    disconnected.
+
+Needs the `websockets` package. Point --ws-url at the local stand-in server
+(scripts/hl_ws_standin.py) to test without the exchange:
+
+    python3 scripts/hl_ws_standin.py --port 8765 --drop-after 20 &
+    python3 scheduled_processes/stream_hyperliquid.py --ws-url ws://127.0.0.1:8765 --run-seconds 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from config.settings import HYPERLIQUID_ADDRESSES, HYPERLIQUID_WS_URL  # noqa: E402
+from modules.buffer_manager import BufferManager  # noqa: E402
+from modules.cursor_store import CursorStore  # noqa: E402
+from modules.hyperliquid_client import HyperliquidClient, parse_account_state  # noqa: E402
+from scheduled_processes.scheduled_ping_hyperliquid import (  # noqa: E402
+    buffer_account_state,
+    buffer_orders,
+    buffer_past_cursor,
+    buffer_trades,
+    sync_trades,
+)
+
+FLUSH_INTERVAL_S = float(os.getenv("HL_STREAM_FLUSH_INTERVAL_S", "5"))
+ACCOUNT_INTERVAL_S = float(os.getenv("HL_STREAM_ACCOUNT_INTERVAL_S", "60"))
+# The server drops connections that are silent for 60s.
+HEARTBEAT_INTERVAL_S = 30.0
+RECONNECT_MAX_BACKOFF_S = 60.0
+
+
+class AccountStream:
+    """WebSocket subscription + micro-batch buffering for a single address."""
+
+    def __init__(
+        self,
+        address: str,
+        ws_url: str,
+        buffer_mgr: BufferManager,
+        cursors: CursorStore,
+        flush_interval_s: float = FLUSH_INTERVAL_S,
+        account_interval_s: float = ACCOUNT_INTERVAL_S,
+    ):
+        self.address = address
+        self.ws_url = ws_url
+        self.buffer_mgr = buffer_mgr
+        self.cursors = cursors
+        self.flush_interval_s = flush_interval_s
+        self.account_interval_s = account_interval_s
+        self.hl = HyperliquidClient(address)
+
+        self.pending_fills: List[Dict[str, Any]] = []
+        self.pending_orders: List[Dict[str, Any]] = []
+        self.latest_state: Optional[Dict[str, Any]] = None
+        self.last_account_at = 0.0
+
+    def _subscriptions(self) -> List[Dict[str, Any]]:
+        return [
+            {"type": "userFills", "user": self.address},
+            {"type": "orderUpdates", "user": self.address},
+            {"type": "webData2", "user": self.address},
+        ]
+
+    def handle_message(self, msg: Dict[str, Any]) -> None:
+        channel = msg.get("channel")
+        data = msg.get("data")
+        if channel == "userFills" and isinstance(data, dict):
+            # The initial snapshot repeats history the REST back-fill already covers.
+            if not data.get("isSnapshot"):
+                self.pending_fills.extend(data.get("fills") or [])
+        elif channel == "orderUpdates" and isinstance(data, list):
+            self.pending_orders.extend(data)
+        elif channel == "webData2" and isinstance(data, dict):
+            state = data.get("clearinghouseState")
+            if isinstance(state, dict):
+                self.latest_state = state
+        elif channel == "error":
+            print(f"[stream] {self.address[:8]} server error: {data}")
+
+    def flush(self) -> None:
+        """Write pending fills/orders (and a throttled account snapshot) to the buffer."""
+        if self.pending_fills:
+            fills, self.pending_fills = self.pending_fills, []
+            buffer_past_cursor(self.cursors, self.address, "fills", fills, buffer_trades, self.buffer_mgr)
+
+        if self.pending_orders:
+            orders, self.pending_orders = self.pending_orders, []
+            buffer_orders(orders, self.buffer_mgr, self.address)
+
+        now = time.monotonic()
+        if self.latest_state is not None and now - self.last_account_at >= self.account_interval_s:
+            buffer_account_state(parse_account_state(self.latest_state, self.address), self.buffer_mgr, self.address)
+            self.latest_state = None
+            self.last_account_at = now
+
+    def backfill_gaps(self) -> None:
+        """REST cursor catch-up for fills missed while disconnected."""
+        try:
+            sync_trades(self.hl, self.buffer_mgr, self.address, self.cursors)
+        except Exception as e:
+            print(f"[stream] {self.address[:8]} REST back-fill failed: {e}")
+
+    async def _pump(self, ws) -> None:
+        loop = asyncio.get_running_loop()
+        last_ping = last_flush = time.monotonic()
+        while True:
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=self.flush_interval_s)
+                try:
+                    self.handle_message(json.loads(raw))
+                except ValueError:
+                    print(f"[stream] {self.address[:8]} ignoring non-JSON message")
+            except asyncio.TimeoutError:
+                pass
+
+            now = time.monotonic()
+            if now - last_ping >= HEARTBEAT_INTERVAL_S:
+                await ws.send(json.dumps({"method": "ping"}))
+                last_ping = now
+            if now - last_flush >= self.flush_interval_s:
+                await loop.run_in_executor(None, self.flush)
+                last_flush = now
+
+    async def run(self) -> None:
+        """Connect, subscribe, back-fill, stream; reconnect with backoff forever."""
+        loop = asyncio.get_running_loop()
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.ws_url, ping_interval=None, max_size=None) as ws:
+                    for sub in self._subscriptions():
+                        await ws.send(json.dumps({"method": "subscribe", "subscription": sub}))
+                    print(f"[stream] {self.address[:8]} connected to {self.ws_url}")
+                    # Subscribe first so nothing falls between back-fill and stream.
+                    await loop.run_in_executor(None, self.backfill_gaps)
+                    backoff = 1.0
+                    await self._pump(ws)
+            except asyncio.CancelledError:
+                await loop.run_in_executor(None, self.flush)
+                raise
+            except Exception as e:
+                print(f"[stream] {self.address[:8]} connection lost ({e!r}); reconnecting in {backoff:.0f}s")
+                await loop.run_in_executor(None, self.flush)
+                await asyncio.sleep(backoff)
+                backoff = min(RECONNECT_MAX_BACKOFF_S, backoff * 2)
+
+
+async def run_streams(addresses: List[str], ws_url: str, run_seconds: float,
+                      flush_interval_s: float, account_interval_s: float) -> None:
+    buffer_mgr = BufferManager()
+    cursors = CursorStore()
+    streams = [
+        AccountStream(a, ws_url, buffer_mgr, cursors, flush_interval_s, account_interval_s)
+        for a in addresses
+    ]
+    tasks = [asyncio.ensure_future(s.run()) for s in streams]
+    try:
+        if run_seconds > 0:
+            await asyncio.wait(tasks, timeout=run_seconds)
+        else:
+            await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Stream Hyperliquid fills/orders/account state into the buffer.")
+    parser.add_argument("--ws-url", default=HYPERLIQUID_WS_URL)
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL_S)
+    parser.add_argument("--account-interval", type=float, default=ACCOUNT_INTERVAL_S)
+    parser.add_argument("--run-seconds", type=float, default=0.0, help="Stop after N seconds (0 = run forever)")
+    args = parser.parse_args(argv)
+
+    if not HYPERLIQUID_ADDRESSES:
+        print("No addresses configured in HYPERLIQUID_ADDRESSES.")
+        return
+
+    print(f"[stream_hyperliquid] Streaming {len(HYPERLIQUID_ADDRESSES)} accounts from {args.ws_url}")
+    try:
+        asyncio.run(run_streams(HYPERLIQUID_ADDRESSES, args.ws_url, args.run_seconds,
+                                args.flush_interval, args.account_interval))
+    except KeyboardInterrupt:
+        pass
+    print("[stream_hyperliquid] Stopped.")
+
+
+if __name__ == "__main__":
+    main()
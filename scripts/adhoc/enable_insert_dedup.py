@@ -0,0 +1,54 @@
+"""Enable token-based insert deduplication on the flush target tables.
+
+The flush tags every insert with `insert_deduplication_token`. Replicated /
+Shared MergeTree tables (ClickHouse Cloud) honour it as they are; plain
+MergeTree tables on chenlin only do once `non_replicated_deduplication_window`
+is set, which init_db.sql now does for new tables. This applies it to the
+existing ones on both targets (a failure on one table is reported and skipped).
+
+Usage:
+    python3 scripts/adhoc/enable_insert_dedup.py [--window 1000] [--target local|remote]
+"""
+import argparse
+import os
+import sys
+
+# Add repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from modules.clickhouse_client import connection  # noqa: E402
+from scheduled_processes.flush_hyperliquid_buffers import PREFIX_TABLES  # noqa: E402
+
+
+def enable(client, name: str, window: int) -> None:
+    for _, table in PREFIX_TABLES:
+        engine = client.execute(
+            "SELECT engine FROM system.tables WHERE database = %(db)s AND name = %(name)s",
+            {"db": table.split(".")[0], "name": table.split(".")[1]},
+        )
+        if not engine:
+            print(f"[{name}] {table}: missing, skipped")
+            continue
+        if "Replicated" in engine[0][0] or "Shared" in engine[0][0]:
+            print(f"[{name}] {table}: {engine[0][0]} already deduplicates inserts")
+            continue
+        try:
+            client.execute(f"ALTER TABLE {table} MODIFY SETTING non_replicated_deduplication_window = {window}")
+            print(f"[{name}] {table}: non_replicated_deduplication_window = {window}")
+        except Exception as e:
+            print(f"[{name}] {table}: failed: {e}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Enable insert deduplication on the flush target tables.")
+    parser.add_argument("--window", type=int, default=1000, help="Recent insert tokens remembered per table")
+    parser.add_argument("--target", choices=["local", "remote"], help="Only this target (default both)")
+    args = parser.parse_args()
+
+    for name in ("local", "remote"):
+        if args.target in (None, name):
+            with connection(name) as client:
+                enable(client, name, args.window)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,75 @@
 #!/usr/bin/env python3
-import sys
+"""
+backfill_ohlcv.py
+-----------------
+
+Windowed, concurrent candle backfill into maicro_monitors.candles.
+
+Each (coin, interval) range is split into windows of at most
+MAX_CANDLES_PER_REQUEST candles (the `candleSnapshot` per-request cap), so
+nothing is silently truncated. Windows are fetched on a thread pool; every
+request draws from the shared Hyperliquid weight budget
+(modules/rate_limiter.py), so --workers can be raised without tripping 429s
+for the ping running alongside. Parsed candles are accumulated into large columnar
+batches and inserted with `columnar=True`. Every window is appended to a
+checkpoint file once its batch has been inserted, so a re-run resumes where
+the last one stopped. A window cut short by --end (or now) is checkpointed up
+to its last closed candle and only the rest is fetched next time; a batch
+whose insert fails is dropped and its windows are retried on the next run.
+
+Usage:
+    python3 scripts/backfill_ohlcv.py --interval 1h --start 2024-01-01 --workers 8
+"""
+import argparse
+import json
 import os
+import sys
 import time
-import pandas as pd
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.settings import HYPERLIQUID_ADDRESS
 from modules.hyperliquid_client import HyperliquidClient
-from modules.clickhouse_client import query_df, insert_df
+from modules.clickhouse_client import connection, query_df
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHECKPOINT_DIR = os.path.join(REPO_ROOT, "data", "state")
 
 COINS = ["BTC", "ETH", "SOL", "HYPE"] # Fallback list
 
+TABLE = "maicro_monitors.candles"
+CANDLE_COLUMNS = ["coin", "interval", "ts", "open", "high", "low", "close", "volume", "updated_at"]
+
+# candleSnapshot returns at most this many candles per request.
+MAX_CANDLES_PER_REQUEST = 5000
+
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 3_600_000,
+    "2h": 2 * 3_600_000,
+    "4h": 4 * 3_600_000,
+    "8h": 8 * 3_600_000,
+    "12h": 12 * 3_600_000,
+    "1d": 86_400_000,
+    "3d": 3 * 86_400_000,
+    "1w": 7 * 86_400_000,
+}
+
+Window = Tuple[str, int, int]  # (coin, start_ms, end_ms)
+
+
 def get_traded_coins():
     """Get list of coins from various sources."""
     coins = set(COINS)
-    
+
     queries = [
         "SELECT DISTINCT coin FROM maicro_monitors.trades",
         "SELECT DISTINCT coin FROM maicro_monitors.orders",
@@ -25,7 +77,7 @@ def get_traded_coins():
         "SELECT DISTINCT coin FROM hyperliquid.asset_ctx",
         "SELECT DISTINCT coin FROM hyperliquid.market_data"
     ]
-    
+
     for q in queries:
         try:
             df = query_df(q)
@@ -35,50 +87,192 @@ def get_traded_coins():
                 coins.update(found)
         except Exception as e:
             print(f"Warning: Could not fetch coins with query '{q}': {e}")
-            
+
     return sorted(list(coins))
 
+
+def plan_windows(coins: List[str], interval: str, start_ms: int, end_ms: int) -> List[Window]:
+    """Split [start_ms, end_ms) per coin into windows the API returns in full."""
+    span = INTERVAL_MS[interval] * MAX_CANDLES_PER_REQUEST
+    windows: List[Window] = []
+    for coin in coins:
+        w_start = start_ms
+        while w_start < end_ms:
+            w_end = min(w_start + span, end_ms)
+            windows.append((coin, w_start, w_end))
+            w_start = w_end
+    return windows
+
+
+def _checkpoint_path(interval: str) -> str:
+    return os.path.join(CHECKPOINT_DIR, f"backfill_ohlcv_{interval}.jsonl")
+
+
+def load_checkpoint(interval: str) -> Dict[Tuple[str, int], int]:
+    """(coin, window start) -> furthest end inserted for that window."""
+    done: Dict[Tuple[str, int], int] = {}
+    path = _checkpoint_path(interval)
+    if not os.path.exists(path):
+        return done
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                key = (rec["coin"], int(rec["start"]))
+                done[key] = max(done.get(key, 0), int(rec["end"]))
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def checkpoint_end(interval: str, window: Window) -> int:
+    """End to checkpoint a planned window at: its end if full, else its last closed candle."""
+    coin, start_ms, end_ms = window
+    span = INTERVAL_MS[interval] * MAX_CANDLES_PER_REQUEST
+    if end_ms - start_ms >= span:
+        return end_ms
+    # The candle open at end_ms is still forming; fetch it again next run.
+    return start_ms + (end_ms - start_ms) // INTERVAL_MS[interval] * INTERVAL_MS[interval]
+
+
+def append_checkpoint(interval: str, windows: List[Tuple[Window, int]]) -> None:
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    with open(_checkpoint_path(interval), "a") as f:
+        for (coin, start, end), n in windows:
+            f.write(json.dumps({"coin": coin, "start": start, "end": end, "rows": n}) + "\n")
+
+
+def fetch_window(hl: HyperliquidClient, interval: str, window: Window) -> Dict[str, list]:
+    """Fetch one window and return it as column lists (see CANDLE_COLUMNS)."""
+    coin, start_ms, end_ms = window
+    # candleSnapshot's endTime is inclusive; stop one ms short of the next window.
+    candles = hl.get_candles(coin, interval, start_ms, end_ms - 1) or []
+    return {
+        "ts": [datetime.utcfromtimestamp(c["t"] / 1000.0) for c in candles],
+        "open": [float(c["o"]) for c in candles],
+        "high": [float(c["h"]) for c in candles],
+        "low": [float(c["l"]) for c in candles],
+        "close": [float(c["c"]) for c in candles],
+        "volume": [float(c["v"]) for c in candles],
+    }
+
+
+class ColumnBatch:
+    """Accumulates parsed windows column-wise until a batch is worth inserting."""
+
+    def __init__(self, interval: str):
+        self.interval = interval
+        self.columns: Dict[str, list] = {c: [] for c in CANDLE_COLUMNS}
+        self.windows: List[Tuple[Window, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.columns["ts"])
+
+    def add(self, window: Window, cols: Dict[str, list]) -> None:
+        """Add a fetched window; `window` is the (coin, start, end) to checkpoint it as."""
+        n = len(cols["ts"])
+        now = datetime.utcnow()
+        self.columns["coin"].extend([window[0]] * n)
+        self.columns["interval"].extend([self.interval] * n)
+        for c in ("ts", "open", "high", "low", "close", "volume"):
+            self.columns[c].extend(cols[c])
+        self.columns["updated_at"].extend([now] * n)
+        self.windows.append((window, n))
+
+    def flush(self) -> int:
+        """Insert the batch in native columnar form and checkpoint its windows."""
+        n = len(self)
+        columns, windows = self.columns, self.windows
+        # Start over either way: a failed batch is not checkpointed, so its
+        # windows are fetched again by the next run.
+        self.columns = {c: [] for c in CANDLE_COLUMNS}
+        self.windows = []
+        if n:
+            with connection() as client:
+                client.execute(
+                    f"INSERT INTO {TABLE} ({', '.join(CANDLE_COLUMNS)}) VALUES",
+                    [columns[c] for c in CANDLE_COLUMNS],
+                    columnar=True,
+                )
+        append_checkpoint(self.interval, windows)
+        return n
+
+
+def _flush(batch: ColumnBatch, inserted: int, failed: int) -> Tuple[int, int]:
+    """Flush `batch`, counting its windows as failed if the insert does not go through."""
+    n_windows = len(batch.windows)
+    try:
+        inserted += batch.flush()
+    except Exception as e:
+        failed += n_windows
+        print(f"[backfill] Error inserting a batch of {n_windows} windows: {e}")
+    return inserted, failed
+
+
+def run_backfill(coins: List[str], interval: str, start_ms: int, end_ms: int,
+                 workers: int, batch_rows: int) -> None:
+    windows = plan_windows(coins, interval, start_ms, end_ms)
+    done = load_checkpoint(interval)
+    # fetch window -> (coin, planned start, end to checkpoint)
+    todo: Dict[Window, Window] = {}
+    for coin, w_start, w_end in windows:
+        covered = max(w_start, done.get((coin, w_start), w_start))
+        if covered < w_end:
+            todo[(coin, covered, w_end)] = (coin, w_start, checkpoint_end(interval, (coin, w_start, w_end)))
+    print(f"[backfill] {len(windows)} windows planned for {len(coins)} coins @ {interval}; "
+          f"{len(windows) - len(todo)} already checkpointed, {len(todo)} to fetch.")
+    if not todo:
+        return
+
+    hl = HyperliquidClient(HYPERLIQUID_ADDRESS)
+    batch = ColumnBatch(interval)
+    inserted = 0
+    failed = 0
+    t0 = time.time()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ohlcv") as pool:
+        futures = {pool.submit(fetch_window, hl, interval, w): w for w in todo}
+        for i, fut in enumerate(as_completed(futures), 1):
+            window = futures[fut]
+            try:
+                batch.add(todo[window], fut.result())
+            except Exception as e:
+                failed += 1
+                print(f"[backfill] Error fetching {window[0]} {interval} window starting "
+                      f"{datetime.utcfromtimestamp(window[1] / 1000):%Y-%m-%d %H:%M}: {e}")
+                continue
+            if len(batch) >= batch_rows:
+                inserted, failed = _flush(batch, inserted, failed)
+                print(f"[backfill] {i}/{len(todo)} windows, {inserted} rows inserted "
+                      f"({inserted / max(time.time() - t0, 1e-9):.0f} rows/s)")
+
+    inserted, failed = _flush(batch, inserted, failed)
+    print(f"[backfill] Done: {inserted} rows inserted in {time.time() - t0:.1f}s; "
+          f"{failed} windows failed (re-run to retry them).")
+
+
+def _parse_date_ms(s: str) -> int:
+    return int(datetime.strptime(s, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Backfill Hyperliquid candles into ClickHouse.")
+    parser.add_argument("--interval", default="1d", choices=sorted(INTERVAL_MS))
+    parser.add_argument("--start", default="2023-01-01", help="UTC start date (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="UTC end date (YYYY-MM-DD); default now")
+    parser.add_argument("--coins", default=None, help="Comma-separated coins; default traded universe")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-rows", type=int, default=200_000)
+    args = parser.parse_args()
+
     print("Starting OHLCV BACKFILL...")
-    hl = HyperliquidClient(HYPERLIQUID_ADDRESS)
-    
-    target_coins = get_traded_coins()
+    target_coins = args.coins.split(",") if args.coins else get_traded_coins()
     print(f"Target coins: {target_coins}")
-    
-    end_time = int(time.time() * 1000)
-    # Start from Jan 1, 2023
-    start_time = int(datetime(2023, 1, 1).timestamp() * 1000)
 
-    for coin in target_coins:
-        try:
-            print(f"Fetching {coin} from 2023-01-01...")
-            candles = hl.get_candles(coin, "1d", start_time, end_time)
-            if not candles:
-                print(f"No candles for {coin}")
-                continue
-                
-            df = pd.DataFrame(candles)
-            # API: t, T, s, i, o, c, h, l, v, n
-            # We need: coin, interval, ts, open, high, low, close, volume
-            
-            df['coin'] = coin
-            df['interval'] = '1d'
-            df['ts'] = pd.to_datetime(df['t'], unit='ms')
-            df['open'] = df['o'].astype(float)
-            df['high'] = df['h'].astype(float)
-            df['low'] = df['l'].astype(float)
-            df['close'] = df['c'].astype(float)
-            df['volume'] = df['v'].astype(float)
-            df['updated_at'] = datetime.now()
-            
-            cols = ['coin', 'interval', 'ts', 'open', 'high', 'low', 'close', 'volume', 'updated_at']
-            df = df[cols]
-            
-            insert_df('maicro_monitors.candles', df)
-            print(f"Inserted {len(df)} candles for {coin}")
-            
-        except Exception as e:
-            print(f"Error fetching {coin}: {e}")
+    start_ms = _parse_date_ms(args.start)
+    end_ms = _parse_date_ms(args.end) if args.end else int(time.time() * 1000)
+    run_backfill(target_coins, args.interval, start_ms, end_ms,
+                 args.workers, args.batch_rows)
 
 if __name__ == "__main__":
     main()
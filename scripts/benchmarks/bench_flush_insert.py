@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark: flush insert path, row tuples (iterrows) vs columnar native insert.
+
+Builds a synthetic trades backlog (1M rows by default) in the buffer schema,
+then times, per path, the Python-side conversion plus clickhouse-driver's
+Native-protocol encoding of the blocks it would send:
+  - legacy:   to_pandas → iterrows tuples → row-oriented blocks
+  - columnar: clickhouse_client.to_columns → column-oriented blocks
+              (`execute(..., columnar=True)`, what flush_prefix/insert_df use)
+
+Encoding writes to a byte-counting fake socket, so no server is needed. With
+`--target local|remote` each path is also inserted for real into a scratch
+`ENGINE = Null` copy of maicro_monitors.trades (created and dropped here).
+
+Usage:
+    python3 scripts/benchmarks/bench_flush_insert.py [--rows 1000000] [--repeat 1] [--target local]
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Any, Callable, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from clickhouse_driver import Client, defines  # noqa: E402
+from clickhouse_driver.block import ColumnOrientedBlock, RowOrientedBlock  # noqa: E402
+from clickhouse_driver.bufferedwriter import BufferedSocketWriter  # noqa: E402
+from clickhouse_driver.connection import ServerInfo  # noqa: E402
+from clickhouse_driver.context import Context  # noqa: E402
+from clickhouse_driver.streams.native import BlockOutputStream  # noqa: E402
+from clickhouse_driver.util.helpers import chunks, column_chunks  # noqa: E402
+
+from modules.buffer_schemas import conform  # noqa: E402
+from modules.clickhouse_client import to_columns  # noqa: E402
+
+COINS = ["BTC", "ETH", "SOL", "HYPE", "XRP", "DOGE", "AVAX", "LINK"]
+ADDRESSES = [f"0x{i:040x}" for i in range(1, 6)]
+
+# maicro_monitors.trades (scripts/sql/init_db.sql)
+TRADE_TYPES: List[Tuple[str, str]] = [
+    ("coin", "String"), ("side", "String"), ("px", "Float64"), ("sz", "Float64"),
+    ("time", "DateTime64(3)"), ("hash", "String"), ("startPosition", "Float64"),
+    ("dir", "String"), ("closedPnl", "Float64"), ("oid", "Int64"), ("cloid", "String"),
+    ("fee", "Float64"), ("tid", "Int64"),
+]
+
+
+class _NullSocket:
+    """Counts what the driver would send over the wire."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def sendall(self, data):
+        self.bytes += len(data)
+
+
+def synthetic_trades(n: int) -> pa.Table:
+    rng = np.random.default_rng(7)
+    t0 = np.datetime64("2026-01-01T00:00:00", "ms")
+    hashes = [f"0x{h:016x}" for h in rng.integers(0, 2**62, n)]
+    return conform(pa.table({
+        "coin": pa.array(np.array(COINS)[rng.integers(0, len(COINS), n)]),
+        "side": pa.array(np.array(["A", "B"])[rng.integers(0, 2, n)]),
+        "px": rng.uniform(1, 100000, n),
+        "sz": rng.uniform(0.001, 10, n),
+        "time": pa.array(t0 + np.arange(n) * 250),
+        "hash": pa.array(hashes),
+        "startPosition": rng.uniform(-100, 100, n),
+        "dir": pa.array(np.array(["Open Long", "Close Long", "Open Short", "Close Short"])[rng.integers(0, 4, n)]),
+        "closedPnl": rng.uniform(-50, 50, n),
+        "oid": 40_000_000_000 + np.arange(n),
+        "cloid": pa.array([""] * n),
+        "fee": rng.uniform(0, 2, n),
+        "tid": 900_000_000_000_000 + np.arange(n),
+        "address": pa.array(np.array(ADDRESSES)[rng.integers(0, len(ADDRESSES), n)]),
+    }), "trades")
+
+
+def _context() -> Context:
+    ctx = Context()
+    ctx.server_info = ServerInfo("bench", 24, 8, 0, defines.CLIENT_REVISION, "UTC", "bench",
+                                 defines.CLIENT_REVISION)
+    ctx.client_settings = Client("localhost").connection.context.client_settings
+    ctx.settings = {}
+    return ctx
+
+
+def legacy_payload(table: pa.Table, cols: List[str]) -> List[tuple]:
+    df = table.to_pandas()[cols]
+    return [tuple(row[c] for c in cols) for _, row in df.iterrows()]
+
+
+def encode(payload: List[Any], columnar: bool) -> int:
+    ctx = _context()
+    sock = _NullSocket()
+    stream = BlockOutputStream(BufferedSocketWriter(sock, defines.BUFFER_SIZE), ctx)
+    block_cls = ColumnOrientedBlock if columnar else RowOrientedBlock
+    slicer = column_chunks if columnar else chunks
+    for chunk in slicer(payload, ctx.client_settings["insert_block_size"]):
+        stream.write(block_cls(TRADE_TYPES, chunk))
+    return sock.bytes
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--target", choices=["local", "remote"],
+                        help="Also insert into a scratch Null-engine table on this ClickHouse target")
+    args = parser.parse_args()
+
+    table = synthetic_trades(args.rows)
+    cols = [name for name, _ in TRADE_TYPES]
+    print(f"backlog: {args.rows} trades rows ({table.nbytes / 1e6:.1f} MB in Arrow); best of {args.repeat}")
+
+    results = {}
+    for name, build, columnar in (
+        ("legacy  ", lambda: legacy_payload(table, cols), False),
+        ("columnar", lambda: to_columns(table, cols), True),
+    ):
+        build_s, payload = timed(build, args.repeat)
+        encode_s, nbytes = timed(lambda: encode(payload, columnar), args.repeat)
+        total = build_s + encode_s
+        results[name] = total
+        print(f"  {name}  build {build_s:7.2f}s  encode {encode_s:7.2f}s  "
+              f"{args.rows / total:12,.0f} rows/s  ({nbytes / 1e6:.1f} MB native)")
+    print(f"  speedup {results['legacy  '] / results['columnar']:.1f}x")
+
+    if args.target:
+        from modules.clickhouse_client import connection
+
+        scratch = "maicro_monitors.bench_flush_insert"
+        sql = f"INSERT INTO {scratch} ({', '.join(cols)}) VALUES"
+        with connection(args.target) as client:
+            client.execute(f"CREATE TABLE IF NOT EXISTS {scratch} AS maicro_monitors.trades ENGINE = Null")
+            try:
+                legacy_s, _ = timed(lambda: client.execute(sql, legacy_payload(table, cols)), args.repeat)
+                columnar_s, _ = timed(lambda: client.execute(sql, to_columns(table, cols), columnar=True),
+                                      args.repeat)
+            finally:
+                client.execute(f"DROP TABLE IF EXISTS {scratch}")
+        print(f"  {args.target} insert: legacy {args.rows / legacy_s:,.0f} rows/s, "
+              f"columnar {args.rows / columnar_s:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
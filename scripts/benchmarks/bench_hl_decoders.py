@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Hyperliquid response parsing, legacy pandas path vs hl_decoders.
+
+Builds a synthetic 10k-fill / 2k-order payload shaped like `userFills` and
+`historicalOrders`, then times:
+  - JSON parsing of the raw bytes (stdlib json vs hl_decoders.loads)
+  - row-dict → pd.DataFrame → astype(float) (the pre-decoder ping code)
+  - schema-driven Arrow decoding (+ to_pandas, which is what gets buffered)
+
+Usage:
+    python3 scripts/benchmarks/bench_hl_decoders.py [--fills 10000] [--orders 2000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from modules.hl_decoders import decode_fills, decode_orders, loads  # noqa: E402
+
+ADDRESS = "0x17f9d0098111D6Ae0915f980517264F082dB7206"
+COINS = ["BTC", "ETH", "SOL", "HYPE", "XRP", "DOGE", "AVAX", "LINK"]
+
+
+def synthetic_fills(n: int) -> List[Dict[str, Any]]:
+    t0 = 1_733_000_000_000
+    return [
+        {
+            "coin": random.choice(COINS),
+            "px": f"{random.uniform(1, 100000):.4f}",
+            "sz": f"{random.uniform(0.001, 10):.5f}",
+            "side": random.choice("AB"),
+            "time": t0 + i * 250,
+            "startPosition": f"{random.uniform(-100, 100):.5f}",
+            "dir": random.choice(["Open Long", "Close Short", "Open Short", "Close Long"]),
+            "closedPnl": f"{random.uniform(-50, 50):.6f}",
+            "hash": f"0x{random.getrandbits(256):064x}",
+            "oid": 40_000_000_000 + i,
+            "crossed": random.random() < 0.5,
+            "fee": f"{random.uniform(0, 2):.6f}",
+            "tid": 900_000_000_000_000 + i,
+            "cloid": None if random.random() < 0.8 else f"0x{random.getrandbits(128):032x}",
+            "feeToken": "USDC",
+        }
+        for i in range(n)
+    ]
+
+
+def synthetic_orders(n: int) -> List[Dict[str, Any]]:
+    t0 = 1_733_000_000_000
+    return [
+        {
+            "order": {
+                "coin": random.choice(COINS),
+                "side": random.choice("AB"),
+                "limitPx": f"{random.uniform(1, 100000):.4f}",
+                "sz": f"{random.uniform(0, 10):.5f}",
+                "oid": 40_000_000_000 + i,
+                "timestamp": t0 + i * 1000,
+                "origSz": f"{random.uniform(0, 10):.5f}",
+                "orderType": random.choice(["Limit", "Market"]),
+                "reduceOnly": random.random() < 0.3,
+                "tif": "Gtc",
+                "cloid": None,
+            },
+            "status": random.choice(["filled", "canceled", "open"]),
+            "statusTimestamp": t0 + i * 1000 + 5,
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_fills(fills: List[Dict[str, Any]], address: str) -> pd.DataFrame:
+    df = pd.DataFrame(fills)
+    df["time"] = pd.to_datetime(df["time"], unit="ms")
+    for col in ["px", "sz", "fee", "closedPnl", "startPosition"]:
+        if col in df.columns:
+            df[col] = df[col].astype(float)
+    cols = ["coin", "side", "px", "sz", "time", "hash", "startPosition",
+            "dir", "closedPnl", "oid", "cloid", "fee", "tid"]
+    df = df[[c for c in cols if c in df.columns]].copy()
+    df["address"] = address
+    return df
+
+
+def legacy_orders(orders: List[Dict[str, Any]], address: str) -> pd.DataFrame:
+    flat_orders = []
+    for o in orders:
+        order = (o.get("order") or {}).copy()
+        order["status"] = o.get("status", "")
+        flat_orders.append(order)
+    df = pd.DataFrame(flat_orders)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
+    for col in ["limitPx", "sz"]:
+        df[col] = df[col].astype(float)
+    cols = ["coin", "side", "limitPx", "sz", "oid", "timestamp", "status", "orderType", "reduceOnly"]
+    df = df[[c for c in cols if c in df.columns]].copy()
+    df["address"] = address
+    return df
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--fills", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(7)
+    fills = synthetic_fills(args.fills)
+    orders = synthetic_orders(args.orders)
+    fills_raw = json.dumps(fills).encode()
+    orders_raw = json.dumps(orders).encode()
+
+    cases = [
+        ("json.loads  fills", lambda: json.loads(fills_raw)),
+        ("loads       fills", lambda: loads(fills_raw)),
+        ("json.loads  orders", lambda: json.loads(orders_raw)),
+        ("loads       orders", lambda: loads(orders_raw)),
+        ("legacy      fills", lambda: legacy_fills(fills, ADDRESS)),
+        ("decoder     fills", lambda: decode_fills(fills, ADDRESS)),
+        ("decoder+pd  fills", lambda: decode_fills(fills, ADDRESS).to_pandas()),
+        ("legacy      orders", lambda: legacy_orders(orders, ADDRESS)),
+        ("decoder     orders", lambda: decode_orders(orders, ADDRESS)),
+        ("decoder+pd  orders", lambda: decode_orders(orders, ADDRESS).to_pandas()),
+    ]
+    print(f"payload: {args.fills} fills ({len(fills_raw) / 1e6:.1f} MB), "
+          f"{args.orders} orders ({len(orders_raw) / 1e6:.1f} MB); best of {args.repeat}")
+    for name, fn in cases:
+        print(f"  {name:<20} {best_of(fn, args.repeat):9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark: offline ping → buffer → flush pipeline from a recorded cassette.
+
+Record a cassette once against the live API (one normal ping run):
+
+    HL_CASSETTE_MODE=record HL_CASSETTE_DIR=data/cassettes/base \\
+        python3 scheduled_processes/scheduled_ping_hyperliquid.py
+
+then replay it as many times as needed, e.g. as 100 synthetic accounts:
+
+    python3 scripts/benchmarks/bench_ping_pipeline.py --cassette data/cassettes/base --accounts 100
+
+Each repeat starts from an empty replay buffer/cursor state under the
+cassette directory, runs the ping in replay mode (time-warped to now) and then
+`flush_hyperliquid_buffers.py --dry-run` on the replay buffer (optionally
+compacting it first with `--compact`), and reports
+wall times plus the number of buffered files and rows. Nothing touches the
+exchange, ClickHouse, or the live `data/buffer` / `data/state`.
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PING = os.path.join(REPO_ROOT, "scheduled_processes", "scheduled_ping_hyperliquid.py")
+FLUSH = os.path.join(REPO_ROOT, "scheduled_processes", "flush_hyperliquid_buffers.py")
+COMPACT = os.path.join(REPO_ROOT, "scheduled_processes", "compact_hyperliquid_buffers.py")
+
+
+def _run(cmd: List[str], env: Dict[str, str], verbose: bool) -> float:
+    start = time.perf_counter()
+    out = None if verbose else subprocess.DEVNULL
+    subprocess.run(cmd, env=env, check=True, cwd=REPO_ROOT, stdout=out)
+    return time.perf_counter() - start
+
+
+def _buffer_stats(buffer_dir: str) -> Dict[str, Any]:
+    files = glob.glob(os.path.join(buffer_dir, "**", "*.parquet"), recursive=True)
+    rows = sum(len(pd.read_parquet(f)) for f in files)
+    return {"files": len(files), "rows": rows,
+            "bytes": sum(os.path.getsize(f) for f in files)}
+
+
+def run_once(cassette: str, accounts: int, concurrent: bool, latency_scale: float, compact: bool,
+             verbose: bool) -> Dict[str, Any]:
+    for sub in ("buffer", "state"):
+        shutil.rmtree(os.path.join(cassette, sub), ignore_errors=True)
+
+    env = dict(os.environ)
+    env.update({
+        "HL_CASSETTE_MODE": "replay",
+        "HL_CASSETTE_DIR": cassette,
+        "HL_CASSETTE_TIME_WARP": "1",
+        "HL_CASSETTE_ACCOUNTS": str(accounts),
+        "HL_CASSETTE_LATENCY_SCALE": str(latency_scale),
+    })
+    ping_cmd = [sys.executable, PING] + (["--concurrent"] if concurrent else [])
+    ping_s = _run(ping_cmd, env, verbose)
+    buffer_dir = os.path.join(cassette, "buffer")
+    result: Dict[str, Any] = {"ping_s": round(ping_s, 3)}
+    if compact:
+        # Negative settle time: compact the partition the replay just wrote to.
+        compact_s = _run([sys.executable, COMPACT, "--buffer-dir", buffer_dir, "--settle", "-3600"], env, verbose)
+        result["compact_s"] = round(compact_s, 3)
+    result.update(_buffer_stats(buffer_dir))
+    flush_s = _run([sys.executable, FLUSH, "--dry-run", "--buffer-dir", buffer_dir], env, verbose)
+    result["flush_dry_run_s"] = round(flush_s, 3)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline ping/flush benchmark from a recorded cassette.")
+    parser.add_argument("--cassette", required=True, help="Cassette directory (contains cassette.jsonl)")
+    parser.add_argument("--accounts", type=int, default=0, help="Synthetic accounts (0 = the recorded ones)")
+    parser.add_argument("--concurrent", action="store_true", help="Replay the ping in --concurrent mode")
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="Sleep this multiple of the recorded latency per call")
+    parser.add_argument("--compact", action="store_true", help="Compact the replay buffer before flushing")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="Optional JSON results path")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    cassette = os.path.abspath(args.cassette)
+    if not os.path.exists(os.path.join(cassette, "cassette.jsonl")):
+        sys.exit(f"No cassette.jsonl under {cassette}")
+
+    runs = [run_once(cassette, args.accounts, args.concurrent, args.latency_scale, args.compact, args.verbose)
+            for _ in range(args.repeat)]
+    for i, r in enumerate(runs, 1):
+        print(f"run {i}: ping {r['ping_s']:.3f}s  flush(dry) {r['flush_dry_run_s']:.3f}s  "
+              f"{r['files']} files / {r['rows']} rows / {r['bytes'] / 1e6:.2f} MB")
+    best = {k: min(r[k] for r in runs) for k in ("ping_s", "flush_dry_run_s")}
+    print(f"best: ping {best['ping_s']:.3f}s  flush(dry) {best['flush_dry_run_s']:.3f}s")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "runs": runs, "best": best}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
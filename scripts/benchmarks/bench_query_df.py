@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark: query_df row mode vs columnar (NumPy) mode on large pulls.
+
+Builds 1M synthetic rows (by default) shaped like maicro_logs.positions_jianan_v6
+and maicro_monitors.positions_snapshots, encodes them once as the Native-protocol
+blocks a server would send, then times, per table and mode, decoding those
+blocks plus building the DataFrame:
+  - rows:     row tuples → pd.DataFrame(rows)   (`query_df(sql)`)
+  - columnar: NumPy column arrays → typed_frame (`query_df(sql, columnar=True)`)
+
+No server is needed. With `--target local|remote` the same pulls are also run
+for real (`SELECT ... LIMIT --rows`) through query_df in both modes.
+
+Usage:
+    python3 scripts/benchmarks/bench_query_df.py [--rows 1000000] [--repeat 1] [--target local]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from clickhouse_driver import Client, defines  # noqa: E402
+from clickhouse_driver.block import ColumnOrientedBlock  # noqa: E402
+from clickhouse_driver.bufferedreader import BufferedSocketReader  # noqa: E402
+from clickhouse_driver.bufferedwriter import BufferedSocketWriter  # noqa: E402
+from clickhouse_driver.connection import ServerInfo  # noqa: E402
+from clickhouse_driver.context import Context  # noqa: E402
+from clickhouse_driver.numpy.result import NumpyQueryResult  # noqa: E402
+from clickhouse_driver.streams.native import BlockInputStream, BlockOutputStream  # noqa: E402
+
+from modules.clickhouse_client import typed_frame  # noqa: E402
+
+BLOCK_ROWS = 65_536  # max_block_size
+SYMBOLS = ["btc", "eth", "sol", "hype", "xrp", "doge", "avax", "link", "aave", "sui"]
+ADDRESSES = [f"0x{i:040x}" for i in range(1, 6)]
+
+TABLES: Dict[str, List[Tuple[str, str]]] = {
+    "maicro_logs.positions_jianan_v6": [
+        ("date", "Date"), ("symbol", "String"), ("weight", "Float64"), ("pred_ret", "Float64"),
+        ("inserted_at", "DateTime"),
+    ],
+    "maicro_monitors.positions_snapshots": [
+        ("timestamp", "DateTime64(3)"), ("coin", "String"), ("szi", "Float64"), ("entryPx", "Float64"),
+        ("positionValue", "Float64"), ("unrealizedPnl", "Float64"), ("returnOnEquity", "Float64"),
+        ("liquidationPx", "Float64"), ("leverage", "Float64"), ("maxLeverage", "Int32"),
+        ("marginUsed", "Float64"), ("address", "String"),
+    ],
+}
+
+
+class _Socket:
+    """In-memory socket: collects what is sent, replays it to a reader."""
+
+    def __init__(self, data: bytes = b""):
+        self.buf = bytearray(data)
+        self.pos = 0
+
+    def sendall(self, data):
+        self.buf += data
+
+    def recv_into(self, buf, nbytes=0):
+        n = min(len(buf), len(self.buf) - self.pos)
+        buf[:n] = self.buf[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
+def _context(use_numpy: bool) -> Context:
+    ctx = Context()
+    ctx.server_info = ServerInfo("bench", 24, 8, 0, defines.CLIENT_REVISION, "UTC", "bench",
+                                 defines.CLIENT_REVISION)
+    ctx.client_settings = dict(Client("localhost").connection.context.client_settings, use_numpy=use_numpy)
+    ctx.settings = {}
+    return ctx
+
+
+def synthetic_columns(table: str, n: int) -> List[list]:
+    rng = np.random.default_rng(7)
+    t0 = datetime(2025, 1, 1)
+    if table == "maicro_logs.positions_jianan_v6":
+        days = rng.integers(0, 365, n)
+        return [
+            [date(2025, 1, 1) + timedelta(days=int(d)) for d in days],
+            [SYMBOLS[i] for i in rng.integers(0, len(SYMBOLS), n)],
+            rng.normal(0, 0.05, n).tolist(),
+            rng.normal(0, 0.01, n).tolist(),
+            [t0 + timedelta(days=int(d), seconds=int(s)) for d, s in zip(days, rng.integers(0, 86400, n))],
+        ]
+    return [
+        [t0 + timedelta(milliseconds=250 * i) for i in range(n)],
+        [SYMBOLS[i].upper() for i in rng.integers(0, len(SYMBOLS), n)],
+        *(rng.normal(0, 100, n).tolist() for _ in range(7)),
+        rng.integers(3, 50, n).tolist(),
+        rng.uniform(0, 1000, n).tolist(),
+        [ADDRESSES[i] for i in rng.integers(0, len(ADDRESSES), n)],
+    ]
+
+
+def encode(types: List[Tuple[str, str]], columns: List[list]) -> Tuple[bytes, int]:
+    """Native blocks of BLOCK_ROWS rows, as the server would stream them."""
+    sock = _Socket()
+    writer = BufferedSocketWriter(sock, defines.BUFFER_SIZE)
+    stream = BlockOutputStream(writer, _context(False))
+    n, blocks = len(columns[0]), 0
+    for start in range(0, n, BLOCK_ROWS):
+        stream.write(ColumnOrientedBlock(types, [c[start:start + BLOCK_ROWS] for c in columns]))
+        blocks += 1
+    writer.flush()
+    return bytes(sock.buf), blocks
+
+
+def _blocks(payload: bytes, blocks: int, use_numpy: bool):
+    stream = BlockInputStream(BufferedSocketReader(_Socket(payload), defines.BUFFER_SIZE), _context(use_numpy))
+    for _ in range(blocks):
+        yield stream.read()
+
+
+def rows_frame(payload: bytes, blocks: int, types: List[Tuple[str, str]]) -> pd.DataFrame:
+    rows: List[tuple] = []
+    for block in _blocks(payload, blocks, False):
+        rows.extend(block.get_rows())
+    return pd.DataFrame(rows, columns=[name for name, _ in types])
+
+
+class _Packet:
+    def __init__(self, block):
+        self.block = block
+
+
+def columnar_frame(payload: bytes, blocks: int, types: List[Tuple[str, str]]) -> pd.DataFrame:
+    result = NumpyQueryResult((_Packet(b) for b in _blocks(payload, blocks, True)), columnar=True)
+    return typed_frame(result.get_result(), types)
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--target", choices=["local", "remote"],
+                        help="Also pull --rows rows of each table from this ClickHouse target")
+    args = parser.parse_args()
+
+    print(f"{args.rows} rows per table; best of {args.repeat}")
+    for table, types in TABLES.items():
+        payload, blocks = encode(types, synthetic_columns(table, args.rows))
+        rows_s, rows_df = timed(lambda: rows_frame(payload, blocks, types), args.repeat)
+        col_s, col_df = timed(lambda: columnar_frame(payload, blocks, types), args.repeat)
+        print(f"{table} ({len(payload) / 1e6:.1f} MB native, {blocks} blocks)")
+        for name, seconds, df in (("rows    ", rows_s, rows_df), ("columnar", col_s, col_df)):
+            print(f"  {name}  {seconds:7.2f}s  {args.rows / seconds:12,.0f} rows/s  "
+                  f"{df.memory_usage(deep=True).sum() / 1e6:7.1f} MB frame")
+        print(f"  speedup {rows_s / col_s:.1f}x; columnar dtypes: "
+              + ", ".join(f"{c}={t}" for c, t in col_df.dtypes.items()))
+
+    if args.target:
+        from modules.clickhouse_client import query_df
+
+        for table, types in TABLES.items():
+            sql = f"SELECT {', '.join(name for name, _ in types)} FROM {table} LIMIT {args.rows}"
+            rows_s, df = timed(lambda: query_df(sql, target=args.target), args.repeat)
+            col_s, _ = timed(lambda: query_df(sql, target=args.target, columnar=True), args.repeat)
+            print(f"  {args.target} {table} ({len(df)} rows): rows {rows_s:.2f}s, columnar {col_s:.2f}s "
+                  f"({rows_s / col_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
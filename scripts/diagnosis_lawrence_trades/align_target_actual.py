@@ -37,7 +37,7 @@ import numpy as np
 
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(REPO_ROOT)
-from modules.clickhouse_client import query_df  # type: ignore
+from modules.query_cache import cached_query_df  # type: ignore
 
 
 def load_target_weights(start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.DataFrame:
@@ -66,7 +66,7 @@ def load_target_weights(start_date: Optional[str] = None, end_date: Optional[str
             LIMIT 1 BY date, symbol
         )
     """
-    df = query_df(sql, params=params)
+    df = cached_query_df(sql, params=params, columnar=True)
     if df.empty:
         return df
     
@@ -98,7 +98,7 @@ def load_actual_positions(start_date: Optional[str] = None, end_date: Optional[s
         )
         WHERE rn = 1
     """
-    df = query_df(sql, params=params)
+    df = cached_query_df(sql, params=params, columnar=True)
     if df.empty:
         return df
     
@@ -32,7 +32,7 @@ import numpy as np
 
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(REPO_ROOT)
-from modules.clickhouse_client import query_df  # type: ignore
+from modules.query_cache import cached_query_df  # type: ignore
 
 OUTPUT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -53,7 +53,7 @@ def load_jianan_signals() -> pd.DataFrame:
             LIMIT 1 BY date, symbol
         )
     """
-    df = query_df(sql)
+    df = cached_query_df(sql, columnar=True)
     df["date"] = pd.to_datetime(df["date"]).dt.date
     df["symbol"] = df["symbol"].str.upper().str.strip()
     return df
@@ -79,7 +79,7 @@ def load_live_positions() -> pd.DataFrame:
         )
         WHERE rn = 1
     """
-    df = query_df(sql)
+    df = cached_query_df(sql, columnar=True)
     df["holdings_date"] = pd.to_datetime(df["holdings_date"]).dt.date
     df["target_date"] = pd.to_datetime(df["target_date"]).dt.date
     df["symbol"] = df["symbol"].str.upper().str.strip()
@@ -26,7 +26,7 @@ import numpy as np
 
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(REPO_ROOT)
-from modules.clickhouse_client import query_df  # type: ignore
+from modules.query_cache import cached_query_df  # type: ignore
 
 OUTPUT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -52,7 +52,7 @@ def load_signals_with_inserted_at(start_date: str = None, end_date: str = None)
           AND weight IS NOT NULL AND isFinite(weight) AND weight != 0
           AND pred_ret IS NOT NULL AND isFinite(pred_ret)
     """
-    df = query_df(sql, params=params)
+    df = cached_query_df(sql, params=params, columnar=True)
     df["date"] = pd.to_datetime(df["date"]).dt.date
     df["symbol"] = df["symbol"].str.upper().str.strip()
     df["inserted_at"] = pd.to_datetime(df["inserted_at"])
@@ -82,7 +82,7 @@ def load_signals(start_date: str = None, end_date: str = None) -> pd.DataFrame:
             LIMIT 1 BY date, symbol
         )
     """
-    df = query_df(sql, params=params)
+    df = cached_query_df(sql, params=params, columnar=True)
     df["date"] = pd.to_datetime(df["date"]).dt.date
     df["symbol"] = df["symbol"].str.upper().str.strip()
     return df
@@ -117,7 +117,7 @@ def load_positions(start_date: str = None, end_date: str = None) -> pd.DataFrame
         )
         WHERE rn = 1
     """
-    df = query_df(sql, params=params)
+    df = cached_query_df(sql, params=params, columnar=True)
     if df.empty:
         return df
     df["ts"] = pd.to_datetime(df["ts"])
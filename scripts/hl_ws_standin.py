@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Hyperliquid WebSocket API, for testing
+scheduled_processes/stream_hyperliquid.py without the exchange.
+
+Answers `subscribe` with `subscriptionResponse` and `ping` with `pong`, then
+replays frames on every subscribed `userFills`, `orderUpdates` and
+`webData2` channel:
+
+  - with --frames FILE: JSON lines `{"channel": ..., "data": ...}` sent in
+    order, every --interval seconds, to each subscriber of that channel
+    (the string "{user}" in a frame is replaced by the subscriber's address);
+  - otherwise synthetic frames: a `userFills` snapshot (isSnapshot), then a
+    new fill, an order update and a clearinghouse state per interval.
+
+--drop-after N closes each connection after N frames, to exercise the
+stream's reconnect and REST back-fill.
+
+Usage:
+    python3 scripts/hl_ws_standin.py --port 8765 [--frames frames.jsonl] [--interval 1] [--drop-after 0]
+    python3 scheduled_processes/stream_hyperliquid.py --ws-url ws://127.0.0.1:8765 --run-seconds 30
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+CHANNELS = ("userFills", "orderUpdates", "webData2")
+_tids = itertools.count(int(time.time() * 1000))
+
+
+def synthetic_frames(channel: str, user: str) -> Dict[str, Any]:
+    now = int(time.time() * 1000)
+    tid = next(_tids)
+    if channel == "userFills":
+        fill = {"coin": "BTC", "px": "100000.0", "sz": "0.001", "side": "B", "time": now, "startPosition": "0.0",
+                "dir": "Open Long", "closedPnl": "0.0", "hash": f"0x{tid:064x}", "oid": tid, "crossed": True,
+                "fee": "0.01", "tid": tid, "feeToken": "USDC"}
+        return {"channel": channel, "data": {"isSnapshot": False, "user": user, "fills": [fill]}}
+    if channel == "orderUpdates":
+        order = {"coin": "BTC", "side": "B", "limitPx": "100000.0", "sz": "0.0", "oid": tid, "timestamp": now,
+                 "origSz": "0.001"}
+        return {"channel": channel, "data": [{"order": order, "status": "filled", "statusTimestamp": now}]}
+    state = {
+        "marginSummary": {"accountValue": "1000.0", "totalNtlPos": "100.0", "totalRawUsd": "900.0",
+                          "totalMarginUsed": "10.0"},
+        "crossMarginSummary": {"accountValue": "1000.0", "totalNtlPos": "100.0", "totalRawUsd": "900.0",
+                               "totalMarginUsed": "10.0", "marginUsed": "10.0"},
+        "withdrawable": "990.0",
+        "assetPositions": [{"type": "oneWay", "position": {
+            "coin": "BTC", "szi": "0.001", "entryPx": "100000.0", "positionValue": "100.0", "unrealizedPnl": "0.0",
+            "returnOnEquity": "0.0", "liquidationPx": None, "leverage": {"type": "cross", "value": 10},
+            "maxLeverage": 40, "marginUsed": "10.0"}}],
+        "time": now,
+    }
+    return {"channel": channel, "data": {"clearinghouseState": state, "user": user}}
+
+
+def load_frames(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class StandInServer:
+    def __init__(self, frames: Optional[List[Dict[str, Any]]], interval: float, drop_after: int):
+        self.frames = frames
+        self.interval = interval
+        self.drop_after = drop_after
+
+    async def _replay(self, ws, subs: Dict[str, str]) -> None:
+        sent = 0
+        frames = iter(self.frames) if self.frames is not None else None
+        while True:
+            await asyncio.sleep(self.interval)
+            if frames is not None:
+                frame = next(frames, None)
+                if frame is None:
+                    return
+                if frame.get("channel") not in subs:
+                    continue
+                batch = [json.loads(json.dumps(frame).replace("{user}", subs[frame["channel"]]))]
+            else:
+                batch = [synthetic_frames(channel, user) for channel, user in list(subs.items())]
+            for msg in batch:
+                await ws.send(json.dumps(msg))
+                sent += 1
+                if self.drop_after and sent >= self.drop_after:
+                    print(f"[standin] Dropping connection after {sent} frames")
+                    await ws.close()
+                    return
+
+    async def handler(self, ws, path: str = None) -> None:
+        subs: Dict[str, str] = {}
+        replay: Optional[asyncio.Task] = None
+        print("[standin] Client connected")
+        try:
+            async for raw in ws:
+                msg = json.loads(raw)
+                if msg.get("method") == "ping":
+                    await ws.send(json.dumps({"channel": "pong"}))
+                    continue
+                if msg.get("method") != "subscribe":
+                    await ws.send(json.dumps({"channel": "error", "data": f"Unsupported method: {raw}"}))
+                    continue
+                sub = msg.get("subscription") or {}
+                channel, user = sub.get("type"), sub.get("user", "")
+                await ws.send(json.dumps({"channel": "subscriptionResponse", "data": msg}))
+                if channel not in CHANNELS:
+                    continue
+                subs[channel] = user
+                if channel == "userFills" and self.frames is None:
+                    await ws.send(json.dumps({"channel": "userFills",
+                                              "data": {"isSnapshot": True, "user": user, "fills": []}}))
+                if replay is None:
+                    replay = asyncio.ensure_future(self._replay(ws, subs))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if replay is not None:
+                replay.cancel()
+            print("[standin] Client disconnected")
+
+
+async def serve(host: str, port: int, server: StandInServer) -> None:
+    async with websockets.serve(server.handler, host, port):
+        print(f"[standin] Listening on ws://{host}:{port}")
+        await asyncio.Future()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--frames", help="JSON lines of {channel, data} frames to replay")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between frames")
+    parser.add_argument("--drop-after", type=int, default=0, help="Close each connection after N frames (0 = never)")
+    args = parser.parse_args()
+
+    server = StandInServer(load_frames(args.frames) if args.frames else None, args.interval, args.drop_after)
+    try:
+        asyncio.run(serve(args.host, args.port, server))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
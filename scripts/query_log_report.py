@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Top ClickHouse queries from maicro_monitors.query_log (see modules/query_log.py).
+
+Groups the logged statements by fingerprint (literals stripped) and ranks
+them by total wall time, bytes read, bytes written or call count over the
+last --days, with the modules/functions that issued them. `--local` reads
+the records spilled to data/state/query_log.sqlite while ClickHouse was
+unreachable instead.
+
+Usage:
+    python3 scripts/query_log_report.py [--days 7] [--by time|bytes|written|calls] [--limit 20] [--local]
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.clickhouse_client import connection  # noqa: E402
+from modules.query_log import (  # noqa: E402
+    QUERY_LOG_TARGET,
+    REPORT_ORDER,
+    QueryLog,
+    top_pending_queries,
+    top_queries,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--days", type=float, default=7.0)
+    parser.add_argument("--by", choices=sorted(REPORT_ORDER), default="time")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--target", default=QUERY_LOG_TARGET, help="ClickHouse target holding the query log")
+    parser.add_argument("--local", action="store_true", help="Report on the locally spilled records")
+    args = parser.parse_args()
+
+    if args.local:
+        rows = top_pending_queries(QueryLog(), args.days, args.by, args.limit)
+    else:
+        with connection(args.target) as client:
+            rows = top_queries(client, args.days, args.by, args.limit)
+
+    print(f"Top {len(rows)} queries by {args.by}, last {args.days:g} days")
+    for i, r in enumerate(rows, 1):
+        print(f"{i:>3}. {r['total_s']:9.1f}s total  {r['calls']:>6} calls  p95 {r['p95_ms']:8.0f}ms  "
+              f"max {r['max_ms']:8.0f}ms  read {r['total_bytes_read'] / 1e9:7.2f} GB ({r['total_rows_read']:,} rows)  "
+              f"written {r['total_bytes_written'] / 1e9:6.2f} GB  {r['errors']} errors")
+        print(f"     {r['fingerprint']:016x}  {r['callers']}")
+        print(f"     {r['query'][:200]}")
+
+
+if __name__ == "__main__":
+    main()
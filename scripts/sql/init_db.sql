@@ -16,7 +16,8 @@ CREATE TABLE IF NOT EXISTS maicro_monitors.trades (
     fee Float64,
     tid Int64
 ) ENGINE = ReplacingMergeTree()
-ORDER BY (coin, time, tid);
+ORDER BY (coin, time, tid)
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Orders (Snapshots)
 CREATE TABLE IF NOT EXISTS maicro_monitors.orders (
@@ -30,7 +31,8 @@ CREATE TABLE IF NOT EXISTS maicro_monitors.orders (
     orderType String,
     reduceOnly Bool
 ) ENGINE = ReplacingMergeTree()
-ORDER BY (coin, timestamp, oid);
+ORDER BY (coin, timestamp, oid)
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Account Snapshots
 CREATE TABLE IF NOT EXISTS maicro_monitors.account_snapshots (
@@ -42,7 +44,8 @@ CREATE TABLE IF NOT EXISTS maicro_monitors.account_snapshots (
     marginUsed Float64,
     withdrawable Float64
 ) ENGINE = MergeTree()
-ORDER BY timestamp;
+ORDER BY timestamp
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Positions Snapshots
 CREATE TABLE IF NOT EXISTS maicro_monitors.positions_snapshots (
@@ -58,7 +61,8 @@ CREATE TABLE IF NOT EXISTS maicro_monitors.positions_snapshots (
     maxLeverage Int32,
     marginUsed Float64
 ) ENGINE = MergeTree()
-ORDER BY (coin, timestamp);
+ORDER BY (coin, timestamp)
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Funding History
 CREATE TABLE IF NOT EXISTS maicro_monitors.funding_payments (
@@ -69,7 +73,8 @@ CREATE TABLE IF NOT EXISTS maicro_monitors.funding_payments (
     fundingRate Float64,
     tid Int64 -- Using timestamp as ID if no unique ID provided, or composite
 ) ENGINE = ReplacingMergeTree()
-ORDER BY (coin, time);
+ORDER BY (coin, time)
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Candles (OHLCV)
 CREATE TABLE IF NOT EXISTS maicro_monitors.candles (
@@ -83,7 +88,24 @@ CREATE TABLE IF NOT EXISTS maicro_monitors.candles (
     volume Float64,
     updated_at DateTime DEFAULT now()
 ) ENGINE = ReplacingMergeTree(updated_at)
-ORDER BY (coin, interval, ts);
+ORDER BY (coin, interval, ts)
+SETTINGS non_replicated_deduplication_window = 1000;
+
+-- Market Snapshots (metaAndAssetCtxs, whole universe per ping)
+CREATE TABLE IF NOT EXISTS maicro_monitors.market_snapshots (
+    timestamp DateTime64(3),
+    coin String,
+    markPx Float64,
+    midPx Float64,
+    oraclePx Float64,
+    funding Float64,
+    openInterest Float64,
+    premium Float64,
+    dayNtlVlm Float64,
+    prevDayPx Float64
+) ENGINE = MergeTree()
+ORDER BY (coin, timestamp)
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Tracking Error
 CREATE TABLE IF NOT EXISTS maicro_monitors.tracking_error (
@@ -106,7 +128,8 @@ CREATE TABLE IF NOT EXISTS maicro_monitors.ledger_updates (
     coin String, -- Optional, usually USDC but maybe spot assets
     raw_json String -- Store full delta for debugging
 ) ENGINE = ReplacingMergeTree()
-ORDER BY (time, hash);
+ORDER BY (time, hash)
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Multi-lag Tracking Error
 CREATE TABLE IF NOT EXISTS maicro_monitors.tracking_error_multilag (
@@ -148,4 +171,29 @@ CREATE TABLE IF NOT EXISTS maicro_monitors.hl_meta (
     min_usd Float64,
     updated_at DateTime
 ) ENGINE = MergeTree()
-ORDER BY (symbol, updated_at);
\ No newline at end of file
+ORDER BY (symbol, updated_at)
+SETTINGS non_replicated_deduplication_window = 1000;
+
+-- Query Log: one row per statement run through modules/clickhouse_client
+-- (written in batches by modules/query_log.py; see scripts/query_log_report.py)
+CREATE TABLE IF NOT EXISTS maicro_monitors.query_log (
+    event_time DateTime64(3),
+    host LowCardinality(String),
+    target LowCardinality(String),
+    kind LowCardinality(String), -- 'query', 'execute', 'insert'
+    caller_module LowCardinality(String),
+    caller_function LowCardinality(String),
+    fingerprint UInt64, -- hash of the statement with literals stripped
+    query String,
+    duration_ms Float64,
+    rows_read UInt64,
+    bytes_read UInt64,
+    rows_written UInt64,
+    bytes_written UInt64,
+    result_rows UInt64,
+    result_bytes UInt64,
+    exception String
+) ENGINE = MergeTree()
+PARTITION BY toYYYYMM(event_time)
+ORDER BY (event_time, fingerprint)
+TTL toDateTime(event_time) + INTERVAL 90 DAY;
@@ -3,21 +3,20 @@ import sys
 import os
 import time
 import logging
-from clickhouse_driver import Client
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config.settings import CLICKHOUSE_LOCAL_CONFIG, CLICKHOUSE_REMOTE_CONFIG
+from modules.clickhouse_client import QUERY_ITER_CHUNK_ROWS, connection, iter_row_chunks
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def get_client(config):
-    return Client(**config)
+# Held-back rows (in chunks) after which a timestamp is sent without waiting for it to end
+PENDING_CEILING = 2
 
-def sync_table(local_client, remote_client, db, table, time_col, batch_size=10000):
+def sync_table(local_client, remote_client, db, table, time_col, batch_size=QUERY_ITER_CHUNK_ROWS):
     full_table_name = f"{db}.{table}"
     logger.info(f"Syncing {full_table_name}...")
 
@@ -50,35 +49,53 @@ def sync_table(local_client, remote_client, db, table, time_col, batch_size=1000
             params = {}
             logger.info(f"Fetching all rows (no existing data on remote)")
 
-        # We can use a cursor or iterator to handle large datasets
-        # But clickhouse-driver execute returns all rows by default. 
-        # For huge tables, we should use execute_iter.
-        
-        # Let's use a simple approach first: fetch all new rows. 
-        # If it's too big, we might crash. But since we run every 5 mins, delta should be small.
-        
-        rows = local_client.execute(query, params=params)
-        if not rows:
+        # 3. Stream the new rows and insert them into remote in batches of
+        # about `batch_size`, so memory stays bounded however large the delta
+        # is. A batch only ends where `time_col` changes: the rows sharing the
+        # last timestamp of a chunk are held back and sent with the next one.
+        # A run that dies part-way therefore leaves whole timestamps on
+        # remote, and the next run's `> max_ts` picks up where it stopped.
+        # A single timestamp can span more than a chunk, so once `pending`
+        # reaches `PENDING_CEILING` chunks it is sent as-is: memory stays
+        # bounded, and a re-send of that timestamp is absorbed by
+        # ReplacingMergeTree and insert deduplication on remote.
+        synced = 0
+        names = None
+        pending = []
+
+        def insert(rows):
+            nonlocal synced
+            remote_client.execute(f"INSERT INTO {full_table_name} ({names}) VALUES", rows)
+            synced += len(rows)
+            logger.info(f"Inserted {len(rows)} rows into remote ({synced} so far)...")
+
+        for columns, rows in iter_row_chunks(query, batch_size, params=params, client=local_client):
+            if names is None:
+                names = ", ".join(c[0] for c in columns)
+                ts_idx = [c[0] for c in columns].index(time_col)
+            pending.extend(rows)
+            last_ts = pending[-1][ts_idx]
+            cut = len(pending)
+            while cut and pending[cut - 1][ts_idx] == last_ts:
+                cut -= 1
+            if not cut and len(pending) >= PENDING_CEILING * batch_size:
+                logger.warning(f"{time_col}={last_ts} spans over {len(pending)} rows; inserting it unsplit")
+                cut = len(pending)
+            if cut:
+                insert(pending[:cut])
+                pending = pending[cut:]
+        if pending:
+            insert(pending)
+
+        if not synced:
             logger.info(f"No new rows for {full_table_name}.")
             return
-
-        logger.info(f"Found {len(rows)} new rows. Inserting into remote...")
-        
-        # 3. Insert into remote
-        # We need column names to construct INSERT statement? 
-        # Or just INSERT INTO table VALUES ...
-        # clickhouse-driver execute method with data list does this efficiently.
-        
-        remote_client.execute(f"INSERT INTO {full_table_name} VALUES", rows)
-        logger.info(f"Successfully synced {len(rows)} rows.")
+        logger.info(f"Successfully synced {synced} rows.")
 
     except Exception as e:
         logger.error(f"Error syncing {full_table_name}: {e}")
 
-def main():
-    local_client = get_client(CLICKHOUSE_LOCAL_CONFIG)
-    remote_client = get_client(CLICKHOUSE_REMOTE_CONFIG)
-    
+def sync_all(local_client, remote_client):
     # 1. Sync maicro_monitors (All tables)
     # We know the schema and time columns
     monitors = [
@@ -162,5 +179,9 @@ def main():
 
     logger.info("Sync complete.")
 
+def main():
+    with connection("local") as local_client, connection("remote") as remote_client:
+        sync_all(local_client, remote_client)
+
 if __name__ == "__main__":
     main()
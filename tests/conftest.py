@@ -0,0 +1,11 @@
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (REPO_ROOT, os.path.join(REPO_ROOT, "scripts"), os.path.join(REPO_ROOT, "scheduled_processes")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Tests talk to fake clients only; keep the query log and result cache off real state.
+os.environ.setdefault("CLICKHOUSE_QUERY_LOG_DISABLED", "1")
+os.environ.setdefault("CLICKHOUSE_QUERY_CACHE_DISABLED", "1")
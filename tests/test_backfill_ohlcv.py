@@ -0,0 +1,13 @@
+from backfill_ohlcv import INTERVAL_MS, MAX_CANDLES_PER_REQUEST, checkpoint_end
+
+HOUR = INTERVAL_MS["1h"]
+
+
+def test_checkpoint_end_full_window():
+    window = ("BTC", 0, HOUR * MAX_CANDLES_PER_REQUEST)
+    assert checkpoint_end("1h", window) == HOUR * MAX_CANDLES_PER_REQUEST
+
+
+def test_checkpoint_end_partial_window_stops_at_last_closed_candle():
+    assert checkpoint_end("1h", ("BTC", 0, 3 * HOUR + 1234)) == 3 * HOUR
+    assert checkpoint_end("1h", ("BTC", HOUR, HOUR + 10)) == HOUR
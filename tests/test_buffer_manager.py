@@ -0,0 +1,124 @@
+import os
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from modules.buffer_manager import BufferManager
+
+# Far enough ahead that the current hour counts as settled.
+SETTLED = -2 * 3600
+
+
+def _trades(tids, ts="2024-01-01 00:00:00"):
+    t = datetime.fromisoformat(ts)
+    return pa.table({
+        "coin": ["BTC"] * len(tids),
+        "time": pa.array([t] * len(tids), pa.timestamp("ms")),
+        "tid": pa.array(tids, pa.int64()),
+    })
+
+
+def _files(bm, prefix):
+    return sorted(os.path.join(bm.buffer_dir, p) for p in bm.manifest.paths() if p.startswith(prefix + os.sep))
+
+
+def test_save_partitions_by_prefix_date_and_hour(tmp_path):
+    bm = BufferManager(buffer_dir=str(tmp_path))
+    before = datetime.now()
+    bm.save(_trades([1, 2]), "trades")
+    after = datetime.now()
+    bm.save(_trades([]), "trades")  # empty saves write nothing
+
+    (path,) = _files(bm, "trades")
+    assert os.path.dirname(path) in {bm.partition_dir("trades", before), bm.partition_dir("trades", after)}
+    assert bm.partition_dir("trades", datetime(2024, 1, 2, 3)) == os.path.join(
+        str(tmp_path), "trades", "date=2024-01-02", "hour=03")
+    assert not [n for n in os.listdir(os.path.dirname(path)) if n.endswith(".tmp")]
+    assert pq.read_table(path).column("tid").to_pylist() == [1, 2]
+
+
+def test_compact_merges_settled_partition_into_one_file(tmp_path):
+    bm = BufferManager(buffer_dir=str(tmp_path))
+    for tids in ([1, 2], [3], [4, 5]):
+        bm.save(_trades(tids), "trades")
+    assert len(_files(bm, "trades")) == 3
+
+    assert bm.compact("trades", settle_s=SETTLED) == 3
+    (out,) = _files(bm, "trades")
+    assert "_compacted_" in out
+    assert sorted(pq.read_table(out).column("tid").to_pylist()) == [1, 2, 3, 4, 5]
+    assert sorted(os.listdir(os.path.dirname(out))) == [os.path.basename(out)]
+    assert bm.manifest.summary()["trades"]["rows"] == 5
+
+
+def test_compact_leaves_unsettled_hours_alone(tmp_path):
+    bm = BufferManager(buffer_dir=str(tmp_path))
+    bm.save(_trades([1]), "trades")
+    bm.save(_trades([2]), "trades")
+    assert bm.compact("trades") == 0
+    assert len(_files(bm, "trades")) == 2
+
+
+def test_compact_skips_claimed_and_partly_delivered_files(tmp_path):
+    bm = BufferManager(buffer_dir=str(tmp_path))
+    bm.save(_trades([1]), "trades")
+    bm.save(_trades([2]), "trades")
+
+    claimed = bm.claim("trades", "flush-test")
+    assert bm.compact("trades", settle_s=SETTLED) == 0
+    bm.release("flush-test")
+
+    bm.manifest.set_delivered(bm._rel(claimed[0]), 1, "local", ("local", "remote"))
+    assert bm.compact("trades", settle_s=SETTLED) == 0
+    assert len(_files(bm, "trades")) == 2
+
+
+def test_reconcile_adopts_unindexed_files(tmp_path):
+    legacy = tmp_path / "trades_20240101_000000.parquet"
+    pq.write_table(_trades([1, 2]), str(legacy))
+    bm = BufferManager(buffer_dir=str(tmp_path))
+    assert bm.manifest.paths() == {legacy.name}
+    assert bm.manifest.summary()["trades"]["rows"] == 2
+
+
+def test_iter_chunks_resumes_from_each_targets_checkpoint(tmp_path):
+    bm = BufferManager(buffer_dir=str(tmp_path))
+    bm.save(_trades([1, 2, 3, 4, 5]), "trades")
+    bm.save(_trades([6, 7, 8]), "trades")
+    files = bm.claim("trades", "flush-test")
+    targets = ("local", "remote")
+
+    chunks = list(bm.iter_chunks("trades", files, chunk_rows=3, target="local"))
+    assert [c.column("tid").to_pylist() for c, _ in chunks] == [[1, 2, 3], [4, 5, 6], [7, 8]]
+    assert chunks[1][1] == {files[0]: (5, 5), files[1]: (1, 3)}
+
+    # local takes two chunks, remote one
+    for _, spans in chunks[:2]:
+        bm.checkpoint("trades", spans, "local", targets)
+    bm.checkpoint("trades", chunks[0][1], "remote", targets)
+
+    assert [c.column("tid").to_pylist() for c, _ in bm.iter_chunks("trades", files, 3, "local")] == [[7, 8]]
+    assert [c.column("tid").to_pylist() for c, _ in bm.iter_chunks("trades", files, 3, "remote")] == [
+        [4, 5, 6], [7, 8]]
+    assert all(os.path.exists(f) for f in files)
+
+    # A file goes once every target has all of it.
+    for _, spans in bm.iter_chunks("trades", files, 3, "remote"):
+        bm.checkpoint("trades", spans, "remote", targets)
+    assert not os.path.exists(files[0]) and os.path.exists(files[1])
+    for _, spans in bm.iter_chunks("trades", files, 3, "local"):
+        bm.checkpoint("trades", spans, "local", targets)
+    assert not os.path.exists(files[1])
+    assert bm.manifest.paths() == set()
+
+
+def test_insert_token_is_deterministic_per_chunk(tmp_path):
+    bm = BufferManager(buffer_dir=str(tmp_path))
+    path = str(tmp_path / "trades" / "part-1.parquet")
+    table = pa.table({"tid": [1, 2]})
+    token = bm.insert_token("trades", {path: (2, 2)}, table)
+    assert token.startswith("trades-")
+    assert bm.insert_token("trades", {path: (2, 2)}, table) == token
+    assert bm.insert_token("trades", {path: (1, 2)}, table) != token
+    assert bm.insert_token("trades", {path: (2, 2)}, pa.table({"tid": [1, 3]})) != token
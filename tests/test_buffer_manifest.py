@@ -0,0 +1,104 @@
+from modules import buffer_manifest
+from modules.buffer_manifest import BufferManifest
+
+
+def _manifest(tmp_path):
+    m = BufferManifest(str(tmp_path / "manifest.sqlite"))
+    m.register("trades/date=2024-01-01/hour=00/a.parquet", "trades", 10, 100)
+    m.register("trades/date=2024-01-01/hour=01/b.parquet", "trades", 5, 50)
+    m.register("orders/date=2024-01-01/hour=00/c.parquet", "orders", 3, 30)
+    return m
+
+
+def test_claim_is_exclusive_until_released(tmp_path):
+    m = _manifest(tmp_path)
+    first = m.claim("trades", "flush-1")
+    assert [e["path"] for e in first] == [
+        "trades/date=2024-01-01/hour=00/a.parquet", "trades/date=2024-01-01/hour=01/b.parquet",
+    ]
+    assert m.claim("trades", "flush-2") == []
+    m.release("flush-1")
+    assert len(m.claim("trades", "flush-2")) == 2
+
+
+def test_claim_by_path_prefix(tmp_path):
+    m = _manifest(tmp_path)
+    claimed = m.claim("trades", "compact-1", path_prefix="trades/date=2024-01-01/hour=01/")
+    assert [e["path"] for e in claimed] == ["trades/date=2024-01-01/hour=01/b.parquet"]
+    assert [e["path"] for e in m.claim("trades", "flush-1")] == ["trades/date=2024-01-01/hour=00/a.parquet"]
+
+
+def test_abandoned_claims_expire(tmp_path, monkeypatch):
+    m = _manifest(tmp_path)
+    m.claim("trades", "crashed-flush")
+    monkeypatch.setattr(buffer_manifest, "CLAIM_TTL_S", -1.0)
+    assert len(m.claim("trades", "flush-2")) == 2
+
+
+def test_checkpoints_keep_a_long_running_claim_alive(tmp_path, monkeypatch):
+    m = _manifest(tmp_path)
+    m.claim("trades", "flush-1")
+    monkeypatch.setattr(buffer_manifest, "CLAIM_TTL_S", 60.0)
+    with m._connect() as conn:
+        conn.execute("UPDATE files SET claimed_at = claimed_at - 3600 WHERE claim = 'flush-1'")
+    # One checkpoint refreshes the whole claim, including files not reached yet.
+    m.set_delivered("trades/date=2024-01-01/hour=00/a.parquet", 5, target="local", targets=["local"])
+    assert m.claim("trades", "compact-1") == []
+
+
+def test_progress_and_touched_batch_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(buffer_manifest, "_IN_BATCH", 2)
+    m = _manifest(tmp_path)
+    paths = [
+        "trades/date=2024-01-01/hour=00/a.parquet", "trades/date=2024-01-01/hour=01/b.parquet",
+        "orders/date=2024-01-01/hour=00/c.parquet", "missing.parquet",
+    ]
+    m.set_delivered(paths[0], 4, target="local", targets=["local", "remote"])
+    m.set_delivered(paths[2], 3)
+    assert m.progress(paths, target="local") == {paths[0]: (10, 4), paths[1]: (5, 0), paths[2]: (3, 3)}
+    assert m.touched(paths) == {paths[0], paths[2]}
+
+
+def test_connection_is_reused_per_thread(tmp_path):
+    import threading
+
+    m = _manifest(tmp_path)
+    with m._connect() as first, m._connect() as second:
+        assert first is second
+    seen = []
+
+    def other_thread():
+        with m._connect() as conn:
+            seen.append(conn)
+
+    t = threading.Thread(target=other_thread)
+    t.start()
+    t.join()
+    assert seen and seen[0] is not first
+
+
+def test_deliveries_are_tracked_per_target(tmp_path):
+    m = _manifest(tmp_path)
+    path = "trades/date=2024-01-01/hour=00/a.parquet"
+    targets = ("local", "remote")
+
+    assert m.set_delivered(path, 6, "local", targets) == 0
+    assert m.progress([path], "local") == {path: (10, 6)}
+    assert m.progress([path], "remote") == {path: (10, 0)}
+    assert m.touched([path, "trades/date=2024-01-01/hour=01/b.parquet"]) == {path}
+
+    assert m.set_delivered(path, 4, "remote", targets) == 4
+    assert m.progress([path]) == {path: (10, 4)}
+    assert m.set_delivered(path, 10, "remote", targets) == 6
+
+
+def test_forget_and_replace(tmp_path):
+    m = _manifest(tmp_path)
+    a, b = "trades/date=2024-01-01/hour=00/a.parquet", "trades/date=2024-01-01/hour=01/b.parquet"
+    m.set_delivered(a, 2, "local", ("local", "remote"))
+    m.replace([a, b], "trades/compacted.parquet", "trades", 15, 150, None, None)
+    assert m.paths() == {"trades/compacted.parquet", "orders/date=2024-01-01/hour=00/c.parquet"}
+    assert m.progress([a, "trades/compacted.parquet"], "local") == {"trades/compacted.parquet": (15, 0)}
+    m.forget(["trades/compacted.parquet"])
+    assert m.summary() == {"orders": {"files": 1, "rows": 3, "bytes": 30, "min_ts": None, "max_ts": None,
+                                      "claimed": 0}}
@@ -0,0 +1,29 @@
+import pandas as pd
+import pyarrow as pa
+
+from modules.buffer_schemas import BUFFER_SCHEMAS, DICT_STRING, conform
+
+
+def test_conform_casts_to_prefix_schema_in_schema_order():
+    df = pd.DataFrame({
+        "extra": [1],
+        "address": ["0xa"],
+        "timestamp": [pd.Timestamp("2024-01-01")],
+        "accountValue": ["1000.5"],
+    })
+    table = conform(df, "account")
+    assert table.column_names == ["timestamp", "accountValue", "address", "extra"]
+    assert table.schema.field("accountValue").type == pa.float64()
+    assert table.schema.field("address").type == DICT_STRING
+    assert table.schema.field("timestamp").type == BUFFER_SCHEMAS["account"].field("timestamp").type
+    assert table.column("accountValue").to_pylist() == [1000.5]
+
+
+def test_conform_returns_matching_tables_unchanged():
+    table = conform(pd.DataFrame({"address": ["0xa"], "withdrawable": [1.0]}), "account")
+    assert conform(table, "account").equals(table)
+
+
+def test_conform_passes_unknown_prefixes_through():
+    table = conform(pd.DataFrame({"a": [1]}), "no_such_prefix")
+    assert table.column_names == ["a"]
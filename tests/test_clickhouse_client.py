@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+from clickhouse_driver import errors
+
+from modules import clickhouse_client
+from modules.clickhouse_client import ClientPool, iter_row_chunks, typed_frame
+
+
+class FakeConnection:
+    def __init__(self):
+        self.connected = False
+        self.alive = True
+
+    def ping(self):
+        return self.alive
+
+
+class FakeClient:
+    created = 0
+
+    def __init__(self, **config):
+        FakeClient.created += 1
+        self.config = config
+        self.connection = FakeConnection()
+        self.disconnected = False
+
+    def disconnect(self):
+        self.disconnected = True
+        self.connection.connected = False
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(clickhouse_client, "Client", FakeClient)
+    FakeClient.created = 0
+    return ClientPool("local", {"host": "example"}, max_size=2)
+
+
+def test_pool_reuses_returned_clients(pool):
+    with pool.connection() as a:
+        pass
+    with pool.connection() as b:
+        assert b is a
+    assert FakeClient.created == 1
+    assert a.config == {"host": "example"}
+
+
+def test_pool_caps_checked_out_clients(pool):
+    with pool.connection() as a, pool.connection() as b:
+        assert a is not b
+        with pytest.raises(TimeoutError):
+            with pool.connection(timeout=0.05):
+                pass
+
+
+def test_pool_drops_clients_after_network_errors(pool):
+    with pytest.raises(errors.NetworkError):
+        with pool.connection() as broken:
+            raise errors.NetworkError("connection reset")
+    assert broken.disconnected
+    with pool.connection() as fresh:
+        assert fresh is not broken
+
+
+def test_pool_replaces_stale_idle_clients(pool, monkeypatch):
+    monkeypatch.setattr(clickhouse_client, "POOL_HEALTH_CHECK_S", 0.0)
+    with pool.connection() as a:
+        a.connection.connected = True
+        a.connection.alive = False
+    with pool.connection() as b:
+        assert b is not a
+    assert a.disconnected
+
+
+def test_typed_frame_dtypes_follow_clickhouse_types():
+    columns = [
+        ("n", "UInt32"),
+        ("px", "Nullable(Float64)"),
+        ("qty", "Nullable(Int64)"),
+        ("ts", "DateTime('Asia/Tokyo')"),
+        ("coin", "LowCardinality(String)"),
+    ]
+    data = [
+        np.array([1, 2], dtype=np.uint32),
+        np.array([1.5, None], dtype=object),
+        np.array([3, None], dtype=object),
+        np.array(["2024-01-01T00:00:00", "2024-01-01T01:00:00"], dtype="datetime64[ns]"),
+        pd.Categorical(["BTC", "ETH"]),
+    ]
+    df = typed_frame(data, columns)
+    assert list(df.columns) == ["n", "px", "qty", "ts", "coin"]
+    assert df["n"].dtype == np.uint32
+    assert df["px"].dtype == np.float64 and np.isnan(df["px"][1])
+    assert str(df["qty"].dtype) == "Int64" and df["qty"].isna().tolist() == [False, True]
+    assert str(df["ts"].dt.tz) == "Asia/Tokyo"
+    assert df["ts"][0] == pd.Timestamp("2024-01-01 09:00", tz="Asia/Tokyo")
+    assert df["coin"].tolist() == ["BTC", "ETH"] and df["coin"].dtype != "category"
+
+    assert typed_frame(data, columns, categories=True)["coin"].dtype == "category"
+    assert list(typed_frame([], columns).columns) == ["n", "px", "qty", "ts", "coin"]
+
+
+class StreamingClient:
+    def __init__(self, rows):
+        self.rows = rows
+        self.settings = None
+        self.disconnected = False
+
+    def execute_iter(self, sql, params=None, with_column_types=False, settings=None):
+        self.settings = settings
+        yield [("id", "UInt64")]
+        yield from self.rows
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+def test_iter_row_chunks_bounds_each_chunk():
+    client = StreamingClient([(i,) for i in range(7)])
+    chunks = list(iter_row_chunks("SELECT id FROM db.t", chunk_rows=3, client=client))
+    assert [rows for _, rows in chunks] == [[(0,), (1,), (2,)], [(3,), (4,), (5,)], [(6,)]]
+    assert all(columns == [("id", "UInt64")] for columns, _ in chunks)
+    assert client.settings == {"max_block_size": 3}
+    assert not client.disconnected
+
+
+def test_iter_row_chunks_disconnects_when_closed_early():
+    client = StreamingClient([(i,) for i in range(7)])
+    it = iter_row_chunks("SELECT id FROM db.t", chunk_rows=3, client=client)
+    next(it)
+    it.close()
+    assert client.disconnected
+
+
+def test_iter_row_chunks_empty_result():
+    assert list(iter_row_chunks("SELECT id FROM db.t", client=StreamingClient([]))) == []
@@ -0,0 +1,53 @@
+import pytest
+
+from modules.cursor_store import CursorStore, _forward, filter_new_rows
+
+
+def _key(row):
+    return str(row["tid"])
+
+
+def test_filter_new_rows_without_cursor_keeps_everything():
+    rows = [{"time": 1, "tid": 1}, {"time": 2, "tid": 2}, {"time": 2, "tid": 3}]
+    new, cursor = filter_new_rows(rows, None, _key)
+    assert new == rows
+    assert cursor == {"time": 2, "keys": ["2", "3"]}
+
+
+def test_filter_new_rows_drops_seen_rows_on_the_cursor_millisecond():
+    rows = [{"time": 1, "tid": 1}, {"time": 2, "tid": 2}, {"time": 2, "tid": 3}]
+    new, cursor = filter_new_rows(rows, {"time": 2, "keys": ["2"]}, _key)
+    assert new == [{"time": 2, "tid": 3}]
+    assert cursor == {"time": 2, "keys": ["2", "3"]}
+
+
+def test_filter_new_rows_nothing_new():
+    assert filter_new_rows([{"time": 1, "tid": 1}], {"time": 1, "keys": ["1"]}, _key) == ([], None)
+
+
+def test_forward_never_moves_back():
+    assert _forward({"time": 5, "keys": ["a"]}, {"time": 3, "keys": ["b"]}) == {"time": 5, "keys": ["a"]}
+    assert _forward({"time": 5, "keys": ["a"]}, {"time": 6, "keys": ["b"]}) == {"time": 6, "keys": ["b"]}
+    assert _forward({"time": 5, "keys": ["a"]}, {"time": 5, "keys": ["b"]}) == {"time": 5, "keys": ["a", "b"]}
+    assert _forward(None, {"time": 1, "keys": []}) == {"time": 1, "keys": []}
+
+
+def test_buffer_new_writes_once_and_advances(tmp_path):
+    store = CursorStore(str(tmp_path / "cursors.json"))
+    rows = [{"time": 1, "tid": 1}, {"time": 2, "tid": 2}]
+    written = []
+    assert store.buffer_new("0xABC", "fills", rows, _key, written.extend) == rows
+    assert store.buffer_new("0xabc", "fills", rows, _key, written.extend) == []
+    assert written == rows
+    assert store.get("0xabc", "fills") == {"time": 2, "keys": ["2"]}
+
+
+def test_buffer_new_leaves_cursor_when_write_fails(tmp_path):
+    store = CursorStore(str(tmp_path / "cursors.json"))
+
+    def fail(rows):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        store.buffer_new("0xabc", "fills", [{"time": 1, "tid": 1}], _key, fail)
+    assert store.get("0xabc", "fills") is None
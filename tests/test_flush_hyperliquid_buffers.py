@@ -0,0 +1,175 @@
+import os
+from datetime import datetime
+
+import pyarrow as pa
+import pytest
+
+import flush_hyperliquid_buffers as flush
+from modules.buffer_manager import BufferManager
+from modules.merge_scheduler import MergeScheduler
+from modules.schema_registry import SchemaRegistry
+from modules.seen_keys import SeenKeyIndex
+
+TRADE_COLUMNS = [("address", "String"), ("coin", "String"), ("time", "DateTime64(3)"), ("tid", "UInt64")]
+
+
+class FakeClickHouse:
+    """Answers the flush's metadata queries and records inserts; `fail` inserts raise first.
+
+    Every insert adds a part to partition 202401, which starts with one older part.
+    """
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.inserts = []
+        self.statements = []
+        self.parts = {"202401_1_1_0": "202401"}
+        self.last_query = None
+
+    def execute(self, sql, params=None, columnar=False, settings=None):
+        self.statements.append(sql)
+        if sql.startswith("OPTIMIZE"):
+            self.parts = {f"202401_1_{len(self.parts)}_1": "202401"}
+            return None
+        if "FROM system.parts" in sql and sql.startswith("SELECT name, partition_id"):
+            return list(self.parts.items())
+        if "FROM system.parts" in sql:
+            return [("202401", len(self.parts), 1000)]
+        if sql.startswith("INSERT"):
+            token = (settings or {}).get("insert_deduplication_token")
+            if self.fail:
+                self.fail -= 1
+                self.inserts.append((token, None))
+                raise ConnectionError("connection reset")
+            self.parts[f"202401_{len(self.parts) + 1}_{len(self.parts) + 1}_0"] = "202401"
+            self.inserts.append((token, dict(zip(sql[sql.index("(") + 1:sql.index(")")].split(", "), params))))
+            return None
+        if "system.columns" in sql:
+            return [(name, type_, "") for name, type_ in TRADE_COLUMNS]
+        return []
+
+    def optimized(self):
+        return [sql for sql in self.statements if sql.startswith("OPTIMIZE")]
+
+    def delivered(self, column="tid"):
+        return sorted(v for _, cols in self.inserts if cols for v in cols[column])
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    monkeypatch.setattr(flush, "INSERT_RETRY_BACKOFF_S", 0.0)
+    buffer_dir = str(tmp_path / "buffer")
+    return {
+        "buffer_dir": buffer_dir,
+        "bm": BufferManager(buffer_dir=buffer_dir),
+        "seen_keys": SeenKeyIndex(str(tmp_path / "seen.sqlite")),
+        "merges": MergeScheduler(str(tmp_path / "merges.sqlite")),
+        "schemas": SchemaRegistry(str(tmp_path / "schemas.sqlite")),
+    }
+
+
+def _save(env, tids, address="0xa", when=None):
+    when = when or datetime.utcnow().replace(microsecond=0)
+    env["bm"].save(pa.table({
+        "address": [address] * len(tids),
+        "coin": ["BTC"] * len(tids),
+        "time": pa.array([when] * len(tids), pa.timestamp("ms")),
+        "tid": pa.array(tids, pa.int64()),
+    }), "trades")
+
+
+def _flush(env, local, remote, chunk_rows=100):
+    flush.flush_prefix("trades", "maicro_monitors.trades", local, remote, env["buffer_dir"], False, chunk_rows,
+                       env["seen_keys"], env["merges"], env["schemas"])
+
+
+def _buffered(env):
+    return env["bm"].manifest.paths()
+
+
+def test_flush_delivers_every_row_to_both_targets(env):
+    _save(env, [1, 2, 3])
+    _save(env, [4, 5])
+    local, remote = FakeClickHouse(), FakeClickHouse()
+    _flush(env, local, remote, chunk_rows=2)
+    assert local.delivered() == remote.delivered() == [1, 2, 3, 4, 5]
+    assert _buffered(env) == set()
+
+
+def test_failed_target_resumes_from_its_own_checkpoint(env, monkeypatch):
+    monkeypatch.setattr(flush, "INSERT_RETRIES", 0)
+    _save(env, [1, 2, 3])
+    local, remote = FakeClickHouse(), FakeClickHouse(fail=1)
+    _flush(env, local, remote)
+    assert local.delivered() == [1, 2, 3]
+    assert remote.delivered() == []
+    assert len(_buffered(env)) == 1
+
+    _save(env, [4])
+    _flush(env, local, remote)
+    # local only gets the new file; remote catches up on everything
+    assert local.delivered() == [1, 2, 3, 4]
+    assert remote.delivered() == [1, 2, 3, 4]
+    assert _buffered(env) == set()
+
+
+def test_seen_keys_drop_rows_a_target_already_has(env):
+    _save(env, [1, 2])
+    local, remote = FakeClickHouse(), FakeClickHouse()
+    _flush(env, local, remote)
+    _save(env, [2, 3])
+    _flush(env, local, remote)
+    assert local.delivered() == remote.delivered() == [1, 2, 3]
+    assert _buffered(env) == set()
+
+
+def test_insert_retries_resend_the_same_dedup_token(env):
+    _save(env, [1, 2])
+    local, remote = FakeClickHouse(fail=2), FakeClickHouse()
+    _flush(env, local, remote)
+    tokens = [token for token, _ in local.inserts]
+    assert len(tokens) == 3 and len(set(tokens)) == 1 and tokens[0]
+    assert local.delivered() == [1, 2]
+    assert remote.inserts[0][0] == tokens[0]
+
+
+def test_merge_only_when_inserted_table_keys_repeat(env):
+    local, remote = FakeClickHouse(), FakeClickHouse()
+    # No table keys recorded yet: nothing to rule duplicates out with.
+    _save(env, [1, 2])
+    _flush(env, local, remote)
+    assert local.optimized() == ["OPTIMIZE TABLE maicro_monitors.trades PARTITION ID '202401' FINAL"]
+
+    _save(env, [3, 4])
+    _flush(env, local, remote)
+    assert len(local.optimized()) == 1
+
+    # Same fill seen from a second tracked account: a new natural key, but the
+    # table's (coin, time, tid) key repeats.
+    when = datetime.utcnow().replace(microsecond=0)
+    _save(env, [5], when=when)
+    _flush(env, local, remote)
+    _save(env, [5], address="0xb", when=when)
+    _flush(env, local, remote)
+    assert len(local.optimized()) == 2 and len(remote.optimized()) == 2
+
+    # The decision never reads table data, only system.parts.
+    assert not [sql for sql in local.statements if "FROM maicro_monitors.trades" in sql]
+
+
+def test_merge_rows_older_than_the_key_retention(env):
+    local, remote = FakeClickHouse(), FakeClickHouse()
+    _save(env, [1])
+    _flush(env, local, remote)
+    _save(env, [2], when=datetime(2020, 1, 1))
+    _flush(env, local, remote)
+    assert len(local.optimized()) == 2
+
+
+def test_no_dedup_always_merges(env):
+    local, remote = FakeClickHouse(), FakeClickHouse()
+    env["seen_keys"] = None
+    for tids in ([1], [2]):
+        _save(env, tids)
+        _flush(env, local, remote)
+    assert len(local.optimized()) == 2
@@ -0,0 +1,19 @@
+from modules.hyperliquid_client import HyperliquidClient
+
+
+class BrokenResponseCache:
+    def ttl_for(self, payload):
+        return 60.0
+
+    def get(self, payload):
+        return None
+
+    def put(self, payload, data):
+        raise TypeError("not JSON serializable")
+
+
+def test_failed_cache_put_still_returns_the_response(monkeypatch):
+    client = HyperliquidClient("0xa", session=object(), rate_limiter=object(),
+                               response_cache=BrokenResponseCache())
+    monkeypatch.setattr(client, "_post_uncached", lambda endpoint, payload: {"ok": 1})
+    assert client._post_cached("/info", {"type": "meta"}) == {"ok": 1}
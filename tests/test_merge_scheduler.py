@@ -0,0 +1,19 @@
+from datetime import datetime, timezone
+
+from modules.merge_scheduler import is_offpeak
+
+
+def _at(hour):
+    return datetime(2024, 1, 1, hour, tzinfo=timezone.utc)
+
+
+def test_is_offpeak_plain_window():
+    assert is_offpeak(_at(2), "1-5")
+    assert not is_offpeak(_at(5), "1-5")
+    assert not is_offpeak(_at(0), "1-5")
+
+
+def test_is_offpeak_window_wrapping_midnight():
+    assert is_offpeak(_at(23), "22-4")
+    assert is_offpeak(_at(3), "22-4")
+    assert not is_offpeak(_at(12), "22-4")
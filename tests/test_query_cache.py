@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+from modules import query_cache
+from modules.query_cache import source_tables
+
+
+@pytest.mark.parametrize("sql,expected", [
+    ("SELECT * FROM db.t WHERE x = 'FROM foo'", [("db", "t")]),
+    ("SELECT * FROM `db`.`t` LEFT JOIN db.u ON 1", [("db", "t"), ("db", "u")]),
+    ("SELECT * FROM (SELECT * FROM db.t) x", [("db", "t")]),
+    ("WITH a AS (SELECT * FROM db.t) SELECT * FROM a JOIN db.u USING k", [("db", "t"), ("db", "u")]),
+    ("SELECT * FROM db.t ARRAY JOIN arr", [("db", "t")]),
+])
+def test_source_tables_versionable(sql, expected):
+    assert source_tables(sql) == expected
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 1",
+    "SELECT * FROM t",
+    "SELECT * FROM db.t JOIN other USING k",
+    "SELECT * FROM remote('host', db.t)",
+    "SELECT * FROM s3('https://bucket/x.parquet')",
+    "SELECT * FROM system.parts",
+    "SELECT dictGet('d', 'v', k) FROM db.t",
+])
+def test_source_tables_unversionable(sql):
+    assert source_tables(sql) is None
+
+
+class BrokenCache:
+    def get(self, *args):
+        return None
+
+    def put(self, *args):
+        raise OSError("disk full")
+
+
+def test_failed_put_still_returns_the_result(monkeypatch):
+    result = pd.DataFrame({"x": [1, 2]})
+    monkeypatch.setattr(query_cache, "get_query_cache", lambda: BrokenCache())
+    monkeypatch.setattr(query_cache, "table_versions", lambda tables, target: {"db.t": [1]})
+    monkeypatch.setattr(query_cache, "query_df", lambda *args, **kwargs: result)
+    assert query_cache.cached_query_df("SELECT x FROM db.t") is result
@@ -0,0 +1,71 @@
+import re
+from datetime import datetime, timezone
+
+import pytest
+
+from modules.query_log import (
+    COLUMNS,
+    REPORT_ORDER,
+    QueryLog,
+    fingerprint,
+    normalize_query,
+    top_pending_queries,
+    top_queries,
+)
+
+
+def test_normalize_query_strips_literals_and_comments():
+    sql = """
+        SELECT * FROM db.t -- latest
+        WHERE date = '2024-01-01' AND x > 1.5 AND sym IN ('BTC', 'ETH', 'SOL');
+    """
+    assert normalize_query(sql) == "SELECT * FROM db.t WHERE date = ? AND x > ? AND sym IN (?)"
+
+
+def test_normalize_query_keeps_identifiers_with_digits():
+    assert normalize_query("SELECT col1 FROM db.t2 LIMIT 10") == "SELECT col1 FROM db.t2 LIMIT ?"
+
+
+def test_fingerprint_groups_queries_differing_only_in_literals():
+    a = fingerprint("SELECT * FROM db.t WHERE d = '2024-01-01' AND s IN ('A')")
+    b = fingerprint("SELECT  *  FROM db.t WHERE d = '2024-02-01' AND s IN ('A', 'B')")
+    assert a == b
+    assert 0 <= a < 2 ** 64
+    assert fingerprint("SELECT * FROM db.u") != a
+
+
+class CapturingClient:
+    def __init__(self):
+        self.sql = None
+
+    def execute(self, sql, params=None):
+        self.sql = sql
+        return []
+
+
+@pytest.mark.parametrize("by", sorted(REPORT_ORDER))
+def test_top_queries_orders_by_an_alias_of_its_own(by):
+    client = CapturingClient()
+    top_queries(client, by=by)
+    aliases = set(re.findall(r"\bAS (\w+)", client.sql))
+    order_key = re.search(r"ORDER BY (\w+)", client.sql).group(1)
+    assert order_key == REPORT_ORDER[by]
+    assert order_key in aliases
+    # An alias named like a source column would put an aggregate inside another.
+    assert not aliases & set(COLUMNS)
+
+
+def test_top_pending_queries_ranks_spilled_records(tmp_path):
+    log = QueryLog(path=str(tmp_path / "query_log.sqlite"))
+    now = datetime.now(timezone.utc)
+
+    def row(sql, ms, bytes_read):
+        return (now, "host", "local", "query", "mod", "fn", fingerprint(sql), normalize_query(sql), ms,
+                10, bytes_read, 0, 0, 0, 0, "")
+
+    log._spill([row("SELECT 1 FROM db.a", 5.0, 100), row("SELECT 2 FROM db.a", 7.0, 100),
+                row("SELECT * FROM db.b", 1.0, 1000)])
+    by_time = top_pending_queries(log, by="time")
+    assert [r["calls"] for r in by_time] == [2, 1]
+    assert by_time[0]["total_bytes_read"] == 200 and by_time[0]["p95_ms"] == 7.0
+    assert [r["total_bytes_read"] for r in top_pending_queries(log, by="bytes")] == [1000, 200]
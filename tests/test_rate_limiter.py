@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+from modules.rate_limiter import SharedRateLimiter, request_weight, response_weight
+
+
+def test_weights():
+    assert request_weight({"type": "allMids"}) == 2
+    assert response_weight({"type": "userFills"}, [{}] * 45) == 2
+    assert response_weight({"type": "allMids"}, [{}] * 45) == 0
+
+
+def test_acquire_spends_tokens_and_charge_is_debited_on_next_write(tmp_path):
+    state_path = tmp_path / "rl.json"
+    limiter = SharedRateLimiter(weight_per_minute=60, state_path=str(state_path))
+    assert limiter.acquire(10) == 0.0
+    tokens = json.loads(state_path.read_text())["tokens"]
+    assert tokens == pytest.approx(50, abs=0.1)
+
+    limiter.charge(20)
+    assert json.loads(state_path.read_text())["tokens"] == tokens
+    limiter.acquire(1)
+    assert json.loads(state_path.read_text())["tokens"] == pytest.approx(29, abs=0.1)
+
+
+def test_acquire_gives_up_past_max_wait(tmp_path):
+    limiter = SharedRateLimiter(weight_per_minute=60, state_path=str(tmp_path / "rl.json"))
+    limiter.acquire(60)
+    with pytest.raises(TimeoutError):
+        limiter.acquire(30, max_wait=0.1)
@@ -0,0 +1,28 @@
+from scheduled_ping_hyperliquid import _fetch_pages, _fill_key
+
+
+def _pager(rows, limit):
+    calls = []
+
+    def fetch(start):
+        calls.append(start)
+        return [r for r in rows if r["time"] >= start][:limit]
+
+    return fetch, calls
+
+
+def test_fetch_pages_walks_until_a_short_page():
+    rows = [{"time": t, "tid": t} for t in range(10)]
+    fetch, calls = _pager(rows, 4)
+    out = _fetch_pages(fetch, 0, 4, _fill_key)
+    assert out == rows
+    # Each page restarts at its last timestamp; overlapping rows are dropped.
+    assert calls == [0, 3, 6, 9]
+
+
+def test_fetch_pages_steps_past_a_full_single_millisecond_page():
+    rows = [{"time": 5, "tid": i} for i in range(4)] + [{"time": 6, "tid": 10}]
+    fetch, calls = _pager(rows, 4)
+    out = _fetch_pages(fetch, 5, 4, _fill_key)
+    assert calls == [5, 6]
+    assert [r["tid"] for r in out] == [0, 1, 2, 3, 10]
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+import pyarrow as pa
+
+from modules.seen_keys import SeenKeyIndex, row_hashes
+
+
+def test_row_hashes_are_stable_signed_64_bit():
+    table = pa.table({"tid": [1, 2, 1], "address": ["0xa", "0xa", "0xa"]})
+    hashes = row_hashes(table, ("tid", "address"))
+    assert hashes[0] == hashes[2] != hashes[1]
+    assert all(-(2 ** 63) <= h < 2 ** 63 for h in hashes)
+    assert row_hashes(table, ("tid", "address")) == hashes
+
+
+def test_row_hashes_timestamps_hash_as_epoch_ms():
+    ts = pa.table({"time": pa.array([datetime(2024, 1, 1)], pa.timestamp("ms"))})
+    ns = pa.table({"time": pa.array([datetime(2024, 1, 1)], pa.timestamp("ns"))})
+    ms = pa.table({"time": [1704067200000]})
+    assert row_hashes(ts, ("time",)) == row_hashes(ns, ("time",)) == row_hashes(ms, ("time",))
+
+
+def test_record_table_keys_counts_repeats_per_target(tmp_path):
+    index = SeenKeyIndex(str(tmp_path / "seen.sqlite"))
+    assert index.record_table_keys("trades", [1, 2], "local") is None  # no history yet
+    assert index.record_table_keys("trades", [3, 4], "local") == 0
+    assert index.record_table_keys("trades", [4, 5, 5], "local") == 2
+    assert index.record_table_keys("trades", [1], "remote") is None
+    # table keys never count as natural keys
+    table = pa.table({"address": ["0xa"], "tid": [1]})
+    kept, _ = index.filter_new("trades", table, target="local")
+    assert kept.num_rows == 1
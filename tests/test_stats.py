@@ -0,0 +1,23 @@
+from modules.stats import nearest_rank_sql, percentile
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+
+
+def test_percentile_small_samples():
+    assert percentile([], 95) == 0.0
+    assert percentile([7], 95) == 7
+    assert percentile([1, 2], 50) == 1
+    assert percentile([1, 2, 3, 4, 5], 0) == 1
+    assert percentile([1, 2, 3, 4, 5], 95) == 5
+
+
+def test_nearest_rank_sql_uses_ceil_rank():
+    sql = nearest_rank_sql("duration_ms", 95)
+    assert "arraySort(groupArray(duration_ms))" in sql
+    assert "ceil(0.95 * count())" in sql
@@ -0,0 +1,40 @@
+import sync_to_remote
+
+
+class FakeRemote:
+    def __init__(self, max_ts=None):
+        self.max_ts = max_ts
+        self.inserts = []
+
+    def execute(self, query, params=None):
+        if query.startswith("EXISTS"):
+            return [(1,)]
+        if query.startswith("SELECT max"):
+            return [(self.max_ts,)]
+        self.inserts.append(list(params))
+        return None
+
+
+def _sync(monkeypatch, rows, batch_size):
+    def fake_chunks(query, chunk_rows, params=None, client=None):
+        for i in range(0, len(rows), chunk_rows):
+            yield [("time", "UInt64"), ("tid", "UInt64")], rows[i:i + chunk_rows]
+
+    monkeypatch.setattr(sync_to_remote, "iter_row_chunks", fake_chunks)
+    remote = FakeRemote()
+    sync_to_remote.sync_table(None, remote, "db", "trades", "time", batch_size=batch_size)
+    return remote.inserts
+
+
+def test_batches_end_on_timestamp_boundaries(monkeypatch):
+    rows = [(1, 1), (1, 2), (2, 3), (2, 4), (2, 5), (3, 6)]
+    inserts = _sync(monkeypatch, rows, batch_size=3)
+    assert inserts == [[(1, 1), (1, 2)], [(2, 3), (2, 4), (2, 5)], [(3, 6)]]
+
+
+def test_one_timestamp_over_the_ceiling_is_sent_unsplit(monkeypatch):
+    rows = [(7, i) for i in range(10)] + [(8, 10)]
+    inserts = _sync(monkeypatch, rows, batch_size=2)
+    assert [len(batch) for batch in inserts] == [4, 4, 2, 1]
+    assert [r for batch in inserts for r in batch] == rows
+    assert max(len(batch) for batch in inserts) <= sync_to_remote.PENDING_CEILING * 2